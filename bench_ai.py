@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI情绪分析压测工具：本地模拟 /chat/completions 接口 + 吞吐基准
+不消耗API额度，用于验证 AIEmotionAnalyzer / AI情绪CSV 生成的改动是否真的变快
+
+用法：
+    python bench_ai.py                          # 跑默认场景
+    python bench_ai.py --comments 5000 --latency 0.8 --error-rate 0.05 --rpm 300
+    python bench_ai.py --serve --port 8765      # 只启动模拟接口，API地址填 http://127.0.0.1:8765
+"""
+import argparse
+import json
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import xhs_gui_final as xhs
+
+
+# -------------------- 模拟接口 --------------------
+class MockConfig:
+    def __init__(self, latency=0.5, jitter=0.2, rpm=0, error_rate=0.0, malformed_rate=0.0,
+                 mismatch_rate=0.0, seed=0):
+        self.latency = latency  # 平均响应时间（秒）
+        self.jitter = jitter  # 响应时间随机波动（秒）
+        self.rpm = rpm  # 每分钟请求上限，超出返回 429 + Retry-After，0 不限
+        self.error_rate = error_rate  # 返回 500 的概率
+        self.malformed_rate = malformed_rate  # 返回无法解析内容的概率
+        self.mismatch_rate = mismatch_rate  # 每个标签被漏掉的概率（模拟标签数量不符）
+        self.random = random.Random(seed)
+
+
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "error_500": 0, "rate_limited_429": 0,
+                       "malformed": 0, "labels_dropped": 0, "stream": 0}
+
+    def add(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def _expected_label(text):
+    """模拟模型的“正确答案”：用内置词典打分，保证结果可复现"""
+    return xhs.label_sent(xhs.score_sent(text))
+
+
+def make_handler(config: MockConfig, stats: MockStats):
+    window = deque()
+    window_lock = threading.Lock()
+
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _rate_limited(self):
+            if not config.rpm:
+                return None
+            now = time.monotonic()
+            with window_lock:
+                while window and now - window[0] > 60:
+                    window.popleft()
+                if len(window) >= config.rpm:
+                    return max(0.1, 60 - (now - window[0]))
+                window.append(now)
+            return None
+
+        def do_POST(self):
+            stats.add("requests")
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": "not found"})
+                return
+
+            retry_after = self._rate_limited()
+            if retry_after is not None:
+                stats.add("rate_limited_429")
+                self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{retry_after:.1f}"})
+                return
+
+            time.sleep(max(0.0, config.latency + config.random.uniform(-config.jitter, config.jitter)))
+            if config.random.random() < config.error_rate:
+                stats.add("error_500")
+                self._send_json(500, {"error": "internal error"})
+                return
+
+            content = body.get("messages", [{}])[-1].get("content", "")
+            items = re.findall(r"^\[(\d+)\] (.*)$", content, re.M)
+            if config.random.random() < config.malformed_rate:
+                stats.add("malformed")
+                text = "抱歉，我无法完成这个请求。"
+            else:
+                labels = {}
+                for idx, comment in items:
+                    if config.random.random() < config.mismatch_rate:
+                        stats.add("labels_dropped")
+                        continue
+                    labels[idx] = _expected_label(comment)
+                text = json.dumps(labels, ensure_ascii=False)
+
+            stats.add("ok")
+            if body.get("stream"):
+                stats.add("stream")
+                self._send_stream(text)
+            else:
+                self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": text}}]})
+
+        def _send_stream(self, text):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                per_piece = config.latency / max(1, len(text) // 6) / 4
+                for i in range(0, len(text), 6):
+                    piece = {"choices": [{"delta": {"content": text[i:i + 6]}}]}
+                    self.wfile.write(f"data: {json.dumps(piece, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(per_piece)
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端收齐标签后提前断开
+
+    return MockLLMHandler
+
+
+def start_mock_server(config: MockConfig, port=0):
+    """在后台线程启动模拟接口，返回 (server, base_url, stats)"""
+    stats = MockStats()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+# -------------------- 基准 --------------------
+def make_corpus(n, dup_ratio=0.3, seed=0):
+    """生成带重复评论的模拟语料"""
+    rnd = random.Random(seed)
+    words = list(xhs.POS) + list(xhs.NEG) + list(xhs.NEU)
+    filler = ["真的", "这个", "颜色", "我觉得", "有点", "就是", "积木", "花", "朋友说", "收到了"]
+    common = ["好看", "求链接", "绝美", "一般", "踩雷了"]
+    corpus = []
+    for i in range(n):
+        if rnd.random() < dup_ratio:
+            corpus.append(rnd.choice(common))
+        else:
+            corpus.append("".join(rnd.choice(filler) for _ in range(rnd.randint(2, 8)))
+                          + rnd.choice(words) + f"{i}")
+    return corpus
+
+
+def _analyzer(base_url, args):
+    analyzer = xhs.AIEmotionAnalyzer({
+        "api_key": "bench", "base_url": base_url,
+        "max_concurrency": args.concurrency, "rpm_limit": args.client_rpm,
+        "stream": args.stream, "timeout": 30,
+    })
+    analyzer.cache = None  # 基准不走缓存，测的是接口吞吐
+    return analyzer
+
+
+def bench_analyzer(name, fn, corpus, stats):
+    before = stats.snapshot()
+    start = time.perf_counter()
+    labels, methods = fn(corpus)
+    elapsed = time.perf_counter() - start
+    after = stats.snapshot()
+    delta = {k: after[k] - before[k] for k in after}
+    fallback = sum(1 for m in methods if m == xhs.AIEmotionAnalyzer.FALLBACK_METHOD)
+    has_methods = any(m is not None for m in methods)
+    correct = sum(1 for c, label in zip(corpus, labels) if label == _expected_label(c))
+    retries = delta["error_500"] + delta["rate_limited_429"]
+    return {
+        "场景": name, "评论数": len(corpus), "耗时(秒)": round(elapsed, 2),
+        "条/秒": round(len(corpus) / elapsed, 1), "请求数": delta["requests"],
+        "后备率": f"{fallback / len(corpus):.1%}" if has_methods else "-", "重试开销": f"{retries / max(1, delta['requests']):.1%}",
+        "与期望一致": f"{correct / len(corpus):.1%}",
+    }
+
+
+def bench_csv(corpus, base_url, args, stats):
+    """端到端：模拟结果文件 -> write_ai_sentiment_csv（AI情绪分析按钮的核心流程）"""
+    tmp = Path(tempfile.mkdtemp())
+    posts = [{"标题": f"笔记{i}", "作者": "bench", "点赞数": i, "收藏数": 0, "评论": corpus[i * 50:(i + 1) * 50]}
+             for i in range((len(corpus) + 49) // 50)]
+    json_path = tmp / "bench_comments_0.json"
+    json_path.write_text(json.dumps(posts, ensure_ascii=False), encoding="utf8")
+
+    before = stats.snapshot()
+    start = time.perf_counter()
+    result = xhs.write_ai_sentiment_csv(json_path, tmp / "bench_sentiment_ai.csv", _analyzer(base_url, args))
+    elapsed = time.perf_counter() - start
+    after = stats.snapshot()
+    requests = after["requests"] - before["requests"]
+    retries = (after["error_500"] - before["error_500"]) + (after["rate_limited_429"] - before["rate_limited_429"])
+    return {
+        "场景": "AI情绪CSV(端到端)", "评论数": result["total"], "耗时(秒)": round(elapsed, 2),
+        "条/秒": round(result["total"] / elapsed, 1), "请求数": requests,
+        "后备率": f"{result['fallback'] / max(1, result['total']):.1%}",
+        "重试开销": f"{retries / max(1, requests):.1%}", "与期望一致": "-",
+    }
+
+
+def print_table(rows):
+    headers = list(rows[0])
+    widths = [max(len(str(h)) * 2, *(len(str(r[h])) + 2 for r in rows)) for h in headers]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for r in rows:
+        print("  ".join(str(r[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI情绪分析模拟接口与吞吐基准")
+    parser.add_argument("--comments", type=int, default=2000, help="模拟评论条数")
+    parser.add_argument("--dup-ratio", type=float, default=0.3, help="重复评论比例")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟接口平均响应时间（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="响应时间波动（秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="模拟接口每分钟请求上限，0 不限")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回无法解析内容的概率")
+    parser.add_argument("--mismatch-rate", type=float, default=0.0, help="单个标签被漏掉的概率")
+    parser.add_argument("--concurrency", type=int, default=8, help="分析器并发批次数")
+    parser.add_argument("--client-rpm", type=int, default=0, help="分析器自身限速，0 不限")
+    parser.add_argument("--stream", action="store_true", help="使用流式返回")
+    parser.add_argument("--skip-sequential", action="store_true", help="跳过顺序请求基准（较慢）")
+    parser.add_argument("--serve", action="store_true", help="只启动模拟接口，不跑基准")
+    parser.add_argument("--port", type=int, default=0, help="模拟接口端口，0 为随机")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.jitter, args.rpm, args.error_rate, args.malformed_rate,
+                        args.mismatch_rate, args.seed)
+    server, base_url, stats = start_mock_server(config, args.port)
+    print(f"模拟接口: {base_url}/chat/completions")
+    if args.serve:
+        try:
+            while True:
+                time.sleep(5)
+                print(stats.snapshot())
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    # 重试退避按模拟接口的时间尺度缩短，避免基准被退避等待主导
+    xhs.BACKOFF_BASE = min(xhs.BACKOFF_BASE, max(0.05, args.latency / 2))
+    corpus = make_corpus(args.comments, args.dup_ratio, args.seed)
+    rows = []
+    if not args.skip_sequential:
+        analyzer = _analyzer(base_url, args)
+
+        def sequential(comments):
+            labels = analyzer.analyze_comments_batch(comments)
+            # 顺序接口只返回标签，无法区分后备，后备率一栏不统计
+            return labels, [None] * len(labels)
+
+        rows.append(bench_analyzer("顺序 analyze_comments_batch", sequential, corpus, stats))
+    analyzer = _analyzer(base_url, args)
+    rows.append(bench_analyzer(f"并发 x{args.concurrency}", analyzer.analyze_comments_concurrent, corpus, stats))
+    rows.append(bench_csv(corpus, base_url, args, stats))
+    print_table(rows)
+    print("模拟接口统计:", stats.snapshot())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
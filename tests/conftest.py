@@ -0,0 +1,20 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def write_results(tmp_path):
+    """把笔记列表按采集时的格式（json.dump indent=2）写成结果文件，返回路径"""
+
+    def write(posts, name="手机_comments_20240101_000000.json"):
+        path = tmp_path / name
+        path.write_text(json.dumps(posts, ensure_ascii=False, indent=2), encoding="utf8")
+        return path
+
+    return write
+
@@ -0,0 +1,168 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import xhs_gui_final
+from xhs_gui_final import AIEmotionAnalyzer, CircuitBreaker, CircuitOpenError, RateLimiter, parse_retry_after
+
+
+def test_retry_after_seconds_and_reset_headers():
+    assert parse_retry_after({"Retry-After": "7"}) == 7.0
+    assert parse_retry_after({"retry-after": "-3"}) == 0.0
+    assert parse_retry_after({"x-ratelimit-reset-requests": "1.5s"}) == 1.5
+    assert parse_retry_after({"X-RateLimit-Reset": "4"}) == 4.0
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"Retry-After": "soon"}) is None
+
+
+def test_retry_after_http_date():
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= parse_retry_after({"Retry-After": future}) <= 30
+    past = format_datetime(datetime.now(timezone.utc) - timedelta(hours=1), usegmt=True)
+    assert parse_retry_after({"Retry-After": past}) == 0.0
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(1200)  # 每 50 毫秒一次
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert 0.18 <= time.monotonic() - start < 1.0
+
+
+def test_rate_limiter_unlimited_and_pause():
+    limiter = RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.1
+    limiter.pause(0.2)
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.2
+
+
+def test_breaker_opens_after_threshold_and_resets_on_success():
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.failures == 0
+
+
+def test_breaker_probe_closes_when_healthy():
+    probes = []
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=0.01,
+                             probe=lambda: probes.append(1) or len(probes) >= 3)
+    breaker.record_failure()
+    deadline = time.monotonic() + 5
+    while not breaker.allow() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert breaker.allow() and len(probes) == 3
+
+
+def test_breaker_half_opens_after_failed_probes():
+    breaker = CircuitBreaker(failure_threshold=2, probe_interval=0.01, max_probes=3, probe=lambda: 1 / 0)
+    breaker.record_failure()
+    breaker.record_failure()
+    deadline = time.monotonic() + 5
+    while not breaker.allow() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # 放行下一次真实请求，再失败一次立即重新熔断
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录当前线程的等待而不真正等待；熔断探测等后台线程照常等待"""
+    sleeps, real_sleep = [], time.sleep
+
+    def sleep(seconds):
+        if threading.current_thread() is threading.main_thread():
+            sleeps.append(seconds)
+        else:
+            real_sleep(seconds)
+
+    monkeypatch.setattr(xhs_gui_final.time, "sleep", sleep)
+    return sleeps
+
+
+def analyzer_with(responses, **config):
+    analyzer = AIEmotionAnalyzer({"api_key": "k", "rpm_limit": 0, "max_retries": 3, **config})
+    analyzer.session = FakeSession(responses)
+    return analyzer
+
+
+def test_retries_server_errors_with_backoff(sleeps):
+    failed = FakeResponse(503)
+    analyzer = analyzer_with([failed, xhs_gui_final.requests.exceptions.Timeout(), FakeResponse(200)])
+    assert analyzer._post_chat({}, "t").status_code == 200
+    assert analyzer.session.calls == 3
+    assert failed.closed
+    assert len(sleeps) == 2
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 2.0  # BACKOFF_BASE * 2^n 乘 0.5~1 的抖动
+    assert analyzer.breaker.failures == 0
+
+
+def test_429_waits_for_retry_after_without_tripping_breaker(sleeps):
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+    analyzer = analyzer_with([FakeResponse(429, {"Retry-After": "3"}), FakeResponse(429, {"Retry-After": future}),
+                              FakeResponse(200)], breaker_threshold=1)
+    assert analyzer._post_chat({}, "t").status_code == 200
+    # 按 Retry-After 等待，同时暂停限速器（等待被跳过，所以 acquire 还会再等一次）
+    assert sleeps[0] == 3.0 and 5 <= max(sleeps) <= 10
+    assert analyzer.breaker.allow() and analyzer.breaker.failures == 0
+
+
+def test_client_errors_are_not_retried(sleeps):
+    analyzer = analyzer_with([FakeResponse(401)])
+    with pytest.raises(RuntimeError, match="401"):
+        analyzer._post_chat({}, "t")
+    assert analyzer.session.calls == 1 and not sleeps
+
+
+def test_gives_up_after_max_retries(sleeps):
+    analyzer = analyzer_with([FakeResponse(500)] * 3, max_retries=2, breaker_threshold=10)
+    with pytest.raises(RuntimeError, match="500"):
+        analyzer._post_chat({}, "t")
+    assert analyzer.session.calls == 3 and len(sleeps) == 2
+
+
+def test_open_breaker_stops_retrying(sleeps):
+    analyzer = analyzer_with([FakeResponse(502)] * 5, breaker_threshold=2)
+    analyzer.breaker.probe = None
+    with pytest.raises(RuntimeError):
+        analyzer._post_chat({}, "t")
+    assert analyzer.session.calls == 2
+    with pytest.raises(CircuitOpenError):
+        analyzer._post_chat({}, "t")
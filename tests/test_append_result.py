@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from xhs_gui_final import RESULT_TAIL_BYTES, append_result, iter_posts
+
+
+def post(i):
+    return {"标题": f"笔记{i} 🌸", "作者": "作者", "点赞数": i, "评论": [f"评论{j}\n换行" for j in range(i % 3)],
+            "嵌套": {"列表": [], "对象": {}}}
+
+
+@pytest.mark.parametrize("count", [1, 2, 5])
+def test_layout_matches_json_dump(write_results, count):
+    path = write_results([])
+    for i in range(count):
+        append_result(path, post(i))
+    expected = json.dumps([post(i) for i in range(count)], ensure_ascii=False, indent=2)
+    assert path.read_text(encoding="utf8") == expected
+
+
+def test_appends_to_existing_results(write_results):
+    path = write_results([post(0), post(1)])
+    append_result(path, post(2))
+    assert json.loads(path.read_text(encoding="utf8")) == [post(0), post(1), post(2)]
+    assert list(iter_posts(path)) == [post(0), post(1), post(2)]
+
+
+def test_trailing_whitespace_is_replaced(write_results):
+    path = write_results([post(0)])
+    with open(path, "a", encoding="utf8") as f:
+        f.write("\n\n  ")
+    append_result(path, post(1))
+    assert path.read_text(encoding="utf8") == json.dumps([post(0), post(1)], ensure_ascii=False, indent=2)
+
+
+def test_large_post_longer_than_tail(write_results):
+    big = {"评论": ["很长的评论" * 500]}
+    path = write_results([big])
+    assert path.stat().st_size > RESULT_TAIL_BYTES
+    append_result(path, post(1))
+    assert json.loads(path.read_text(encoding="utf8")) == [big, post(1)]
+
+
+def test_incomplete_file_is_not_modified(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('[\n  {"标题": "写了一半"', encoding="utf8")
+    with pytest.raises(ValueError):
+        append_result(path, post(0))
+    assert path.read_text(encoding="utf8") == '[\n  {"标题": "写了一半"'
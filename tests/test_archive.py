@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from xhs_gui_final import (ZSTD_AVAILABLE, ResultIndex, RunCatalog, archive_hold, compress_file, iter_posts,
+                           open_result_text, plain_path, result_stem)
+
+SUFFIXES = [".gz", pytest.param(".zst", marks=pytest.mark.skipif(not ZSTD_AVAILABLE, reason="未安装 zstandard"))]
+NAME = "手机_comments_20240101_000000.json"
+
+
+def make_posts(n):
+    return [{"标题": f"笔记{i}", "作者": "作者", "点赞数": i, "评论": [f"评论{i}-{j} 好看" for j in range(3)]}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_compress_round_trip(write_results, suffix):
+    path = write_results(make_posts(40))
+    dst = compress_file(path, suffix)
+    assert dst.name == NAME + suffix and path.exists()
+    assert dst.stat().st_size < path.stat().st_size
+    with open_result_text(dst) as f:
+        assert f.read() == path.read_text(encoding="utf8")
+    assert list(iter_posts(dst, read_size=100)) == make_posts(40)
+
+
+def test_unknown_suffix_is_rejected(write_results):
+    with pytest.raises(ValueError):
+        compress_file(write_results([]), ".bz2")
+
+
+def test_names_are_stable_across_compression(tmp_path):
+    for name in (NAME, NAME + ".gz", NAME + ".zst"):
+        assert plain_path(tmp_path / name) == tmp_path / NAME
+        assert result_stem(tmp_path / name) == "手机_comments_20240101_000000"
+
+
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_index_carries_over_to_compressed_file(write_results, suffix, monkeypatch):
+    posts = make_posts(20)
+    path = write_results(posts)
+    ResultIndex.open(path).close()
+    dst = compress_file(path, suffix)
+    ResultIndex.carry_over(path, dst)
+    path.unlink()
+
+    monkeypatch.setattr(ResultIndex, "build", classmethod(lambda *a, **k: pytest.fail("压缩后不应重建索引")))
+    index = ResultIndex.open(dst)
+    assert [index.post(i) for i in (19, 0, 7)] == [posts[19], posts[0], posts[7]]
+    index.close()
+
+
+def test_catalog_archive_skips_running_and_busy_files(tmp_path, write_results):
+    done = write_results(make_posts(5))
+    running = write_results(make_posts(5), "手机_comments_20240102_000000.json")
+    busy = write_results(make_posts(5), "相机_comments_20240103_000000.json")
+    csv = tmp_path / "手机_comments_20240101_000000_sentiment_rule.csv"
+    csv.write_text("标题,评论内容\n笔记0,好看\n", encoding="utf-8-sig")
+    catalog = RunCatalog(tmp_path)
+    for path, status in ((done, "complete"), (running, "running"), (busy, "complete")):
+        catalog.update(result_stem(path), keyword="手机", file=path.name, status=status)
+
+    with archive_hold(busy):
+        assert catalog.archive(".gz") == 2
+
+    assert not done.exists() and not csv.exists()
+    assert (tmp_path / (csv.name + ".gz")).exists()
+    assert running.exists() and busy.exists()
+    files = {r["run_id"]: r["file"] for r in catalog.runs()}
+    assert files[result_stem(done)] == done.name + ".gz"
+    assert list(iter_posts(tmp_path / files[result_stem(done)])) == make_posts(5)
+    assert json.loads((tmp_path / "runs_catalog.json").read_text(encoding="utf8"))["version"] == 1
+
+
+def test_archive_keeps_index_when_source_cannot_be_deleted(tmp_path, write_results, monkeypatch):
+    path = write_results(make_posts(5))
+    ResultIndex.open(path).close()
+    catalog = RunCatalog(tmp_path)
+    catalog.update(result_stem(path), keyword="手机", file=path.name, status="complete")
+    real_unlink = type(path).unlink
+
+    def locked(self, *args, **kwargs):
+        if self == path:
+            raise PermissionError("文件正被其他程序打开")
+        return real_unlink(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(path), "unlink", locked)
+    assert catalog.archive(".gz") == 0
+    monkeypatch.undo()
+
+    assert path.exists() and not (tmp_path / (path.name + ".gz")).exists()
+    assert catalog.runs()[0]["file"] == path.name
+    monkeypatch.setattr(ResultIndex, "build", classmethod(lambda *a, **k: pytest.fail("原文件的索引不应失效")))
+    ResultIndex.open(path).close()
+
+
+def test_archive_carries_index_after_deleting_source(tmp_path, write_results, monkeypatch):
+    posts = make_posts(5)
+    path = write_results(posts)
+    ResultIndex.open(path).close()
+    catalog = RunCatalog(tmp_path)
+    catalog.update(result_stem(path), keyword="手机", file=path.name, status="complete")
+    assert catalog.archive(".gz") == 1
+    monkeypatch.setattr(ResultIndex, "build", classmethod(lambda *a, **k: pytest.fail("压缩后不应重建索引")))
+    index = ResultIndex.open(tmp_path / (path.name + ".gz"))
+    assert index.post(4) == posts[4]
+    index.close()
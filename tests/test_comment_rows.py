@@ -0,0 +1,25 @@
+from xhs_gui_final import RULE_CSV_COLUMNS, comment_frame, iter_comment_rows
+
+POSTS = [{"标题": "笔记0", "作者": "甲", "点赞数": 3, "收藏数": 1, "评论": [" 好看 ", "", "难看"]},
+         {"标题": "笔记1", "作者": "乙", "评论": ["一般"]}]
+
+
+def test_rows_share_one_note_record_per_post():
+    rows = list(iter_comment_rows(POSTS))
+    assert [(r.note.index, r.index, r.text) for r in rows] == [(0, 0, "好看"), (0, 1, ""), (0, 2, "难看"), (1, 0, "一般")]
+    assert rows[0].note is rows[2].note
+    assert not hasattr(rows[0], "__dict__")
+
+
+def test_skip_empty_reports_position():
+    skipped = []
+    rows = list(iter_comment_rows(POSTS, skip_empty=True, on_skip=lambda p, c: skipped.append((p, c))))
+    assert [r.text for r in rows] == ["好看", "难看", "一般"]
+    assert skipped == [(0, 1)]
+
+
+def test_comment_frame_columns():
+    df = comment_frame(list(iter_comment_rows(POSTS, skip_empty=True)))
+    assert list(df.columns) == RULE_CSV_COLUMNS[:5]
+    assert df.values.tolist() == [["笔记0", "甲", 3, 1, "好看"], ["笔记0", "甲", 3, 1, "难看"],
+                                  ["笔记1", "乙", 0, 0, "一般"]]
@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+
+import pytest
+
+from xhs_gui_final import AIEmotionAnalyzer
+
+
+def make_analyzer(**config):
+    base = {"api_key": "test", "rpm_limit": 0, "max_concurrency": 3, "batch_token_budget": 40}
+    base.update(config)
+    return AIEmotionAnalyzer(base)
+
+
+class FakeModel:
+    """代替 _request_labels：记录请求与并发数，按评论内容给标签"""
+
+    def __init__(self, delay=0.0, drop=()):
+        self.delay = delay
+        self.drop = set(drop)
+        self.requests = []
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, comments, tag, on_label=None):
+        with self.lock:
+            self.requests.append(list(comments))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        got = {i: ("负向" if "差" in c else "正向") for i, c in enumerate(comments) if c not in self.drop}
+        if on_label:
+            for _ in got:
+                on_label()
+        return got
+
+
+def run(analyzer, comments, stop_event=None):
+    progress = []
+    labels, methods = analyzer.analyze_comments_concurrent(
+        comments, lambda n, is_batch: progress.append(n), stop_event)
+    return labels, methods, sum(progress)
+
+
+def test_requires_api_key():
+    with pytest.raises(ValueError):
+        AIEmotionAnalyzer({"api_key": ""}).analyze_comments_concurrent(["好"])
+
+
+def test_results_keep_input_order_across_batches(monkeypatch):
+    analyzer = make_analyzer()
+    model = FakeModel()
+    monkeypatch.setattr(analyzer, "_request_labels", model)
+    comments = [f"第{i}条{'太差了' if i % 3 == 0 else '很喜欢'}" for i in range(30)]
+    labels, methods, progressed = run(analyzer, comments)
+    assert len(model.requests) > 1
+    assert labels == ["负向" if i % 3 == 0 else "正向" for i in range(30)]
+    assert methods == [AIEmotionAnalyzer.AI_METHOD] * 30
+    assert progressed == 30
+
+
+def test_duplicate_texts_requested_once(monkeypatch):
+    analyzer = make_analyzer()
+    model = FakeModel()
+    monkeypatch.setattr(analyzer, "_request_labels", model)
+    comments = ["太差了", "很喜欢", "太差了 ", "很喜欢", "太差了"]
+    labels, methods, progressed = run(analyzer, comments)
+    sent = [c for req in model.requests for c in req]
+    assert sorted(sent) == ["太差了", "很喜欢"]
+    assert labels == ["负向", "正向", "负向", "正向", "负向"]
+    assert progressed == len(comments)
+
+
+def test_in_flight_batches_bounded_by_max_concurrency(monkeypatch):
+    analyzer = make_analyzer(max_concurrency=2)
+    model = FakeModel(delay=0.05)
+    monkeypatch.setattr(analyzer, "_request_labels", model)
+    comments = [f"评论内容{i}很喜欢" for i in range(40)]
+    run(analyzer, comments)
+    assert len(model.requests) >= 4
+    assert model.peak == 2
+
+
+class ChatSession:
+    """代替 requests.Session：按提示词中的编号全部回复“中性”，记录请求时刻"""
+
+    def __init__(self):
+        self.times = []
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, **kwargs):
+        with self.lock:
+            self.times.append(time.monotonic())
+        count = int(re.search(r"以下(\d+)条", json["messages"][0]["content"]).group(1))
+        content = "{" + ", ".join(f'"{i + 1}": "中性"' for i in range(count)) + "}"
+        return ChatResponse({"choices": [{"message": {"content": content}}]})
+
+
+class ChatResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def test_rpm_limit_spaces_requests_across_workers():
+    analyzer = make_analyzer(rpm_limit=1200, max_concurrency=4)  # 每 50 毫秒一次
+    analyzer.session = ChatSession()
+    comments = [f"评论内容{i}很喜欢" for i in range(40)]
+    labels, methods, progressed = run(analyzer, comments)
+    times = sorted(analyzer.session.times)
+    assert len(times) >= 4
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.04
+    assert methods == [AIEmotionAnalyzer.AI_METHOD] * 40
+    assert labels == ["中性"] * 40 and progressed == 40
+
+
+def test_stop_event_sends_no_requests(monkeypatch):
+    analyzer = make_analyzer()
+    model = FakeModel()
+    monkeypatch.setattr(analyzer, "_request_labels", model)
+    stop = threading.Event()
+    stop.set()
+    comments = ["质量太差了", "颜色好看"] * 10
+    labels, methods, progressed = run(analyzer, comments, stop)
+    assert model.requests == []
+    assert methods == [AIEmotionAnalyzer.FALLBACK_METHOD] * len(comments)
+    assert labels == [analyzer._fallback_analyze(c) for c in comments]
+    assert progressed == len(comments)
+
+
+def test_missing_labels_repaired_then_fall_back(monkeypatch):
+    analyzer = make_analyzer(batch_token_budget=0)
+    model = FakeModel(drop={"看不懂的评论"})
+    monkeypatch.setattr(analyzer, "_request_labels", model)
+    comments = ["很喜欢", "看不懂的评论", "太差了"]
+    labels, methods, progressed = run(analyzer, comments)
+    assert len(model.requests) > 1  # 缺失项拆成子批次补请求
+    assert all(req == ["看不懂的评论"] for req in model.requests[1:])
+    assert methods == [AIEmotionAnalyzer.AI_METHOD, AIEmotionAnalyzer.FALLBACK_METHOD, AIEmotionAnalyzer.AI_METHOD]
+    assert labels[0] == "正向" and labels[2] == "负向"
+    assert progressed == len(comments)
+
+
+def test_request_errors_fall_back_per_batch(monkeypatch):
+    analyzer = make_analyzer()
+
+    def broken(comments, tag, on_label=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(analyzer, "_request_labels", broken)
+    comments = [f"评论内容{i}" for i in range(10)]
+    labels, methods, progressed = run(analyzer, comments)
+    assert methods == [AIEmotionAnalyzer.FALLBACK_METHOD] * 10
+    assert progressed == 10
+
+
+def test_cache_hits_skip_requests(monkeypatch, tmp_path):
+    analyzer = make_analyzer()
+    analyzer.set_cache(tmp_path / "labels.db")
+    model = FakeModel()
+    monkeypatch.setattr(analyzer, "_request_labels", model)
+    run(analyzer, ["很喜欢", "太差了"])
+    model.requests.clear()
+    labels, methods, progressed = run(analyzer, ["太差了", "新评论很喜欢", "很喜欢"])
+    assert model.requests == [["新评论很喜欢"]]
+    assert labels == ["负向", "正向", "正向"]
+    assert methods == [AIEmotionAnalyzer.CACHE_METHOD, AIEmotionAnalyzer.AI_METHOD, AIEmotionAnalyzer.CACHE_METHOD]
+    assert progressed == 3
+    analyzer.cache.close()
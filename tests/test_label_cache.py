@@ -0,0 +1,48 @@
+from xhs_gui_final import LabelCache
+
+
+def test_hits_are_keyed_by_normalized_text_and_model(tmp_path):
+    cache = LabelCache(tmp_path / "cache.sqlite3")
+    cache.put_many(["很好看！！", "太差了"], ["正向", "负向"], "glm-4.5-flash")
+
+    assert cache.get_many(["很好看", "太差了 😡", "一般"], "glm-4.5-flash") == {0: "正向", 1: "负向"}
+    assert cache.get_many(["很好看"], "glm-4") == {}
+    cache.close()
+
+
+def test_duplicate_texts_in_one_lookup_all_hit(tmp_path):
+    cache = LabelCache(tmp_path / "cache.sqlite3")
+    cache.put_many(["不错"], ["正向"], "m")
+    assert cache.get_many(["不错", "不错！", "别的"], "m") == {0: "正向", 1: "正向"}
+    cache.close()
+
+
+def test_prompt_version_change_invalidates_entries(tmp_path, monkeypatch):
+    cache = LabelCache(tmp_path / "cache.sqlite3")
+    cache.put_many(["不错"], ["正向"], "m")
+    monkeypatch.setattr("xhs_gui_final.AI_PROMPT_VERSION", 999)
+    assert cache.get_many(["不错"], "m") == {}
+    cache.close()
+
+
+def test_eviction_keeps_most_recently_used(tmp_path):
+    cache = LabelCache(tmp_path / "cache.sqlite3", max_entries=10)
+    cache.put_many([f"评论{i}" for i in range(10)], ["中性"] * 10, "m")
+    cache.get_many(["评论0"], "m")  # 刷新最近使用时间，淘汰时应保留
+    cache.put_many(["评论10"], ["正向"], "m")
+
+    count = cache.conn.execute("SELECT COUNT(*) FROM label_cache").fetchone()[0]
+    assert count <= 10
+    assert cache.get_many(["评论0", "评论10"], "m") == {0: "中性", 1: "正向"}
+    cache.close()
+
+
+def test_entries_persist_across_reopen(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = LabelCache(path)
+    cache.put_many(["喜欢"], ["正向"], "m")
+    cache.close()
+
+    cache = LabelCache(path)
+    assert cache.get_many(["喜欢"], "m") == {0: "正向"}
+    cache.close()
@@ -0,0 +1,123 @@
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from xhs_gui_final import (LOCAL_MODEL_METHOD, LocalSentimentModel, SentimentPipeline, split_holdout,
+                           train_local_model, write_local_sentiment_csv)
+
+POSITIVE = ["颜色好看很喜欢", "质量很好超喜欢", "好看又好用", "很喜欢这个颜色", "做工很好喜欢"]
+NEGATIVE = ["质量太差了", "很差退货了", "做工差掉漆", "太差了不推荐", "差评掉漆严重"]
+NEUTRAL = ["请问多少钱", "在哪里买的", "请问是什么型号", "多少钱在哪买", "什么时候发货"]
+
+
+def samples(repeat=4):
+    return ([(t, "正向") for t in POSITIVE] + [(t, "负向") for t in NEGATIVE]
+            + [(t, "中性") for t in NEUTRAL]) * repeat
+
+
+@pytest.fixture
+def model():
+    return LocalSentimentModel.train(samples())
+
+
+def test_features_are_char_ngrams_of_normalized_text():
+    assert LocalSentimentModel.features("好看！") == ["好", "看", "好看"]
+    assert len(LocalSentimentModel.features("abcd")) == 4 + 3 + 2
+
+
+@pytest.mark.parametrize("text, label", [
+    ("这个颜色很喜欢", "正向"),
+    ("做工太差", "负向"),
+    ("请问在哪里买", "中性"),
+])
+def test_predicts_training_polarity_on_unseen_text(model, text, label):
+    got, prob = model.predict(text)
+    assert got == label
+    assert 1 / 3 < prob <= 1.0
+
+
+def test_min_count_drops_rare_ngrams():
+    model = LocalSentimentModel.train([("好看", "正向"), ("难看", "负向")], min_count=2)
+    assert "看" in model.weights and "好" not in model.weights
+    assert model.meta["samples"] == 2 and model.meta["vocab"] == 1
+
+
+def test_empty_text_falls_back_to_prior():
+    model = LocalSentimentModel.train(samples() + [("请问", "中性")] * 10)
+    assert model.predict("")[0] == "中性"
+
+
+def test_save_load_roundtrip(model, tmp_path):
+    path = tmp_path / "model.json"
+    model.save(path)
+    assert not path.with_suffix(".tmp").exists()
+    loaded = LocalSentimentModel.load(path)
+    for text in ["颜色好看", "掉漆了", "多少钱", "完全没见过的文本"]:
+        assert loaded.predict(text) == pytest.approx(model.predict(text))
+    assert loaded.meta == model.meta
+
+
+def test_load_rejects_other_label_set(model, tmp_path):
+    path = tmp_path / "model.json"
+    model.save(path)
+    data = json.loads(path.read_text(encoding="utf8"))
+    data["labels"] = ["正向", "负向"]
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf8")
+    with pytest.raises(ValueError):
+        LocalSentimentModel.load(path)
+
+
+def test_holdout_split_is_stable_per_text():
+    data = [(f"评论{i}", "中性") for i in range(2000)]
+    train, test = split_holdout(data, 0.1)
+    assert len(train) + len(test) == 2000
+    assert 100 < len(test) < 300
+    assert split_holdout(data, 0.1) == (train, test)
+    assert not {t for t, _ in train} & {t for t, _ in test}
+
+
+def test_train_from_label_cache(tmp_path):
+    cache = tmp_path / "cache.sqlite3"
+    conn = sqlite3.connect(str(cache))
+    conn.execute("CREATE TABLE label_cache (text TEXT, label TEXT)")
+    conn.executemany("INSERT INTO label_cache VALUES (?, ?)",
+                     [(f"{t}{i}", l) for i in range(10) for t, l in samples(1)] + [("无效标签", "积极")])
+    conn.commit()
+    conn.close()
+    report = train_local_model(cache, tmp_path / "model.json")
+    assert "准确率" in report
+    assert LocalSentimentModel.load(tmp_path / "model.json").meta["samples"] > 100
+    assert (tmp_path / "model_report.txt").read_text(encoding="utf8") == report
+
+
+def test_train_from_small_cache_refuses(tmp_path):
+    cache = tmp_path / "cache.sqlite3"
+    conn = sqlite3.connect(str(cache))
+    conn.execute("CREATE TABLE label_cache (text TEXT, label TEXT)")
+    conn.executemany("INSERT INTO label_cache VALUES (?, ?)", samples(1))
+    conn.commit()
+    conn.close()
+    with pytest.raises(ValueError):
+        train_local_model(cache, tmp_path / "model.json")
+
+
+def test_write_local_csv(model, write_results, tmp_path):
+    path = write_results([{"标题": "笔记", "作者": "作者", "评论": ["颜色很喜欢", "", "做工太差"]}])
+    assert write_local_sentiment_csv(path, tmp_path / "out.csv", model) == 2
+    df = pd.read_csv(tmp_path / "out.csv", encoding="utf-8-sig")
+    assert list(df["sentiment"]) == ["正向", "负向"]
+    assert set(df["分析方法"]) == {LOCAL_MODEL_METHOD}
+
+
+def test_pipeline_uses_local_model_without_analyzer(model, tmp_path):
+    pipeline = SentimentPipeline(tmp_path / "手机_comments_20240101_000000.json", ("rule", "ai"), model=model)
+    assert pipeline.modes == ("rule", "ai")
+    assert pipeline.paths["ai"].name == "手机_comments_20240101_000000_sentiment_local.csv"
+    pipeline.submit({"标题": "笔记", "作者": "作者", "评论": ["颜色很喜欢", "做工太差", ""]})
+    stats = pipeline.close()
+    assert stats["model"] == 2 and stats["ai"] == 0 and stats["rule"] == 3
+    df = pd.read_csv(pipeline.paths["ai"], encoding="utf-8-sig")
+    assert list(df["sentiment"]) == ["正向", "负向"]
+    assert set(df["分析方法"]) == {LOCAL_MODEL_METHOD}
@@ -0,0 +1,149 @@
+import random
+
+import numpy as np
+import pytest
+
+from xhs_gui_final import AIEmotionAnalyzer, CommentRow, NearDuplicateIndex, minhash_signature, write_ai_sentiment_csv
+
+ORIGINAL = "这款手机的拍照效果真的非常好，强烈推荐大家购买"
+REWORDED = "这款手机的拍照效果真的非常好，强烈推荐大家入手"  # 签名一致率约 0.85
+UNRELATED = "物流太慢了等了一个星期才到货"
+CHARS = "的一是不了人我在有他这为之大来以个中上们到说国和地也子时道出而要于就下得可你年生自会那后能对着事"
+
+
+def bigram_jaccard(a, b):
+    x, y = ({s[i:i + 2] for i in range(len(s) - 1)} for s in (a, b))
+    return len(x & y) / len(x | y)
+
+
+def mutate(text, rnd, n):
+    chars = list(text)
+    for _ in range(n):
+        chars[rnd.randrange(len(chars))] = rnd.choice(CHARS)
+    return "".join(chars)
+
+
+def test_signature_agreement_tracks_jaccard():
+    rnd = random.Random(7)
+    errors, low = [], []
+    for _ in range(300):
+        a = "".join(rnd.choice(CHARS) for _ in range(30))
+        b = mutate(a, rnd, rnd.randint(0, 20))
+        jaccard = bigram_jaccard(a, b)
+        agreement = (minhash_signature(a) == minhash_signature(b)).mean()
+        errors.append(abs(agreement - jaccard))
+        if jaccard < 0.2:
+            low.append(agreement)
+    # 40 行签名的估计标准差不超过 0.08
+    assert np.mean(errors) < 0.08
+    assert low and max(low) < 0.45
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = NearDuplicateIndex(tmp_path / "dedup.sqlite3")
+    yield index
+    index.close()
+
+
+def test_normalized_exact_duplicates_share_a_cluster(index):
+    index.ingest(["好看！！", "好看", "好看 😀"])
+    (cluster, size), = set(index.lookup(["好看", "好看！", "好看😀"]))
+    assert cluster is not None and size == 3
+
+
+def test_reworded_comment_joins_cluster(index):
+    index.ingest([ORIGINAL, REWORDED, UNRELATED])
+    (c1, n1), (c2, n2), (c3, n3) = index.lookup([ORIGINAL, REWORDED, UNRELATED])
+    assert c1 == c2 and n1 == n2 == 2
+    assert c3 != c1 and n3 == 1
+
+
+def test_threshold_above_similarity_keeps_clusters_apart(tmp_path):
+    index = NearDuplicateIndex(tmp_path / "dedup.sqlite3", threshold=0.9)
+    index.ingest([ORIGINAL, REWORDED])
+    (c1, _), (c2, _) = index.lookup([ORIGINAL, REWORDED])
+    assert c1 != c2
+    index.close()
+
+
+def test_similarity_does_not_chain_through_members(index):
+    rnd = random.Random(3)
+    chain = ["".join(rnd.choice(CHARS) for _ in range(30))]
+    for _ in range(30):
+        chain.append(mutate(chain[-1], rnd, 2))
+    assert bigram_jaccard(chain[0], chain[-1]) < 0.3
+    index.ingest(chain)
+    found = index.lookup(chain)
+    assert found[0][0] != found[-1][0]
+    assert max(size for _, size in found) < len(chain) // 2
+
+
+def test_distinct_comments_are_not_flagged_as_spam(index):
+    rnd = random.Random(5)
+    texts = ["".join(rnd.choice(CHARS) for _ in range(rnd.randint(8, 30))) for _ in range(3000)]
+    index.ingest(texts)
+    assert index.spam_clusters() == []
+    assert max(size for _, size in index.lookup(texts)) <= 2
+
+
+def test_short_comments_only_match_exactly(index):
+    index.ingest(["好看啊", "好看呀"])
+    (c1, n1), (c2, n2) = index.lookup(["好看啊", "好看呀"])
+    assert c1 != c2 and n1 == n2 == 1
+
+
+def test_unknown_and_empty_comments(index):
+    index.ingest([ORIGINAL, "", "   "])
+    assert index.lookup(["没见过的评论", ""]) == [(None, 0), (None, 0)]
+
+
+def test_spam_clusters_and_annotate(tmp_path):
+    index = NearDuplicateIndex(tmp_path / "dedup.sqlite3", spam_size=3)
+    index.ingest(["点我主页领福利"] * 3 + [UNRELATED])
+    rows = index.annotate([CommentRow(None, 0, "点我主页领福利！"), CommentRow(None, 1, UNRELATED)])
+    assert [(r.cluster_size, r.spam) for r in rows] == [(3, True), (1, False)]
+    assert [(size, sample) for _, size, sample in index.spam_clusters()] == [(3, "点我主页领福利")]
+    index.close()
+
+
+def test_ingest_file_once_per_run(index, write_results):
+    path = write_results([{"评论": [ORIGINAL, REWORDED]}, {"评论": [UNRELATED]}])
+    assert index.ingest_file(path) is True
+    assert index.ingest_file(path) is False
+    assert index.lookup([ORIGINAL])[0][1] == 2
+
+
+def test_outdated_index_is_reset(tmp_path):
+    path = tmp_path / "dedup.sqlite3"
+    index = NearDuplicateIndex(path)
+    index.ingest([ORIGINAL])
+    index.finish_run("手机_comments_20240101_000000")
+    index.conn.execute("PRAGMA user_version = 1")
+    index.close()
+
+    index = NearDuplicateIndex(path)
+    assert index.lookup([ORIGINAL]) == [(None, 0)]
+    assert not index.has_run("手机_comments_20240101_000000")
+    index.close()
+
+
+class StubAnalyzer:
+    FALLBACK_METHOD = AIEmotionAnalyzer.FALLBACK_METHOD
+
+    def __init__(self):
+        self.seen = []
+
+    def analyze_comments_concurrent(self, comments, on_progress=None, stop_event=None):
+        self.seen.extend(comments)
+        return ["中性"] * len(comments), [AIEmotionAnalyzer.AI_METHOD] * len(comments)
+
+
+def test_spam_rows_skip_ai_and_have_their_own_stats_bucket(tmp_path, write_results):
+    index = NearDuplicateIndex(tmp_path / "dedup.sqlite3", spam_size=3)
+    path = write_results([{"评论": ["点我主页领福利"] * 3 + [ORIGINAL, UNRELATED]}])
+    analyzer = StubAnalyzer()
+    stats = write_ai_sentiment_csv(path, tmp_path / "out.csv", analyzer, dedup=index)
+    assert stats == {"total": 5, "ai": 2, "cached": 0, "local": 0, "spam": 3, "fallback": 0}
+    assert analyzer.seen == [ORIGINAL, UNRELATED]
+    index.close()
@@ -0,0 +1,41 @@
+from xhs_gui_final import MAX_BATCH_ITEMS, estimate_tokens, pack_batches, prepare_comment
+
+
+def test_ranges_cover_all_items_in_order():
+    costs = [30, 50, 20, 70, 10, 40]
+    ranges = pack_batches(costs, 100)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(costs)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def test_batches_stay_within_budget():
+    costs = [30, 50, 20, 70, 10, 40]
+    ranges = pack_batches(costs, 100)
+    assert ranges == [(0, 3), (3, 5), (5, 6)]
+    assert all(sum(costs[a:b]) <= 100 for a, b in ranges)
+
+
+def test_oversized_item_gets_its_own_batch():
+    assert pack_batches([10, 500, 10], 100) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_item_count_is_capped():
+    ranges = pack_batches([1] * (MAX_BATCH_ITEMS * 2 + 1), 10_000)
+    assert [b - a for a, b in ranges] == [MAX_BATCH_ITEMS, MAX_BATCH_ITEMS, 1]
+    assert pack_batches([1] * 10, 10_000, max_items=4) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_empty_input():
+    assert pack_batches([], 100) == []
+
+
+def test_estimate_tokens_counts_cjk_per_char():
+    assert estimate_tokens("好看") == 2
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("好看abcd") == 3
+
+
+def test_prepare_comment_trims_and_truncates():
+    assert prepare_comment("好看！！！  😀", 0) == "好看"
+    assert prepare_comment("😀😀", 0) == "😀😀"
+    assert prepare_comment("好" * 10, 4) == "好好好好…"
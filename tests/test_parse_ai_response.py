@@ -0,0 +1,53 @@
+import pytest
+
+from xhs_gui_final import AIEmotionAnalyzer
+
+
+@pytest.fixture(scope="module")
+def parse():
+    return AIEmotionAnalyzer()._parse_ai_response
+
+
+def test_json_object(parse):
+    assert parse('{"1": "正向", "2": "负向", "3": "中性"}', 3) == {0: "正向", 1: "负向", 2: "中性"}
+
+
+def test_json_in_code_fence_with_synonyms(parse):
+    text = '```json\n{"1": "积极", "2": "negative"}\n```'
+    assert parse(text, 2) == {0: "正向", 1: "负向"}
+
+
+def test_json_list_of_items(parse):
+    text = '[{"id": 2, "label": "负向"}, {"编号": "1", "标签": "正面"}]'
+    assert parse(text, 2) == {0: "正向", 1: "负向"}
+
+
+def test_plain_json_list_only_when_count_matches(parse):
+    assert parse('["正向", "中性"]', 2) == {0: "正向", 1: "中性"}
+    assert parse('["正向", "中性"]', 3) == {}
+
+
+def test_out_of_range_and_unknown_labels_are_dropped(parse):
+    assert parse('{"0": "正向", "2": "开心", "3": "负向", "9": "中性"}', 3) == {2: "负向"}
+
+
+def test_truncated_json_falls_back_to_pairs(parse):
+    text = '{"1": "正向", "2": "负向", "3": "中'
+    assert parse(text, 3) == {0: "正向", 1: "负向"}
+
+
+def test_numbered_lines(parse):
+    assert parse("1：正向\n2: 消极\n3: 中立", 3) == {0: "正向", 1: "负向", 2: "中性"}
+
+
+def test_legacy_slash_sequence(parse):
+    assert parse("正向/负向/中性", 3) == {0: "正向", 1: "负向", 2: "中性"}
+    assert parse("正向/负向", 3) == {}
+
+
+def test_first_label_for_an_id_wins(parse):
+    assert parse("1: 正向\n1: 负向", 1) == {0: "正向"}
+
+
+def test_garbage(parse):
+    assert parse("抱歉，我无法完成这个任务。", 2) == {}
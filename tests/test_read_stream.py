@@ -0,0 +1,101 @@
+import json
+
+import requests
+
+from xhs_gui_final import AIEmotionAnalyzer
+
+
+class FakeStream:
+    def __init__(self, lines):
+        self.lines = lines
+        self.consumed = 0
+        self.closed = False
+
+    def iter_lines(self):
+        for line in self.lines:
+            self.consumed += 1
+            if isinstance(line, Exception):
+                raise line
+            yield line.encode("utf-8")
+
+    def close(self):
+        self.closed = True
+
+
+def sse(*deltas):
+    return ["data: " + json.dumps({"choices": [{"delta": {"content": d}}]}, ensure_ascii=False)
+            for d in deltas]
+
+
+def read(lines, expected):
+    response = FakeStream(lines)
+    seen = []
+    text, labels = AIEmotionAnalyzer()._read_stream(response, expected, lambda: seen.append(1))
+    return response, text, labels, len(seen)
+
+
+def test_labels_split_across_deltas():
+    response, text, labels, calls = read(sse("1: 正", "向\n", "2", ": 负", "向\n3:", " 中性") + ["data: [DONE]"], 3)
+    assert labels == {0: "正向", 1: "负向", 2: "中性"}
+    assert calls == 3
+    assert text == "1: 正向\n2: 负向\n3: 中性"
+    assert response.closed
+
+
+def test_multi_digit_index_split_across_deltas():
+    lines = sse(*[f"{i}: 中性\n" for i in range(1, 10)], "1", "0: 负向")
+    _, _, labels, _ = read(lines, 10)
+    assert labels[9] == "负向"
+    assert labels[0] == "中性"
+
+
+def test_stops_reading_once_all_labels_arrive():
+    response, _, labels, _ = read(sse("1: 正向 2: 负向", "多余的解释") + ["data: [DONE]"], 2)
+    assert labels == {0: "正向", 1: "负向"}
+    assert response.consumed == 1 and response.closed
+
+
+def test_done_ends_stream_with_partial_labels():
+    response, text, labels, _ = read(sse("1: 正向") + ["data: [DONE]"] + sse("2: 负向"), 2)
+    assert labels == {0: "正向"}
+    assert text == "1: 正向"
+    assert response.consumed == 2
+
+
+def test_keepalives_and_malformed_events_are_skipped():
+    lines = ([": keep-alive", "", "event: ping", "data: not json", 'data: {"choices": []}',
+              'data: {"choices": [{"delta": null}]}']
+             + sse("1: 积极") + ["data: {}"] + sse("/2: 消极"))
+    _, text, labels, _ = read(lines, 2)
+    assert labels == {0: "正向", 1: "负向"}
+    assert text == "1: 积极/2: 消极"
+
+
+def test_truncated_stream_returns_what_arrived_and_closes():
+    lines = sse("1: 正向\n2: 负") + [requests.exceptions.ChunkedEncodingError("connection reset")]
+    response = FakeStream(lines)
+    try:
+        AIEmotionAnalyzer()._read_stream(response, 2)
+    except requests.exceptions.ChunkedEncodingError:
+        pass
+    else:
+        raise AssertionError("中断的流应当抛出异常交给重试逻辑")
+    assert response.closed
+
+    # 流正常结束但没有 [DONE]：返回已收到的部分
+    response, text, labels, _ = read(sse("1: 正向\n2: 负"), 2)
+    assert labels == {0: "正向"}
+    assert text == "1: 正向\n2: 负"
+    assert response.closed
+
+
+def test_out_of_range_and_repeated_indices_ignored():
+    _, _, labels, calls = read(sse("0: 正向 5: 负向 1: 中性 1: 负向") + ["data: [DONE]"], 2)
+    assert labels == {0: "中性"}
+    assert calls == 1
+
+
+def test_long_label_free_output_does_not_lose_later_labels():
+    _, text, labels, _ = read(sse(*["好" * 50] * 200, "1: 负向"), 1)
+    assert labels == {0: "负向"}
+    assert len(text) == 50 * 200 + len("1: 负向")
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from xhs_gui_final import ResultIndex, iter_posts
+
+
+def make_posts(n):
+    return [{"标题": f"笔记{i} 🌸", "作者": f"作者{i % 3}", "点赞数": (i * 37) % 11, "收藏数": i,
+             "评论": [f"第{i}条的评论{j}，好看" if j % 2 else f"comment {j} 难看" for j in range(i % 4)]}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("read_size", [7, 64, 1 << 16])
+def test_iter_posts_matches_json_load(write_results, read_size):
+    posts = make_posts(30)
+    path = write_results(posts)
+    assert list(iter_posts(path, read_size=read_size)) == posts
+
+
+@pytest.mark.parametrize("read_size", [7, 64, 1 << 16])
+def test_spans_are_byte_ranges_of_each_post(write_results, read_size):
+    posts = make_posts(30)
+    path = write_results(posts)
+    raw = path.read_bytes()
+    spans = list(iter_posts(path, read_size=read_size, with_spans=True))
+    assert [post for _, _, post in spans] == posts
+    for offset, length, post in spans:
+        assert json.loads(raw[offset:offset + length].decode("utf8")) == post
+
+
+def test_empty_array_and_invalid_file(tmp_path, write_results):
+    assert list(iter_posts(write_results([]))) == []
+    bad = tmp_path / "bad.json"
+    bad.write_text('{"a": 1}', encoding="utf8")
+    with pytest.raises(ValueError):
+        list(iter_posts(bad))
+
+
+def test_index_reads_posts_by_offset(write_results):
+    posts = make_posts(50)
+    index = ResultIndex.build(write_results(posts))
+    assert len(index) == 50
+    assert index.comment_count == sum(len(p["评论"]) for p in posts)
+    for i in (0, 17, 49, 17):
+        assert index.post(i) == posts[i]
+        assert index.author(i) == posts[i]["作者"]
+    index.close()
+
+
+def test_locate_maps_global_comment_to_post(write_results):
+    posts = make_posts(20)
+    index = ResultIndex.build(write_results(posts))
+    g = 0
+    for p, post in enumerate(posts):
+        for c in range(len(post["评论"])):
+            assert index.locate(g) == (p, c)
+            g += 1
+
+
+def test_select_posts_filters_and_sorts(write_results):
+    posts = make_posts(20)
+    index = ResultIndex.build(write_results(posts))
+    ids = index.select_posts(min_likes=5, sort="点赞数↓")
+    assert ids == sorted((i for i, p in enumerate(posts) if p["点赞数"] >= 5),
+                         key=lambda i: -posts[i]["点赞数"])
+    assert index.select_posts(author="作者1") == [i for i, p in enumerate(posts) if p["作者"] == "作者1"]
+    negative = index.select_posts(sentiment="负向")
+    assert negative and all(len(posts[i]["评论"]) for i in negative)
+    assert all(index.sentiment(g) == "负向" for g in index.select_comments(negative, "负向"))
+
+
+def test_open_saves_and_reuses_index(write_results, monkeypatch):
+    path = write_results(make_posts(10))
+    index = ResultIndex.open(path)
+    assert ResultIndex.index_path(path).exists()
+    monkeypatch.setattr(ResultIndex, "build", classmethod(lambda *a, **k: pytest.fail("索引未过期时不应重建")))
+    reopened = ResultIndex.open(path)
+    assert list(reopened.offsets) == list(index.offsets)
+    assert reopened.post(9) == index.post(9)
+
+
+def test_open_rebuilds_after_file_changes(write_results):
+    path = write_results(make_posts(10))
+    ResultIndex.open(path)
+    write_results(make_posts(12))
+    assert len(ResultIndex.open(path)) == 12
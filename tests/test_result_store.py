@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from xhs_gui_final import AIEmotionAnalyzer, ResultStore, comment_bigrams, write_ai_sentiment_csv
+
+RUN = "手机_comments_20240101_000000"
+POSTS = [
+    {"标题": "手机壳", "作者": "甲", "采集时间": "2024-01-01 10:00:00",
+     "评论": ["用了两天就掉件了", "颜色好看", "Nice case"]},
+    {"标题": "支架", "作者": "乙", "采集时间": "2024-01-02 10:00:00",
+     "评论": ["件数不对", "质量太差了，掉漆", "好"]},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def imported(store, write_results):
+    path = write_results(POSTS, RUN + ".json")
+    assert store.import_result_file(path) == 2
+    return store
+
+
+def texts(rows):
+    return sorted(r[4] for r in rows)
+
+
+def test_comment_bigrams():
+    assert comment_bigrams("掉件了！ab") == "掉件 件了 了 ab b"
+    assert comment_bigrams("好") == "好"
+    assert comment_bigrams("！！") == ""
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("掉件", ["用了两天就掉件了"]),
+    ("件", ["件数不对", "用了两天就掉件了"]),
+    ("了", ["用了两天就掉件了", "质量太差了，掉漆"]),
+    ("掉", ["用了两天就掉件了", "质量太差了，掉漆"]),
+    ("好", ["好", "颜色好看"]),
+    ("ni", ["Nice case"]),
+    ("两天就", ["用了两天就掉件了"]),
+    ("掉 差了", ["质量太差了，掉漆"]),
+    ("差了，", ["质量太差了，掉漆"]),
+    ("件不", []),
+])
+def test_search_short_and_long_terms(imported, query, expected):
+    assert texts(imported.search(query)) == expected
+
+
+def test_short_terms_use_the_bigram_index(imported):
+    statements = []
+    imported.conn.set_trace_callback(statements.append)
+    imported.search("掉件 好")
+    imported.conn.set_trace_callback(None)
+    sql = "\n".join(statements)
+    assert "comments_bigram MATCH" in sql and "LIKE" not in sql
+
+
+def test_bigram_index_is_backfilled_for_old_databases(tmp_path, write_results):
+    path = tmp_path / "results.sqlite3"
+    store = ResultStore(path)
+    store.import_result_file(write_results(POSTS, RUN + ".json"))
+    store.conn.execute("DROP TABLE comments_bigram")
+    store.close()
+
+    store = ResultStore(path)
+    assert texts(store.search("掉件")) == ["用了两天就掉件了"]
+    store.close()
+
+
+def test_search_filters(imported):
+    assert texts(imported.search("", sentiment="负向")) == ["用了两天就掉件了"]
+    assert texts(imported.search("", sentiment="正向")) == ["颜色好看"]
+    assert len(imported.search("", keyword="手机")) == 6
+    assert imported.search("", keyword="相机") == []
+    assert texts(imported.search("", since="2024-01-02")) == ["件数不对", "好", "质量太差了，掉漆"]
+
+
+def test_import_is_skipped_when_complete(imported, write_results, monkeypatch):
+    monkeypatch.setattr("xhs_gui_final.rule_score", lambda *a: pytest.fail("已导入的笔记不应重新打分"))
+    assert imported.import_result_file(write_results(POSTS, RUN + ".json")) == 0
+
+
+def test_interrupted_import_resumes_without_rescoring(store, write_results, monkeypatch):
+    path = write_results(POSTS, RUN + ".json")
+    stop = threading.Event()
+    stop.set()
+    assert store.import_result_file(path, stop_event=stop) == 0
+    store.add_note(RUN, "手机", 0, POSTS[0])
+
+    scored = []
+    monkeypatch.setattr("xhs_gui_final.rule_score", lambda text, lexicon=None: scored.append(text) or 0)
+    assert store.import_result_file(path) == 1
+    assert scored == POSTS[1]["评论"]
+    assert store.has_run(RUN)
+
+
+def test_ai_labels_take_precedence(imported):
+    note_id = imported.add_note(RUN, "手机", 0, POSTS[0])
+    imported.add_ai_labels([(note_id, 1, "负向", "AI分析(GLMs)")])
+    assert imported.search("颜色好看")[0][5:] == ("负向", "AI分析(GLMs)")
+
+
+class StubAnalyzer:
+    FALLBACK_METHOD = AIEmotionAnalyzer.FALLBACK_METHOD
+
+    def analyze_comments_concurrent(self, comments, on_progress=None, stop_event=None):
+        return ["中性"] * len(comments), [AIEmotionAnalyzer.AI_METHOD] * len(comments)
+
+
+def test_ai_csv_writes_labels_into_the_store(imported, tmp_path):
+    stats = write_ai_sentiment_csv(tmp_path / (RUN + ".json"), tmp_path / "out.csv", StubAnalyzer(),
+                                   store=imported)
+    assert stats["ai"] == 6
+    rows = imported.search("")
+    assert {(r[5], r[6]) for r in rows} == {("中性", AIEmotionAnalyzer.AI_METHOD)}
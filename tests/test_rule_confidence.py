@@ -0,0 +1,66 @@
+import pytest
+
+from xhs_gui_final import HYBRID_CONFIDENCE, Lexicon, rule_confidence
+
+
+@pytest.mark.parametrize("text, label, confidence", [
+    ("好看", "正向", 0.5),
+    ("惊艳", "正向", 0.5),
+    ("好看精致", "正向", 0.75),
+    ("好看精致惊艳", "正向", 0.875),
+    ("难看", "负向", 0.5),
+])
+def test_single_polarity_confidence_grows_with_hit_count(text, label, confidence):
+    got_label, got = rule_confidence(text)
+    assert got_label == label
+    assert got == pytest.approx(confidence)
+
+
+def test_confidence_ignores_weights():
+    heavy = Lexicon("heavy", {"好看": 9}, {}, [])
+    light = Lexicon("light", {"好看": 1}, {}, [])
+    assert rule_confidence("好看", heavy) == rule_confidence("好看", light) == ("正向", 0.5)
+
+
+def test_score_decides_mixed_label_counts_decide_confidence():
+    lexicon = Lexicon("mixed", {"好看": 1, "精致": 1}, {"难看": 5}, [])
+    label, confidence = rule_confidence("好看精致但难看", lexicon)
+    assert label == "负向"
+    assert confidence == pytest.approx(0.5 * 1 / 3)
+    assert rule_confidence("好看但是难看") == ("中性", 0.0)
+
+
+def test_negation_halves_confidence():
+    label, confidence = rule_confidence("不好看")
+    assert label == "正向"
+    assert confidence == pytest.approx(rule_confidence("好看")[1] / 2)
+    assert confidence < HYBRID_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", ["无割手", "不值", "七天无理由拒"])
+def test_negation_inside_lexicon_word_is_not_a_cue(text):
+    assert rule_confidence(text)[1] == pytest.approx(0.5)
+
+
+def test_negation_outside_lexicon_word_still_counts():
+    assert rule_confidence("并非无割手")[1] == pytest.approx(0.25)
+    assert rule_confidence("不值不值")[1] == pytest.approx(0.5)
+
+
+def test_neutral_words():
+    assert rule_confidence("一般") == ("中性", 0.5)
+    assert rule_confidence("一般好看") == ("中性", 0.0)
+
+
+def test_no_hits_is_ambiguous():
+    assert rule_confidence("今天下雨") == ("中性", 0.0)
+
+
+def test_case_insensitive():
+    assert rule_confidence("INS风")[0] == rule_confidence("ins风")[0] == "正向"
+
+
+def test_nested_entry_counts_only_when_it_also_stands_alone():
+    assert rule_confidence("无割手") == ("正向", 0.5)
+    label, confidence = rule_confidence("有点割手 换了新款无割手")
+    assert confidence < HYBRID_CONFIDENCE
@@ -0,0 +1,149 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+import xhs_runs
+from xhs_gui_final import RUNS_CATALOG_FILE, RunCatalog, RunStats, pid_alive
+
+NAME = "手机_comments_20240101_000000.json"
+
+
+@pytest.fixture(autouse=True)
+def clear_active():
+    RunCatalog._active.clear()
+    yield
+    RunCatalog._active.clear()
+
+
+def start_run(folder, run_id="手机_comments_20240101_000000", pid=None, host=None, started_at=None, active=False,
+              **fields):
+    """写入一个“采集中”条目；active=False 模拟由其他进程写入（本进程没有在采集它）"""
+    (folder / (run_id + ".json")).write_text("[]", encoding="utf8")
+    RunCatalog(folder).update(run_id, keyword=run_id.split("_")[0], file=run_id + ".json",
+                              started_at=started_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                              status="running", pid=os.getpid() if pid is None else pid,
+                              host=platform.node() if host is None else host, **fields)
+    if not active:
+        RunCatalog._active.discard(run_id)
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def status(folder):
+    return {r["run_id"]: r["status"] for r in RunCatalog(folder).runs()}
+
+
+def test_update_adds_then_merges_entries(tmp_path):
+    start_run(tmp_path, active=True)
+    RunCatalog(tmp_path).update("手机_comments_20240101_000000", status="complete", totals={"notes": 3})
+    [entry] = RunCatalog(tmp_path).runs()
+    assert entry["status"] == "complete" and entry["totals"] == {"notes": 3} and entry["keyword"] == "手机"
+    data = json.loads((tmp_path / RUNS_CATALOG_FILE).read_text(encoding="utf8"))
+    assert data["version"] == 1 and len(data["runs"]) == 1
+
+
+def test_runs_sorted_newest_first_and_skip_missing_files(tmp_path):
+    start_run(tmp_path, "手机_comments_20240101_000000", started_at="2024-01-01 00:00:00")
+    start_run(tmp_path, "耳机_comments_20240301_000000", started_at="2024-03-01 00:00:00")
+    start_run(tmp_path, "平板_comments_20240201_000000", started_at="2024-02-01 00:00:00")
+    (tmp_path / "平板_comments_20240201_000000.json").unlink()
+    runs = RunCatalog(tmp_path).runs()
+    assert [r["keyword"] for r in runs] == ["耳机", "手机"]
+    assert RunCatalog(tmp_path).latest()["keyword"] == "耳机"
+    assert RunCatalog(tmp_path).latest("手机")["keyword"] == "手机"
+    assert RunCatalog(tmp_path).latest("平板") is None
+
+
+def test_scan_builds_catalog_for_old_results(write_results, tmp_path):
+    path = write_results([{"标题": "a", "评论": ["好看", "好看"]}])
+    stats = RunStats(path)
+    stats.add_note({"标题": "a", "评论": ["好看", "好看"]})
+    stats.save()
+    [entry] = RunCatalog(tmp_path).runs()
+    assert entry["run_id"] == path.stem and entry["status"] == "complete"
+    assert entry["started_at"] == "2024-01-01 00:00:00"
+    assert entry["totals"]["comments"] == 2
+    assert (tmp_path / RUNS_CATALOG_FILE).exists()
+
+
+def test_run_active_in_this_process_stays_running(tmp_path):
+    start_run(tmp_path, active=True, started_at="2024-01-01 00:00:00", host="其他电脑")
+    assert status(tmp_path) == {"手机_comments_20240101_000000": "running"}
+    RunCatalog(tmp_path).update("手机_comments_20240101_000000", status="complete")
+    assert not RunCatalog._active
+
+
+def test_run_of_this_pid_not_active_is_failed(tmp_path):
+    start_run(tmp_path)  # 同一进程号但本进程没有在采集（上次崩溃后 pid 被复用）
+    assert status(tmp_path) == {"手机_comments_20240101_000000": "failed"}
+
+
+def test_dead_process_marked_failed_with_last_saved_stats(tmp_path):
+    start_run(tmp_path, pid=dead_pid(), totals={"notes": 0})
+    stats = RunStats(tmp_path / NAME)
+    stats.add_note({"标题": "a", "评论": ["好看", "难看"]})
+    stats.updated_at = "2024-01-01 00:05:00"
+    stats.save()
+    [entry] = RunCatalog(tmp_path).runs()
+    assert entry["status"] == "failed"
+    assert entry["totals"]["notes"] == 1 and entry["finished_at"] == "2024-01-01 00:05:00"
+    # 写回目录文件，下次读取不再重复处理
+    data = json.loads((tmp_path / RUNS_CATALOG_FILE).read_text(encoding="utf8"))
+    assert data["runs"][0]["status"] == "failed"
+    assert "[异常退出]" in RunCatalog.describe(entry)
+
+
+def test_other_host_and_legacy_entries_use_age(tmp_path):
+    old = (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d %H:%M:%S")
+    start_run(tmp_path, "手机_comments_20240101_000000", host="其他电脑", pid=1)
+    start_run(tmp_path, "耳机_comments_20240101_000000", host="其他电脑", pid=1, started_at=old)
+    RunCatalog(tmp_path).update("平板_comments_20240101_000000", file="平板_comments_20240101_000000.json",
+                                started_at=old, status="running")  # 旧版本写入的条目没有 pid/host
+    RunCatalog._active.discard("平板_comments_20240101_000000")
+    (tmp_path / "平板_comments_20240101_000000.json").write_text("[]", encoding="utf8")
+    assert status(tmp_path) == {"手机_comments_20240101_000000": "running",
+                                "耳机_comments_20240101_000000": "failed",
+                                "平板_comments_20240101_000000": "failed"}
+
+
+def test_finished_runs_are_not_touched(tmp_path):
+    start_run(tmp_path, pid=dead_pid())
+    RunCatalog(tmp_path).update("手机_comments_20240101_000000", status="interrupted")
+    assert status(tmp_path) == {"手机_comments_20240101_000000": "interrupted"}
+
+
+def test_pid_alive():
+    assert pid_alive(os.getpid())
+    assert not pid_alive(dead_pid())
+
+
+def test_cli_lists_and_filters(tmp_path, capsys):
+    start_run(tmp_path, "手机_comments_20240101_000000", active=True, totals={"notes": 5, "comments": 40})
+    start_run(tmp_path, "耳机_comments_20240102_000000", pid=dead_pid())
+    assert xhs_runs.main([str(tmp_path)]) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].split()[:3] == ["批次", "关键词", "状态"]
+    assert len(out) == 3
+    assert any("手机" in line and "采集中" in line and "40" in line for line in out)
+    assert any("耳机" in line and "异常退出" in line for line in out)
+
+    assert xhs_runs.main([str(tmp_path), "--status", "failed", "--json"]) == 0
+    runs = json.loads(capsys.readouterr().out)
+    assert [r["keyword"] for r in runs] == ["耳机"]
+
+    assert xhs_runs.main([str(tmp_path), "--keyword", "平板"]) == 0
+    assert capsys.readouterr().out.strip() == "没有符合条件的批次"
+
+
+def test_cli_missing_folder(tmp_path, capsys):
+    assert xhs_runs.main([str(tmp_path / "不存在")]) == 2
+    assert "目录不存在" in capsys.readouterr().err
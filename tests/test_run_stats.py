@@ -0,0 +1,94 @@
+import json
+
+import xhs_gui_final
+from xhs_gui_final import BloomFilter, RunCatalog, RunStats
+
+
+def test_bloom_filter_reports_membership():
+    bloom = BloomFilter(bits=1 << 16)
+    assert bloom.add("好看") is False
+    assert bloom.add("好看") is True
+    assert bloom.add("好看 ") is False
+
+
+def test_bloom_filter_false_positive_rate_is_low():
+    bloom = BloomFilter(bits=1 << 16, hashes=5)
+    for i in range(2000):
+        bloom.add(f"评论{i}")
+    false_positives = sum(bloom.add(f"新评论{i}") for i in range(2000))
+    assert false_positives < 20
+
+
+def note(comments, likes=1, collects=2, reported=None):
+    return {"评论": comments, "点赞数": likes, "收藏数": collects,
+            "评论数": len(comments) if reported is None else reported}
+
+
+def test_add_note_counts(tmp_path):
+    stats = RunStats(tmp_path / "手机_comments_20240101_000000.json")
+    stats.add_note(note(["好看", "", "好看", "难看"], likes=5, reported=10))
+    stats.add_note(note(["好看", "  "], likes=None, collects=3))
+    assert stats.counts == {"notes": 2, "comments": 6, "empty_comments": 2, "duplicate_comments": 2,
+                            "likes": 5, "collects": 5, "reported_comments": 12, "max_note_comments": 4}
+
+
+def test_save_load_round_trip(tmp_path):
+    path = tmp_path / "手机_comments_20240101_000000.json"
+    stats = RunStats(path)
+    stats.add_note(note(["a", "b"]))
+    stats.save()
+
+    sidecar = tmp_path / "手机_comments_20240101_000000.stats.json"
+    assert json.loads(sidecar.read_text(encoding="utf8"))["comments"] == 2
+    loaded = RunStats.load(path)
+    assert loaded.counts == stats.counts
+    assert loaded.started_at == stats.started_at
+
+
+def test_sidecar_name_is_stable_after_compression(tmp_path):
+    plain = tmp_path / "手机_comments_20240101_000000.json"
+    assert RunStats.stats_path(plain.with_name(plain.name + ".zst")) == RunStats.stats_path(plain)
+
+
+def test_load_missing_or_corrupt_returns_none(tmp_path):
+    path = tmp_path / "手机_comments_20240101_000000.json"
+    assert RunStats.load(path) is None
+    RunStats.stats_path(path).write_text("{", encoding="utf8")
+    assert RunStats.load(path) is None
+
+
+def test_rebuild_matches_incremental(write_results):
+    posts = [note([f"评论{i}", "重复", ""], likes=i) for i in range(5)]
+    path = write_results(posts)
+    incremental = RunStats(path)
+    for post in posts:
+        incremental.add_note(post)
+
+    rebuilt = RunStats.rebuild(path)
+    assert rebuilt.counts == incremental.counts
+    assert RunStats.load(path).counts == incremental.counts
+    assert "帖子总数: 5" in rebuilt.report()
+
+
+def test_bloom_filter_allocated_only_when_comments_are_added(tmp_path, monkeypatch):
+    created = []
+
+    class CountingBloom(BloomFilter):
+        def __init__(self, *args, **kwargs):
+            created.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(xhs_gui_final, "BloomFilter", CountingBloom)
+    for i in range(20):
+        path = tmp_path / f"手机_comments_20240101_0000{i:02d}.json"
+        path.write_text("[]", encoding="utf8")
+        RunStats(path).save()
+    assert len(RunCatalog(tmp_path).runs()) == 20
+    assert RunStats.load(path).counts["notes"] == 0
+    assert created == []
+
+    stats = RunStats(path)
+    stats.add_note(note(["", " "]))
+    assert created == []
+    stats.add_note(note(["好看", "好看"]))
+    assert len(created) == 1 and stats.counts["duplicate_comments"] == 1
@@ -0,0 +1,63 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from xhs_gui_final import PIPELINE_QUEUE_SIZE, PipelineError, SentimentPipeline
+
+
+def note(i):
+    return {"标题": f"笔记{i}", "作者": "作者", "点赞数": i, "收藏数": 0, "评论": [f"好看{i}", "难看", ""]}
+
+
+def test_rule_mode_writes_every_submitted_note(tmp_path):
+    pipeline = SentimentPipeline(tmp_path / "手机_comments_20240101_000000.json", ("rule",), chunk_size=5)
+    for i in range(20):
+        pipeline.submit(note(i))
+    stats = pipeline.close()
+
+    assert stats["notes"] == 20 and stats["rule"] == 60
+    df = pd.read_csv(pipeline.paths["rule"], encoding="utf-8-sig", keep_default_na=False)
+    assert len(df) == 60
+    assert list(df["sentiment"][:2]) == ["正向", "负向"]
+
+
+def test_ai_mode_is_dropped_without_analyzer(tmp_path):
+    pipeline = SentimentPipeline(tmp_path / "手机_comments_20240101_000000.json", ("rule", "ai"))
+    assert pipeline.modes == ("rule",)
+    pipeline.close()
+
+
+def test_setup_failure_does_not_block_the_scraper(tmp_path):
+    missing_dir = tmp_path / "不存在的目录" / "手机_comments_20240101_000000.json"
+    pipeline = SentimentPipeline(missing_dir, ("rule",))
+    submitted, raised = [], []
+
+    def scrape():
+        try:
+            for i in range(PIPELINE_QUEUE_SIZE * 3):
+                pipeline.submit(note(i))
+                submitted.append(i)
+        except PipelineError as e:
+            raised.append(e)
+
+    thread = threading.Thread(target=scrape, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "submit 在后台线程出错后被阻塞"
+    assert raised and isinstance(raised[0].__cause__, OSError)
+    with pytest.raises(PipelineError):
+        pipeline.close(timeout=10)
+    assert not pipeline._thread.is_alive()
+
+
+class BrokenDedup:
+    def finish_run(self, run_id):
+        raise OSError("磁盘已满")
+
+
+def test_failure_after_close_is_reported(tmp_path, monkeypatch):
+    pipeline = SentimentPipeline(tmp_path / "手机_comments_20240101_000000.json", ("rule",))
+    monkeypatch.setattr(pipeline, "dedup", BrokenDedup())  # 没有提交笔记，只在收尾时用到
+    with pytest.raises(PipelineError, match="磁盘已满"):
+        pipeline.close(timeout=10)
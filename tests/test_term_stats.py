@@ -0,0 +1,118 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import xhs_gui_final
+from xhs_gui_final import TermStats, tokenize_comments
+
+TODAY = datetime.now().strftime("%Y-%m-%d")
+LONG_AGO = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
+
+
+def note(comments, day=TODAY):
+    return {"标题": "笔记", "采集时间": f"{day} 12:00:00", "评论": comments}
+
+
+@pytest.fixture
+def terms(tmp_path):
+    stats = TermStats(tmp_path / "terms.sqlite3")
+    yield stats
+    stats.close()
+
+
+def counts(rows):
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def test_tokenize_dedupes_and_drops_stopwords():
+    [words] = tokenize_comments(["屏幕清晰屏幕清晰，真的觉得续航不错 123"])
+    assert words == ["屏幕", "清晰", "续航", "不错"]
+
+
+def test_counts_per_comment_split_by_sentiment(terms):
+    terms.add_notes("手机_comments_20240101_000000", "手机", [
+        note(["颜色好看，做工精致，颜色好看", "颜色难看", "", "   "]),
+        note(["手机颜色一般"]),
+    ])
+    terms.flush()
+    top = counts(terms.top_terms("手机"))
+    assert top["颜色"] == (3, 1, 1, 1)
+    assert top["好看"] == (1, 1, 0, 0)
+    assert "手机" not in top  # 关键词本身不计入
+    assert terms.comment_counts("手机") == {"正向": 1, "负向": 1, "中性": 1}
+    assert terms.keywords() == ["手机"]
+    assert terms.counted_notes("手机_comments_20240101_000000") == 2
+
+
+def test_top_terms_order_by_sentiment(terms):
+    terms.add_notes("r", "手机", [note(["颜色难看", "颜色难看", "做工好看", "做工好看", "做工好看", "做工粗糙"])])
+    terms.flush()
+    assert terms.top_terms("手机")[0][0] == "做工"
+    assert terms.top_terms("手机", "负向")[:2] == [("难看", 2, 0, 2, 0), ("颜色", 2, 0, 2, 0)]
+    assert [r[0] for r in terms.top_terms("手机", "中性")[:2]] == ["做工", "粗糙"]  # 中性数相同时按总数
+    assert len(terms.top_terms("手机", limit=1)) == 1
+
+
+def test_cooccurring_and_trend_respect_days(terms):
+    terms.add_notes("r", "手机", [note(["屏幕清晰续航不错"]), note(["屏幕清晰"], day=LONG_AGO)])
+    terms.flush()
+    assert dict(terms.cooccurring("手机", "屏幕")) == {"清晰": 2, "续航": 1, "不错": 1}
+    assert dict(terms.cooccurring("手机", "屏幕", days=7)) == {"清晰": 1, "续航": 1, "不错": 1}
+    assert terms.trend("手机", "屏幕") == [(LONG_AGO, 1), (TODAY, 1)]
+    assert terms.trend("手机", "屏幕", days=30) == [(TODAY, 1)]
+    assert counts(terms.top_terms("手机", days=7))["屏幕"][0] == 1
+
+
+def test_pairs_limited_to_first_terms(terms, monkeypatch):
+    monkeypatch.setattr(xhs_gui_final, "TERM_PAIR_MAX_TERMS", 2)
+    terms.add_notes("r", "手机", [note(["屏幕清晰续航不错"])])
+    terms.flush()
+    assert dict(terms.cooccurring("手机", "屏幕")) == {"清晰": 1}
+    assert terms.cooccurring("手机", "续航") == []
+
+
+def test_results_merge_in_submission_order(terms, monkeypatch):
+    monkeypatch.setattr(xhs_gui_final, "TERM_MAX_PENDING", 1)
+    for i in range(10):
+        terms.add_note("r", "手机", note([f"屏幕清晰{'续航' * (i % 2)}"]))
+    terms.flush()
+    assert terms.counted_notes("r") == 10
+    assert counts(terms.top_terms("手机"))["屏幕"][0] == 10
+    assert counts(terms.top_terms("手机"))["续航"][0] == 5
+
+
+def test_import_resumes_and_stops(terms, write_results, monkeypatch):
+    monkeypatch.setattr(xhs_gui_final, "TERM_IMPORT_NOTES", 5)
+    path = write_results([note([f"屏幕清晰{i}"]) for i in range(20)])
+    stop = threading.Event()
+    original = terms.add_notes
+
+    def add_then_stop(*args, **kwargs):
+        original(*args, **kwargs)
+        stop.set()
+
+    monkeypatch.setattr(terms, "add_notes", add_then_stop)
+    assert terms.import_result_file(path, stop_event=stop) == 5
+    monkeypatch.setattr(terms, "add_notes", original)
+    assert terms.counted_notes(path.stem) == 5
+
+    assert terms.import_result_file(path) == 15
+    assert terms.import_result_file(path) == 0
+    assert counts(terms.top_terms("手机"))["屏幕"][0] == 20
+
+
+def test_close_flushes_pending_and_reopen_keeps_data(tmp_path):
+    stats = TermStats(tmp_path / "terms.sqlite3")
+    stats.add_notes("r", "手机", [note(["屏幕清晰"])])
+    stats.close()
+    reopened = TermStats(tmp_path / "terms.sqlite3")
+    try:
+        assert counts(reopened.top_terms("手机"))["屏幕"][0] == 1
+        assert reopened.counted_notes("r") == 1
+    finally:
+        reopened.close()
+
+
+def test_close_without_pool(tmp_path):
+    TermStats(tmp_path / "terms.sqlite3").close()
@@ -10,6 +10,8 @@ from tkinter import ttk, scrolledtext, messagebox, filedialog, PhotoImage
 from pathlib import Path
 import re
 import getpass
+import platform
+import ctypes
 import uuid
 import sys
 import os
@@ -17,20 +19,63 @@ import time
 from pathlib import Path
 import threading
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import hashlib
+import marshal
+import mmap
+import itertools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import sqlite3
+import math
+import queue
+import collections
+from logging.handlers import RotatingFileHandler
+import array
+import bisect
+import multiprocessing
+import gzip
+import io
+import shutil
+import tempfile
+import traceback
 from PIL import Image, ImageTk
 
 # -------------------- 情绪分析工具函数 --------------------
 import pandas as pd
 import jieba
 import requests
+import requests.adapters
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
 
 # 默认的API配置 - 适配智谱AI
 DEFAULT_API_CONFIG = {
     "api_key": "",
     "base_url": "https://open.bigmodel.cn/api/paas/v4",
     "model": "glm-4.5-flash",
-    "prompt": "请分析以下小红书评论的情感倾向，每条评论用斜杠/分隔。请为每条评论标注情感标签：正向、负向或中性。请严格按照这个格式回复：标签1/标签2/标签3...（不要有其他内容）"
+    "prompt": "请分析以下小红书评论的情感倾向，每条评论用斜杠/分隔。请为每条评论标注情感标签：正向、负向或中性。请严格按照这个格式回复：标签1/标签2/标签3...（不要有其他内容）",
+    "max_concurrency": 4,
+    "rpm_limit": 60,
+    "timeout": 60,
+    "max_retries": 3,
+    "breaker_threshold": 5,
+    "breaker_probe_interval": 15,
 }
 
 POS = {
@@ -73,203 +118,952 @@ NEU = {"还行", "一般", "凑合", "过得去", "中规中矩", "正常", "普
        "不好不坏", "就那样", "没啥感觉", "无功无过", "凑合用", "能看"}
 
 
+# -------------------- 外部词典（编译缓存 + 热加载） --------------------
+LEXICON_DIR_NAME = "lexicons"  # 保存路径下的词典目录：{关键词}.json/.txt，default.json/.txt 兜底
+LEXICON_FORMAT_VERSION = 1  # 编译格式版本，变更后旧缓存自动失效
+LEXICON_CHECK_INTERVAL = 1.0  # 词典文件变更检查间隔（秒）
+
+
+class Lexicon:
+    """一套情绪词典，按首字建索引，词条上千时打分仍然很快"""
+    __slots__ = ("name", "pos", "neg", "neu", "digest", "_pos_idx", "_neg_idx", "_neu_idx")
+
+    def __init__(self, name, pos, neg, neu, digest=""):
+        self.name = name
+        self.pos = dict(pos)
+        self.neg = dict(neg)
+        self.neu = frozenset(neu)
+        self.digest = digest
+        self._pos_idx = self._index(self.pos.items())
+        self._neg_idx = self._index(self.neg.items())
+        self._neu_idx = self._index((w, 0) for w in self.neu)
+
+    @staticmethod
+    def _index(items):
+        idx = {}
+        for w, v in items:
+            if w:
+                idx.setdefault(w[0], []).append((w, v))
+        return idx
+
+    def hits(self, txt: str):
+        """返回 (正向权重和, 负向权重和, 是否命中中性词)"""
+        chars = set(txt)
+        pos = neg = 0
+        for ch in chars:
+            for w, v in self._pos_idx.get(ch, ()):
+                if w in txt: pos += v
+            for w, v in self._neg_idx.get(ch, ()):
+                if w in txt: neg += v
+        neu = any(w in txt for ch in chars for w, _ in self._neu_idx.get(ch, ()))
+        return pos, neg, neu
+
+    def matches(self, txt: str):
+        """返回 (命中的正向词列表, 命中的负向词列表, 是否命中中性词)，每个词条只计一次"""
+        chars = set(txt)
+        pos = [(w, v) for ch in chars for w, v in self._pos_idx.get(ch, ()) if w in txt]
+        neg = [(w, v) for ch in chars for w, v in self._neg_idx.get(ch, ()) if w in txt]
+        neu = any(w in txt for ch in chars for w, _ in self._neu_idx.get(ch, ()))
+        return pos, neg, neu
+
+    def score(self, txt: str) -> int:
+        pos, neg, neu = self.hits(txt)
+        return 0 if neu else pos - neg
+
+
+BUILTIN_LEXICON = Lexicon("内置(积木花)", POS, NEG, NEU)
+
+
+def _parse_lexicon_source(raw: bytes, suffix: str):
+    """
+    解析词典源文件，支持两种格式：
+    .json: {"pos": {"词": 权重}, "neg": {"词": 权重}, "neu": ["词", ...]}
+    .txt : [pos]/[neg]/[neu] 分段，每行“词 权重”，中性词只写词，# 开头为注释
+    """
+    text = raw.decode("utf-8-sig")
+    if suffix == ".json":
+        data = json.loads(text)
+        return ({str(w): int(v) for w, v in data.get("pos", {}).items()},
+                {str(w): int(v) for w, v in data.get("neg", {}).items()},
+                [str(w) for w in data.get("neu", [])])
+
+    pos, neg, neu = {}, {}, []
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1].strip().lower()
+            continue
+        parts = line.split()
+        if section == "neu":
+            neu.append(parts[0])
+        elif section in ("pos", "neg"):
+            weight = int(parts[1]) if len(parts) > 1 else 1
+            (pos if section == "pos" else neg)[parts[0]] = weight
+    return pos, neg, neu
+
+
+class LexiconStore:
+    """
+    外部词典加载器
+    1. 源文件按内容哈希编译为 marshal 二进制，缓存在 lexicons/.cache 下，mmap 读取
+    2. 按文件 mtime/size 检测变更，运行中修改词典无需重启
+    3. 按关键词选词典，已加载的词典直接返回，不重复解析
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else None
+        self._loaded = {}  # 源文件 -> (mtime_ns, size, Lexicon)
+        self._resolved = {}  # 关键词 -> (检查时间, 源文件或None)
+        self._lock = threading.Lock()
+
+    def set_root(self, root):
+        root = Path(root) if root else None
+        with self._lock:
+            if root != self.root:
+                self.root = root
+                self._loaded.clear()
+                self._resolved.clear()
+
+    def _find_source(self, keyword):
+        if not self.root or not self.root.is_dir():
+            return None
+        for name in ([keyword] if keyword else []) + ["default"]:
+            for suffix in (".json", ".txt"):
+                path = self.root / f"{name}{suffix}"
+                if path.is_file():
+                    return path
+        return None
+
+    def get(self, keyword=None) -> Lexicon:
+        """返回关键词对应的词典，找不到外部词典时使用内置词典"""
+        now = time.monotonic()
+        with self._lock:
+            checked = self._resolved.get(keyword)
+            if checked and now - checked[0] < LEXICON_CHECK_INTERVAL:
+                src = checked[1]
+                if src is None:
+                    return BUILTIN_LEXICON
+                entry = self._loaded.get(src)
+                if entry:
+                    return entry[2]
+            src = self._find_source(keyword)
+            self._resolved[keyword] = (now, src)
+            if src is None:
+                return BUILTIN_LEXICON
+            try:
+                st = src.stat()
+                entry = self._loaded.get(src)
+                if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                    return entry[2]
+                lexicon = self._compile(src)
+                self._loaded[src] = (st.st_mtime_ns, st.st_size, lexicon)
+                logging.info(f"情绪词典已加载: {src.name} (正向{len(lexicon.pos)} 负向{len(lexicon.neg)} "
+                             f"中性{len(lexicon.neu)})")
+                return lexicon
+            except Exception as e:
+                logging.warning(f"情绪词典 {src.name} 加载失败，使用内置词典: {e}")
+                return BUILTIN_LEXICON
+
+    def _compile(self, src: Path) -> Lexicon:
+        raw = src.read_bytes()
+        digest = hashlib.sha1(raw + f"|{LEXICON_FORMAT_VERSION}|{src.suffix}".encode()).hexdigest()
+        cache_dir = src.parent / ".cache"
+        cache_file = cache_dir / f"{digest}.lexc"
+
+        if cache_file.exists():
+            try:
+                with cache_file.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    version, pos, neg, neu = marshal.loads(mm)
+                if version == LEXICON_FORMAT_VERSION:
+                    return Lexicon(src.stem, pos, neg, neu, digest)
+            except Exception:
+                pass  # 缓存损坏时重新编译
+
+        pos, neg, neu = _parse_lexicon_source(raw, src.suffix.lower())
+        try:
+            cache_dir.mkdir(exist_ok=True)
+            tmp = cache_file.with_suffix(".tmp")
+            tmp.write_bytes(marshal.dumps((LEXICON_FORMAT_VERSION, pos, neg, tuple(neu))))
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            logging.warning(f"情绪词典缓存写入失败: {e}")
+        return Lexicon(src.stem, pos, neg, neu, digest)
+
+
+LEXICONS = LexiconStore()
+
+
+def keyword_from_result(path) -> str:
+    """从 {关键词}_comments_{时间}.json 中取出关键词"""
+    return Path(path).name.split("_comments_")[0]
+
+
 def clean(txt: str) -> str:
     txt = re.sub(r"[\U00010000-\U0010ffff]", "", str(txt))
     txt = re.sub(r"[～~！!？?。，；;：:\s]+", " ", txt)
     return txt.strip()
 
 
-def score_sent(txt: str) -> int:
-    txt = txt.lower()
-    s = 0
-    for w, v in POS.items():
-        if w in txt: s += v
-    for w, v in NEG.items():
-        if w in txt: s -= v
-    if any(w in txt for w in NEU): s = 0
-    return s
+def score_sent(txt: str, lexicon: Lexicon = None) -> int:
+    return (lexicon or BUILTIN_LEXICON).score(txt.lower())
 
 
 def label_sent(sc: int) -> str:
     return "正向" if sc > 0 else ("负向" if sc < 0 else "中性")
 
 
+NEGATION_CUES = ("不", "没", "别", "非", "无", "未")  # 否定词会让子串匹配反转，降低置信度
+HYBRID_CONFIDENCE = 0.7  # 混合模式下规则置信度达到该值才本地标注
+
+
+def _find_all(txt: str, sub: str):
+    start = txt.find(sub)
+    while start != -1:
+        yield start
+        start = txt.find(sub, start + 1)
+
+
+def _covered(txt: str, words) -> set:
+    """words 在 txt 中所有出现位置覆盖的下标"""
+    return {i for w in words for start in _find_all(txt, w) for i in range(start, start + len(w))}
+
+
+def _outermost(txt: str, hits):
+    """去掉只出现在更长命中词条内部的词条，如“无割手”里的“割手”、“不值”里的“值”"""
+    kept = []
+    for w, v in hits:
+        longer = [x for x, _ in hits if len(x) > len(w) and w in x]
+        covered = _covered(txt, longer)
+        if not longer or any(i not in covered for i in _covered(txt, [w])):
+            kept.append((w, v))
+    return kept
+
+
+def _free_negation(txt: str, words) -> bool:
+    """txt 中是否有落在命中词条之外的否定词；“不值”“无割手”这类词条自带的否定字不算"""
+    covered = _covered(txt, words)
+    return any(i not in covered for cue in NEGATION_CUES for i in _find_all(txt, cue))
+
+
+def rule_confidence(txt: str, lexicon: Lexicon = None):
+    """
+    规则打分的置信度 (标签, 0~1)
+    标签取规则分数的符号；置信度按命中词条数计算，只命中单一极性时命中越多越可信，
+    只出现在更长词条内部的短词条不计，词条之外出现否定词时置信度减半；
+    正负同时命中、中性词与情绪词同时出现、没有任何命中都视为模糊
+    """
+    txt = txt.lower()
+    pos, neg, neu = (lexicon or BUILTIN_LEXICON).matches(txt)
+    if neu:
+        return "中性", (0.0 if pos or neg else 0.5)
+    outer = set(_outermost(txt, pos + neg))
+    pos = [h for h in pos if h in outer]
+    neg = [h for h in neg if h in outer]
+    score = sum(v for _, v in pos) - sum(v for _, v in neg)
+    if pos and neg:
+        return label_sent(score), 0.5 * abs(len(pos) - len(neg)) / (len(pos) + len(neg))
+    count = len(pos) + len(neg)
+    if not count:
+        return "中性", 0.0
+    confidence = 1 - 0.5 ** count
+    if _free_negation(txt, [w for w, _ in pos or neg]):
+        confidence *= 0.5
+    return label_sent(score), confidence
+
+
+# -------------------- AI标签缓存 --------------------
+AI_PROMPT_VERSION = 2  # 修改分析提示词时递增，旧缓存自动失效
+LABEL_CACHE_FILE = "ai_label_cache.sqlite3"
+LABEL_CACHE_MAX_ENTRIES = 200_000
+
+
+def normalize_comment(txt: str) -> str:
+    """缓存/去重使用的归一化文本：去表情、标点和多余空白，统一小写；纯表情评论保留原文"""
+    return clean(txt).lower() or str(txt).strip()
+
+
+def dedupe_texts(texts, indices=None):
+    """
+    按归一化文本去重
+    返回 (去重后的原文列表, 每个下标对应的去重后位置)；indices 为 None 时处理全部 texts
+    """
+    slot_of = {}
+    unique, slots = [], []
+    for i in (range(len(texts)) if indices is None else indices):
+        key = normalize_comment(texts[i])
+        slot = slot_of.get(key)
+        if slot is None:
+            slot = slot_of[key] = len(unique)
+            unique.append(texts[i])
+        slots.append(slot)
+    return unique, slots
+
+
+class LabelCache:
+    """
+    AI情绪标签持久缓存（SQLite）
+    键 = 归一化评论 + 模型 + 提示词版本 的哈希；超过 max_entries 时按最近使用时间淘汰
+    """
+
+    def __init__(self, path, max_entries=LABEL_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS label_cache (
+                                 key TEXT PRIMARY KEY, text TEXT, label TEXT, model TEXT, last_used REAL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_label_cache_used ON label_cache(last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(text, model):
+        raw = f"{model}\x1f{AI_PROMPT_VERSION}\x1f{normalize_comment(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts, model):
+        """返回 {下标: 标签}，命中的条目刷新最近使用时间"""
+        keys = [self.make_key(t, model) for t in texts]
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, label FROM label_cache WHERE key IN ({','.join('?' * len(part))})", part)
+                found.update(rows.fetchall())
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE label_cache SET last_used=? WHERE key=?",
+                                      [(now, k) for k in found])
+                self.conn.commit()
+        return {i: found[k] for i, k in enumerate(keys) if k in found}
+
+    def put_many(self, texts, labels, model):
+        now = time.time()
+        rows = [(self.make_key(t, model), normalize_comment(t), label, model, now)
+                for t, label in zip(texts, labels)]
+        if not rows:
+            return
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO label_cache VALUES (?, ?, ?, ?, ?)", rows)
+            count = self.conn.execute("SELECT COUNT(*) FROM label_cache").fetchone()[0]
+            if count > self.max_entries:
+                # 一次多删 10%，避免每次写入都触发淘汰
+                excess = count - int(self.max_entries * 0.9)
+                self.conn.execute("""DELETE FROM label_cache WHERE key IN (
+                                         SELECT key FROM label_cache ORDER BY last_used LIMIT ?)""", (excess,))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# -------------------- 按token预算动态分批 --------------------
+MODEL_INPUT_BUDGETS = {  # 模型名前缀 -> 每次请求评论部分的token预算
+    "glm-4.5": 6000,
+    "glm-4": 4000,
+    "glm-3": 2000,
+}
+DEFAULT_INPUT_BUDGET = 2000
+PROMPT_OVERHEAD_TOKENS = 200  # 提示词固定部分
+ITEM_OVERHEAD_TOKENS = 4  # 每条评论的编号和换行
+TOKENS_PER_LABEL = 8  # 每个输出标签（JSON 的编号、引号和分隔符）
+MAX_OUTPUT_TOKENS = 4096
+MAX_BATCH_ITEMS = 80  # 单批条数上限，过多时模型容易漏标
+MAX_COMMENT_CHARS = 200  # 单条评论送AI前的截断长度
+
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按1个，其余字符按4个一token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def prepare_comment(text: str, max_chars: int = MAX_COMMENT_CHARS) -> str:
+    """送AI前精简评论：clean() 去表情和多余空白/标点，超长截断；纯表情评论保留原文"""
+    text = clean(text) or str(text).strip()
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars] + "…"
+    return text
+
+
+def input_budget_for(model: str) -> int:
+    model = (model or "").lower()
+    for prefix, budget in sorted(MODEL_INPUT_BUDGETS.items(), key=lambda kv: -len(kv[0])):
+        if model.startswith(prefix):
+            return budget
+    return DEFAULT_INPUT_BUDGET
+
+
+def pack_batches(costs, token_budget, max_items=MAX_BATCH_ITEMS):
+    """按token预算贪心装箱，返回 [(起始下标, 结束下标), ...]；单条超预算时独占一批"""
+    max_items = max(1, min(max_items, (MAX_OUTPUT_TOKENS - 64) // TOKENS_PER_LABEL))
+    ranges, start, used = [], 0, 0
+    for i, cost in enumerate(costs):
+        if i > start and (used + cost > token_budget or i - start >= max_items):
+            ranges.append((start, i))
+            start, used = i, 0
+        used += cost
+    if start < len(costs):
+        ranges.append((start, len(costs)))
+    return ranges
+
+
 # -------------------- AI情绪分析类 --------------------
+MAX_REPAIR_DEPTH = 2  # 缺失标签补请求的最大拆分层数
+LABEL_SYNONYMS = {
+    "正向": {"正向", "积极", "正面", "好评", "positive"},
+    "负向": {"负向", "消极", "负面", "差评", "negative"},
+    "中性": {"中性", "中立", "一般", "neutral"},
+}
+_LABEL_PAIR_RE = re.compile(r'"?(\d+)"?\s*[:：]\s*"?(正向|负向|中性|积极|消极|正面|负面|中立)')
+_LABEL_WORD_RE = re.compile(r"正向|负向|中性|积极|消极|正面|负面|中立")
+STREAM_PENDING_CHARS = 64  # 流式解析时保留的未匹配尾部长度，足够容纳一个被截断的“编号: 标签”
+
+class RateLimiter:
+    """按每分钟请求数均匀放行（rpm<=0 不限速），线程安全，在发请求的线程里阻塞等待"""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """服务端要求限流（429/Retry-After）时，所有线程一起暂停"""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    AI接口熔断器：连续失败达到阈值后打开，打开期间请求直接失败走规则匹配；
+    后台线程定期发探测请求，探测成功后关闭，探测多次仍失败则放行下一次真实请求再判断
+    """
+
+    def __init__(self, failure_threshold=5, probe_interval=15.0, max_probes=20, probe=None):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probes = max_probes
+        self.probe = probe
+        self.failures = 0
+        self.is_open = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        return not self.is_open
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.is_open = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.is_open or self.failures < self.failure_threshold:
+                return
+            self.is_open = True
+        logging.warning(f"AI分析器: ⛔ 接口连续失败 {self.failures} 次，已熔断，剩余评论使用规则匹配")
+        if self.probe:
+            threading.Thread(target=self._probe_loop, daemon=True).start()
+
+    def _probe_loop(self):
+        for _ in range(self.max_probes):
+            time.sleep(self.probe_interval)
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                logging.info("AI分析器: ✅ 接口探测恢复，熔断已关闭")
+                self.record_success()
+                return
+        with self._lock:
+            self.failures = self.failure_threshold - 1
+            self.is_open = False
+
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+def parse_retry_after(headers):
+    """解析 Retry-After（秒数或HTTP日期）及常见的限流重置头，返回等待秒数或 None"""
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get("x-ratelimit-reset-requests") or headers.get("X-RateLimit-Reset")
+    if reset:
+        m = re.match(r"^([\d.]+)s?$", reset.strip())
+        if m:
+            return float(m.group(1))
+    return None
+
+
 class AIEmotionAnalyzer:
+    AI_METHOD = "AI分析(GLMs)"
+    CACHE_METHOD = "AI分析(缓存)"
+    FALLBACK_METHOD = "规则匹配(后备)"
+
     def __init__(self, api_config=None):
         # 使用硬编码的默认配置，避免打包时配置丢失
         self.api_config = {
             "api_key": "",
             "base_url": "https://open.bigmodel.cn/api/paas/v4",
             "model": "glm-4.5-flash",
-            "prompt": "请分析以下小红书评论的情感倾向，每条评论用斜杠/分隔。请为每条评论标注情感标签：正向、负向或中性。请严格按照这个格式回复：标签1/标签2/标签3...（不要有其他内容）"
+            "prompt": "请分析以下小红书评论的情感倾向，每条评论用斜杠/分隔。请为每条评论标注情感标签：正向、负向或中性。请严格按照这个格式回复：标签1/标签2/标签3...（不要有其他内容）",
+            "max_concurrency": 4,  # 同时在途的批次数
+            "rpm_limit": 60,  # 每分钟最多请求数，0 表示不限
+            "batch_token_budget": 0,  # 每批评论的token预算，0 表示按模型自动选择
+            "max_comment_chars": MAX_COMMENT_CHARS,  # 单条评论截断长度，0 表示不截断
+            "timeout": 60,  # 单次请求超时（秒）
+            "max_retries": 3,  # 429/5xx/超时的最大重试次数
+            "breaker_threshold": 5,  # 连续失败多少次后熔断
+            "breaker_probe_interval": 15,  # 熔断后探测恢复的间隔（秒）
+            "stream": False,  # 使用流式返回，边接收边解析标签
         }
         if api_config:
             self.api_config.update(api_config)
         self.session = requests.Session()
+        self._pool_size = 0
+        self._mount_pool()
+        self._limiter = RateLimiter(self.api_config.get("rpm_limit", 0))
+        self.breaker = CircuitBreaker(int(self.api_config.get("breaker_threshold", 5)),
+                                      float(self.api_config.get("breaker_probe_interval", 15)),
+                                      probe=self._probe)
+        self.lexicon = None  # 后备规则匹配使用的词典，None 为内置词典
+        self.cache = None  # LabelCache，None 为不使用缓存
+
+    def set_cache(self, path):
+        """启用（或切换到）指定路径的标签缓存，path 为 None 时关闭缓存"""
+        if self.cache and path and self.cache.path == Path(path):
+            return
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+        if path:
+            try:
+                self.cache = LabelCache(path)
+            except sqlite3.Error as e:
+                self._log(f"标签缓存打开失败，本次不使用缓存: {e}")
+
+    def _lookup_cache(self, comments):
+        """查缓存，返回 (标签列表, 方法列表, 未命中下标)，未命中位置为 None"""
+        labels = [None] * len(comments)
+        methods = [None] * len(comments)
+        if self.cache:
+            try:
+                for i, label in self.cache.get_many(comments, self.api_config.get("model", "")).items():
+                    labels[i] = label
+                    methods[i] = self.CACHE_METHOD
+            except sqlite3.Error as e:
+                self._log(f"标签缓存读取失败: {e}")
+        misses = [i for i, label in enumerate(labels) if label is None]
+        if self.cache and comments:
+            self._log(f"缓存命中 {len(comments) - len(misses)}/{len(comments)} 条")
+        return labels, methods, misses
+
+    def _store_cache(self, texts, labels, methods):
+        """只缓存AI给出的标签，规则后备结果不入缓存"""
+        if not self.cache:
+            return
+        pairs = [(t, label) for t, label, m in zip(texts, labels, methods) if m == self.AI_METHOD]
+        try:
+            self.cache.put_many([t for t, _ in pairs], [label for _, label in pairs],
+                                self.api_config.get("model", ""))
+        except sqlite3.Error as e:
+            self._log(f"标签缓存写入失败: {e}")
 
     def update_api_config(self, new_config):
         """更新API配置"""
         self.api_config.update(new_config)
+        self._mount_pool()
+        if "rpm_limit" in new_config:
+            self._limiter = RateLimiter(self.api_config.get("rpm_limit", 0))
+        self.breaker.failure_threshold = int(self.api_config.get("breaker_threshold", 5))
+        self.breaker.probe_interval = float(self.api_config.get("breaker_probe_interval", 15))
+
+    def _mount_pool(self):
+        """连接池大小与并发数保持一致，避免并发请求排队等连接"""
+        size = max(1, int(self.api_config.get("max_concurrency") or 1))
+        if size != self._pool_size:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+            self._pool_size = size
+
+    def _prepare(self, comment):
+        return prepare_comment(comment, int(self.api_config.get("max_comment_chars") or 0))
+
+    def _split_batches(self, comments):
+        """按模型token预算把评论装成尽量少的批次"""
+        budget = int(self.api_config.get("batch_token_budget") or 0) or \
+            input_budget_for(self.api_config.get("model", ""))
+        costs = [estimate_tokens(self._prepare(c)) + ITEM_OVERHEAD_TOKENS for c in comments]
+        return [comments[a:b] for a, b in pack_batches(costs, budget)]
 
     def analyze_comments_batch(self, comments):
-        """批量分析评论情绪（10-20条一批）"""
+        """批量分析评论情绪（按token预算分批，逐批顺序请求）"""
         if not self.api_config.get("api_key"):
             raise ValueError("API密钥未配置，请先在设置中配置API密钥")
 
-        # 批量处理：10-20条评论为一批
-        batch_size = min(20, max(10, len(comments) // 5 + 1))
-        batches = [comments[i:i + batch_size] for i in range(0, len(comments), batch_size)]
+        all_results, methods, misses = self._lookup_cache(comments)
+        pending, slots = dedupe_texts(comments, misses)
+        pending_labels, pending_methods = [], []
+        for batch_idx, batch in enumerate(self._split_batches(pending)):
+            labels, batch_methods = self._analyze_batch(batch, batch_idx)
+            pending_labels.extend(labels)
+            pending_methods.extend(batch_methods)
+        self._store_cache(pending, pending_labels, pending_methods)
+        for i, slot in zip(misses, slots):
+            all_results[i] = pending_labels[slot]
+        return all_results
 
-        all_results = []
+    def analyze_comments_concurrent(self, comments, on_progress=None, stop_event=None):
+        """
+        并发分析评论情绪，在非事件循环线程中调用
+        返回 (标签列表, 分析方法列表)，顺序与输入一致
+        """
+        if not self.api_config.get("api_key"):
+            raise ValueError("API密钥未配置，请先在设置中配置API密钥")
+        return asyncio.run(self.analyze_comments_async(comments, on_progress, stop_event))
 
-        for batch_idx, batch in enumerate(batches):
-            try:
-                # 更清晰的评论编号
-                numbered_comments = [f"{i + 1}. {comment}" for i, comment in enumerate(batch)]
-                comments_text = "\n".join(numbered_comments)
-
-                # 构建请求 - 适配智谱AI
-                headers = {
-                    "Authorization": f"Bearer {self.api_config['api_key']}",
-                    "Content-Type": "application/json"
-                }
+    async def analyze_comments_async(self, comments, on_progress=None, stop_event=None):
+        """
+        按 max_concurrency 限制在途批次、按 rpm_limit 限速（含补请求），批次请求在线程池中执行
+        on_progress(条数, 是否为请求批次) 在每批完成后回调；stop_event 置位后尚未发出的批次直接走规则匹配
+        缓存命中的评论不再请求；未命中的评论按归一化文本去重，每种文本只请求一次
+        命中和重复的条数一次性计入进度
+        """
+        labels, methods, misses = self._lookup_cache(comments)
+        pending, slots = dedupe_texts(comments, misses)
+        if on_progress and len(pending) < len(comments):
+            on_progress(len(comments) - len(pending), False)
+        if len(pending) < len(misses):
+            self._log(f"去重: {len(misses)} 条未命中评论合并为 {len(pending)} 种文本")
+        batches = self._split_batches(pending)
+        concurrency = max(1, int(self.api_config.get("max_concurrency") or 1))
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            async def run_one(batch_idx, batch):
+                streamed = [0]  # 流式模式下已逐条计入进度的条数
+
+                def on_label():
+                    # 在线程池中调用，转回事件循环线程更新进度
+                    streamed[0] += 1
+                    loop.call_soon_threadsafe(on_progress, 1, False)
+
+                async with semaphore:
+                    if stop_event is not None and stop_event.is_set():
+                        result = ([self._fallback_analyze(c) for c in batch], [self.FALLBACK_METHOD] * len(batch))
+                    else:
+                        result = await loop.run_in_executor(pool, self._analyze_batch, batch, batch_idx,
+                                                            on_label if on_progress else None)
+                if on_progress:
+                    on_progress(len(batch) - streamed[0], True)
+                return result
+
+            results = await asyncio.gather(*(run_one(i, b) for i, b in enumerate(batches)))
+
+        pending_labels, pending_methods = [], []
+        for batch_labels, batch_methods in results:
+            pending_labels.extend(batch_labels)
+            pending_methods.extend(batch_methods)
+        self._store_cache(pending, pending_labels, pending_methods)
+        for i, slot in zip(misses, slots):
+            labels[i] = pending_labels[slot]
+            methods[i] = pending_methods[slot]
+        return labels, methods
+
+    def _analyze_batch(self, batch, batch_idx, on_label=None):
+        """
+        分析单个批次，返回 (标签列表, 分析方法列表)
+        AI按编号返回标签，能对上的全部采用；缺失或无效的编号拆成更小的子批次重新请求，
+        重试后仍缺的条目才使用规则匹配
+        """
+        labels = [None] * len(batch)
+        try:
+            self._fill_labels(batch, list(range(len(batch))), labels, f"{batch_idx + 1}", 0, on_label)
+        except CircuitOpenError:
+            self._log(f"⛔ 批次{batch_idx + 1} 接口熔断中，直接使用规则匹配")
+        except requests.exceptions.Timeout:
+            self._log(f"❌ 批次{batch_idx + 1} 请求超时，未完成的评论使用规则匹配")
+        except Exception as e:
+            self._log(f"❌ 批次{batch_idx + 1} 分析出错: {str(e)}，未完成的评论使用规则匹配")
+
+        methods = [self.AI_METHOD if label else self.FALLBACK_METHOD for label in labels]
+        labels = [label or self._fallback_analyze(c) for label, c in zip(labels, batch)]
+        ok = methods.count(self.AI_METHOD)
+        if ok == len(batch):
+            self._log(f"✅ 批次{batch_idx + 1} AI分析成功: {ok}个标签")
+        else:
+            self._log(f"⚠️ 批次{batch_idx + 1} AI标注 {ok}/{len(batch)} 条，其余使用规则匹配")
+        return labels, methods
+
+    def _fill_labels(self, batch, idxs, labels, tag, depth, on_label=None):
+        """请求 idxs 对应评论的标签写入 labels，缺失项按子批次递归补请求"""
+        got = self._request_labels([batch[i] for i in idxs], tag, on_label)
+        for j, label in got.items():
+            labels[idxs[j]] = label
+        missing = [idxs[j] for j in range(len(idxs)) if j not in got]
+        if not missing:
+            return
+        if depth >= MAX_REPAIR_DEPTH:
+            self._log(f"批次{tag} 仍有 {len(missing)} 条未标注，放弃补请求")
+            return
+        size = max(1, (len(missing) + 1) // 2)
+        self._log(f"批次{tag} 缺少 {len(missing)} 个有效标签，拆分为 {(len(missing) + size - 1) // size} 个子批次补请求")
+        for k, start in enumerate(range(0, len(missing), size)):
+            self._fill_labels(batch, missing[start:start + size], labels, f"{tag}.{k + 1}", depth + 1, on_label)
 
-                # 更明确的prompt，要求逐条分析
-                prompt_content = f"""请分析以下{len(batch)}条小红书评论的情感倾向。
-
-    评论列表：
-    {comments_text}
-
-    要求：
-    1. 为每条评论单独分析情感
-    2. 只使用以下三种标签：正向、负向、中性
-    3. 按照评论顺序，用中文顿号「、」分隔输出标签
-    4. 不要添加任何解释文字，只输出标签
-
-    请输出：标签1、标签2、标签3...（共{len(batch)}个标签）"""
-
-                data = {
-                    "model": self.api_config.get("model", "glm-4.5-flash"),
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt_content
-                        }
-                    ],
-                    "temperature": 0.1,
-                    "max_tokens": 800,  # 增加token限制
-                    "top_p": 0.7
+    def _request_labels(self, comments, tag, on_label=None):
+        """
+        发送一次请求，返回 {批内下标: 标签}；HTTP错误或超时抛出异常
+        开启 stream 时边接收边解析，每得到一个新标签回调一次 on_label()
+        """
+        numbered_comments = [f"[{i + 1}] {self._prepare(comment)}" for i, comment in enumerate(comments)]
+        comments_text = "\n".join(numbered_comments)
+
+        # 要求按编号返回JSON，便于逐条对应
+        prompt_content = f"""请分析以下{len(comments)}条小红书评论的情感倾向。
+
+评论列表（方括号内为编号）：
+{comments_text}
+
+要求：
+1. 为每条评论单独分析情感
+2. 只使用以下三种标签：正向、负向、中性
+3. 只输出一个JSON对象，键为评论编号，值为标签，例如 {{"1": "正向", "2": "中性"}}
+4. 必须包含全部{len(comments)}个编号，不要添加任何解释文字"""
+
+        data = {
+            "model": self.api_config.get("model", "glm-4.5-flash"),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt_content
                 }
+            ],
+            "temperature": 0.1,
+            "max_tokens": min(MAX_OUTPUT_TOKENS, len(comments) * TOKENS_PER_LABEL + 64),  # 按标签数预留输出
+            "top_p": 0.7
+        }
 
-                # 发送请求到智谱AI，增加超时时间
-                base_url = self.api_config.get("base_url", "https://open.bigmodel.cn/api/paas/v4")
+        if self.api_config.get("stream"):
+            data["stream"] = True
+            response = self._post_chat(data, tag, stream=True)
+            labels_text, streamed = self._read_stream(response, len(comments), on_label)
+        else:
+            with self._post_chat(data, tag) as response:
+                labels_text = response.json()["choices"][0]["message"]["content"].strip()
+            streamed = {}
+        # 记录原始返回以便调试
+        self._log(f"批次{tag} AI原始返回: {labels_text}")
+        if len(streamed) == len(comments):
+            return streamed
+        parsed = self._parse_ai_response(labels_text, len(comments))
+        for idx, label in parsed.items():
+            if idx not in streamed:
+                streamed[idx] = label
+                if on_label:
+                    on_label()
+        return streamed
+
+    def _read_stream(self, response, expected_count, on_label=None):
+        """
+        读取 SSE 流式返回，按“编号: 标签”逐对提交；标签收齐后立即断开，不再等待剩余输出
+        返回 (已收到的全文, {批内下标: 标签})
+        """
+        chunks, pending, labels = [], "", {}
+        try:
+            for raw in response.iter_lines():
+                # SSE 常不带 charset，按 UTF-8 自行解码
+                line = raw.decode("utf-8", "replace")
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(payload)["choices"][0].get("delta", {}).get("content") or ""
+                except (ValueError, KeyError, IndexError, AttributeError, TypeError):
+                    continue
+                chunks.append(delta)
+                # 只扫描上一个完整标签之后的部分，全文最后拼接一次
+                pending += delta
+                scanned = 0
+                for m in _LABEL_PAIR_RE.finditer(pending):
+                    scanned = m.end()
+                    idx = int(m.group(1)) - 1
+                    label = self._standardize_label(m.group(2))
+                    if 0 <= idx < expected_count and label and idx not in labels:
+                        labels[idx] = label
+                        if on_label:
+                            on_label()
+                pending = pending[scanned:][-STREAM_PENDING_CHARS:]
+                if len(labels) == expected_count:
+                    break
+        finally:
+            response.close()
+        return "".join(chunks).strip(), labels
+
+    def _headers(self):
+        # 构建请求 - 适配智谱AI
+        return {
+            "Authorization": f"Bearer {self.api_config['api_key']}",
+            "Content-Type": "application/json"
+        }
+
+    def _post_chat(self, data, tag, stream=False):
+        """
+        发送 chat/completions 请求
+        429/5xx/超时/连接错误按指数退避重试，有 Retry-After 等限流头时按其等待并让所有线程一起暂停；
+        熔断打开时直接抛出 CircuitOpenError
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("AI接口已熔断")
+        base_url = self.api_config.get("base_url", "https://open.bigmodel.cn/api/paas/v4")
+        max_retries = int(self.api_config.get("max_retries", 3))
+
+        for attempt in range(max_retries + 1):
+            self._limiter.acquire()
+            retry_after = None
+            try:
                 response = self.session.post(
                     f"{base_url}/chat/completions",
-                    headers=headers,
+                    headers=self._headers(),
                     json=data,
-                    timeout=60  # 增加到60秒
+                    timeout=float(self.api_config.get("timeout", 60)),
+                    stream=stream
                 )
-
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error = e
+                self.breaker.record_failure()
+            else:
                 if response.status_code == 200:
-                    result = response.json()
-                    # 智谱AI的返回格式
-                    labels_text = result["choices"][0]["message"]["content"].strip()
-
-                    # 记录原始返回以便调试
-                    self._log(f"批次{batch_idx + 1} AI原始返回: {labels_text}")
-
-                    # 解析标签
-                    labels = self._parse_ai_response(labels_text, len(batch))
-
-                    # 确保标签数量与评论数量一致
-                    if len(labels) == len(batch):
-                        all_results.extend(labels)
-                        self._log(f"✅ 批次{batch_idx + 1} AI分析成功: {len(labels)}个标签")
-                    else:
-                        # 如果不一致，使用规则匹配作为后备
-                        self._log(
-                            f"❌ 批次{batch_idx + 1} AI返回标签数量不匹配 (AI: {len(labels)}, 实际: {len(batch)})，使用规则匹配")
-                        fallback_results = [self._fallback_analyze(comment) for comment in batch]
-                        all_results.extend(fallback_results)
-
+                    self.breaker.record_success()
+                    return response
+                error = RuntimeError(f"API请求失败: {response.status_code}")
+                # 失败的响应不再读取，立即归还连接（流式请求不关闭会一直占用连接池）
+                response.close()
+                if response.status_code == 429:
+                    # 限流说明接口可用，不计入熔断
+                    retry_after = parse_retry_after(response.headers)
                 else:
-                    self._log(f"❌ 批次{batch_idx + 1} API请求失败: {response.status_code}")
-                    # 使用规则匹配作为后备
-                    fallback_results = [self._fallback_analyze(comment) for comment in batch]
-                    all_results.extend(fallback_results)
-
-            except requests.exceptions.Timeout:
-                self._log(f"❌ 批次{batch_idx + 1} 请求超时，使用规则匹配")
-                # 超时时使用规则匹配
-                fallback_results = [self._fallback_analyze(comment) for comment in batch]
-                all_results.extend(fallback_results)
-
-            except Exception as e:
-                self._log(f"❌ 批次{batch_idx + 1} 分析出错: {str(e)}，使用规则匹配")
-                # 使用规则匹配作为后备
-                fallback_results = [self._fallback_analyze(comment) for comment in batch]
-                all_results.extend(fallback_results)
-
-        return all_results
+                    self.breaker.record_failure()
+                if response.status_code not in RETRY_STATUS:
+                    raise error
+
+            if attempt == max_retries or not self.breaker.allow():
+                raise error
+            if retry_after is not None:
+                delay = retry_after
+                self._limiter.pause(delay)
+            else:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            self._log(f"批次{tag} {error}，{delay:.1f} 秒后第 {attempt + 1} 次重试")
+            time.sleep(delay)
+
+    def _probe(self):
+        """熔断后的探测请求：最小的对话请求，同样受限速约束，返回接口是否恢复"""
+        data = {
+            "model": self.api_config.get("model", "glm-4.5-flash"),
+            "messages": [{"role": "user", "content": "1"}],
+            "max_tokens": 1,
+        }
+        base_url = self.api_config.get("base_url", "https://open.bigmodel.cn/api/paas/v4")
+        self._limiter.acquire()
+        with self.session.post(f"{base_url}/chat/completions", headers=self._headers(), json=data,
+                               timeout=float(self.api_config.get("timeout", 60))) as response:
+            return response.status_code == 200
+
+    @staticmethod
+    def _standardize_label(label):
+        label = str(label).strip().lower()
+        for standard, words in LABEL_SYNONYMS.items():
+            if label in words:
+                return standard
+        return None
 
     def _parse_ai_response(self, response_text, expected_count):
-        """解析AI返回的文本，提取情感标签"""
-        # 清理响应文本
-        response_text = response_text.strip()
-
-        # 首先尝试提取用中文顿号分隔的标签
-        if "、" in response_text:
-            labels = [label.strip() for label in response_text.split("、")]
-            labels = [label for label in labels if label and len(label) <= 4]  # 过滤空标签和过长的文本
-        else:
-            # 尝试其他分隔符
-            separators = ['/', '，', ',', ' ', '|', '\n']
-            labels = []
-            for sep in separators:
-                if sep in response_text:
-                    temp_labels = [label.strip() for label in response_text.split(sep)]
-                    temp_labels = [label for label in temp_labels if label and len(label) <= 4]
-                    if len(temp_labels) >= expected_count:
-                        labels = temp_labels
-                        break
+        """
+        解析AI返回，提取 {批内下标: 标签}，只保留编号有效且标签可识别的条目
+        优先解析JSON（对象或 [{"id":..,"label":..}] 列表）；JSON不完整时按“编号: 标签”逐对匹配；
+        都失败时兼容旧的纯标签序列，仅在数量恰好一致时按顺序采用
+        """
+        text = response_text.strip()
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+        result = {}
 
-            # 如果没有找到合适的分隔符，尝试正则匹配
-            if not labels:
-                import re
-                # 匹配中文情感词
-                pattern = r'[正负中][向性]|积极|消极'
-                matches = re.findall(pattern, response_text)
-                if matches:
-                    labels = matches
-
-        # 标准化标签
-        standardized_labels = []
-        for label in labels:
-            label_lower = label.lower()
-            if any(word in label_lower for word in ["正向", "积极", "正面", "好评", "好", "不错", "喜欢"]):
-                standardized_labels.append("正向")
-            elif any(word in label_lower for word in ["负向", "消极", "负面", "差评", "差", "不好", "讨厌"]):
-                standardized_labels.append("负向")
-            elif any(word in label_lower for word in ["中性", "中立", "一般", "普通", "还行"]):
-                standardized_labels.append("中性")
-            else:
-                # 无法识别的标签，使用中性作为默认
-                standardized_labels.append("中性")
+        def accept(key, label):
+            try:
+                idx = int(str(key).strip()) - 1
+            except ValueError:
+                return
+            label = self._standardize_label(label)
+            if 0 <= idx < expected_count and label and idx not in result:
+                result[idx] = label
 
-        # 如果标签数量不够，用中性填充
-        while len(standardized_labels) < expected_count:
-            standardized_labels.append("中性")
+        start = min([p for p in (text.find("{"), text.find("[")) if p >= 0], default=-1)
+        if start >= 0:
+            try:
+                data = json.loads(text[start:max(text.rfind("}"), text.rfind("]")) + 1])
+                if isinstance(data, dict):
+                    for key, label in data.items():
+                        accept(key, label)
+                elif isinstance(data, list):
+                    for item in data:
+                        if isinstance(item, dict):
+                            accept(item.get("id", item.get("编号", "")), item.get("label", item.get("标签", "")))
+                    if not result and len(data) == expected_count:
+                        for i, label in enumerate(data):
+                            accept(i + 1, label)
+            except ValueError:
+                pass
 
-        # 如果标签数量过多，截取前expected_count个
-        if len(standardized_labels) > expected_count:
-            standardized_labels = standardized_labels[:expected_count]
+        if not result:
+            for key, label in _LABEL_PAIR_RE.findall(text):
+                accept(key, label)
 
-        return standardized_labels
+        if not result:
+            plain = _LABEL_WORD_RE.findall(text)
+            if len(plain) == expected_count:
+                for i, label in enumerate(plain):
+                    accept(i + 1, label)
+        return result
 
     def _fallback_analyze(self, comment):
         """后备方案：使用规则匹配分析情绪"""
-        score = score_sent(comment)
+        score = score_sent(comment, self.lexicon)
         return label_sent(score)
 
     def _log(self, message):
@@ -277,6 +1071,2021 @@ class AIEmotionAnalyzer:
         logging.info(f"AI分析器: {message}")
 
 
+# -------------------- 近重复与刷屏评论检测（MinHash + LSH） --------------------
+DEDUP_INDEX_FILE = "dedup_index.sqlite3"
+MINHASH_BANDS = 10  # LSH 分段数
+MINHASH_ROWS = 4  # 每段哈希数；相似度 0.8 的两条评论约 99% 概率成为候选，0.3 的约 8%
+MINHASH_THRESHOLD = 0.6  # 与簇代表评论的签名一致率达到该值才算近重复
+DEDUP_MIN_CHARS = 4  # 归一化后更短的评论只做精确去重，避免短文本误合并
+SPAM_CLUSTER_SIZE = 5  # 簇内评论数达到该值视为疑似刷屏
+DEDUP_INGEST_CHUNK = 2000  # 每个事务写入的评论数
+DEDUP_MAX_CANDIDATES = 200  # 每条评论最多比对的 LSH 候选数
+DEDUP_INDEX_VERSION = 2  # 签名算法或表结构变更时递增，旧索引自动清空重建
+DUP_COLUMNS = ["重复簇", "簇大小", "疑似刷屏"]
+_MINHASH_SEEDS = np.frombuffer(np.random.RandomState(20240601).bytes(8 * MINHASH_BANDS * MINHASH_ROWS),
+                               dtype=np.uint64)
+
+
+def _signed64(v):
+    """SQLite 整数是有符号 64 位"""
+    return v - (1 << 64) if v >= 1 << 63 else v
+
+
+def text_key(norm: str) -> int:
+    return _signed64(int.from_bytes(hashlib.blake2b(norm.encode("utf8"), digest_size=8).digest(), "big"))
+
+
+def _mix64(x):
+    """splitmix64 的混合函数：uint64 上的双射，输入差一位输出约一半位翻转（乘法按 2^64 回绕）"""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_signature(norm: str):
+    """
+    字符二元组集合的 MinHash 签名（uint32 数组）
+    每个二元组先取 64 位哈希，每行用不同种子异或后混合，取最小值的高 32 位
+    """
+    grams = {norm[i:i + 2] for i in range(len(norm) - 1)} or {norm}
+    hashes = np.frombuffer(b"".join(hashlib.blake2b(g.encode("utf8"), digest_size=8).digest() for g in grams),
+                           dtype=np.uint64)
+    return (_mix64(hashes[None, :] ^ _MINHASH_SEEDS[:, None]).min(axis=1) >> np.uint64(32)).astype(np.uint32)
+
+
+def minhash_bands(sig):
+    rows = sig.reshape(MINHASH_BANDS, MINHASH_ROWS)
+    return [(band, text_key(rows[band].tobytes().hex())) for band in range(MINHASH_BANDS)]
+
+
+class NearDuplicateIndex:
+    """
+    跨批次的近重复评论索引，全部状态存在 SQLite 中，内存占用与评论总数无关
+    fingerprints: 每种归一化文本一行（精确去重）；clusters: 簇大小、样例和代表评论（建簇的第一条）的签名；
+    bands: 代表评论签名分段的 LSH 倒排。新评论只与簇代表比较，不会经由中间评论把不相似的评论串成一个大簇
+    先 ingest 建簇，再 lookup 给评论打上 重复簇/簇大小/疑似刷屏 标记
+    """
+
+    def __init__(self, path, threshold=MINHASH_THRESHOLD, spam_size=SPAM_CLUSTER_SIZE):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.spam_size = spam_size
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != DEDUP_INDEX_VERSION:
+            # 旧版本的签名与现在的不可比，清空后各批次在下次分析时重新入索引
+            self.conn.executescript("""
+                DROP TABLE IF EXISTS fingerprints;
+                DROP TABLE IF EXISTS bands;
+                DROP TABLE IF EXISTS clusters;
+                DROP TABLE IF EXISTS dedup_runs;
+            """)
+            self.conn.execute(f"PRAGMA user_version = {DEDUP_INDEX_VERSION}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fingerprints (key INTEGER PRIMARY KEY, cluster INTEGER);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER, value INTEGER, cluster INTEGER);
+            CREATE INDEX IF NOT EXISTS idx_bands ON bands(band, value);
+            CREATE TABLE IF NOT EXISTS clusters (id INTEGER PRIMARY KEY, size INTEGER, sample TEXT, signature BLOB);
+            CREATE TABLE IF NOT EXISTS dedup_runs (run_id TEXT PRIMARY KEY, finished_at TEXT);
+        """)
+        self.conn.commit()
+
+    def _find_cluster(self, sig, bands):
+        """在 LSH 候选簇中找代表签名一致率最高且达到阈值的簇；候选数有上限，不会拖慢入索引"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT c.id, c.signature FROM bands b JOIN clusters c ON c.id = b.cluster WHERE "
+            + " OR ".join("(b.band = ? AND b.value = ?)" for _ in bands) + " LIMIT ?",
+            [v for band in bands for v in band] + [DEDUP_MAX_CANDIDATES]).fetchall()
+        if not rows:
+            return None
+        sigs = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.uint32).reshape(len(rows), -1)
+        similarity = (sigs == sig).mean(axis=1)
+        best = int(similarity.argmax())
+        return rows[best][0] if similarity[best] >= self.threshold else None
+
+    def ingest(self, texts):
+        """把一批评论加入索引（同一事务），空评论忽略"""
+        with self._lock, self.conn:
+            for text in texts:
+                norm = normalize_comment(text)
+                if not norm:
+                    continue
+                key = text_key(norm)
+                row = self.conn.execute("SELECT cluster FROM fingerprints WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self.conn.execute("UPDATE clusters SET size = size + 1 WHERE id = ?", (row[0],))
+                    continue
+                cluster, sig, bands = None, None, None
+                if len(norm) >= DEDUP_MIN_CHARS:
+                    sig = minhash_signature(norm)
+                    bands = minhash_bands(sig)
+                    cluster = self._find_cluster(sig, bands)
+                if cluster is None:
+                    # 成为新簇的代表，只有代表的签名进入 LSH 倒排
+                    cluster = key
+                    self.conn.execute("INSERT INTO clusters(id, size, sample, signature) VALUES (?, 1, ?, ?)",
+                                      (key, text[:100], None if sig is None else sig.tobytes()))
+                    if bands:
+                        self.conn.executemany("INSERT INTO bands(band, value, cluster) VALUES (?, ?, ?)",
+                                              [(band, value, key) for band, value in bands])
+                else:
+                    self.conn.execute("UPDATE clusters SET size = size + 1 WHERE id = ?", (cluster,))
+                self.conn.execute("INSERT INTO fingerprints(key, cluster) VALUES (?, ?)", (key, cluster))
+
+    def has_run(self, run_id):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM dedup_runs WHERE run_id = ?", (run_id,)).fetchone() is not None
+
+    def finish_run(self, run_id):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO dedup_runs VALUES (?, ?)",
+                              (run_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def ingest_file(self, json_path, chunk_size=DEDUP_INGEST_CHUNK):
+        """去重阶段：把结果文件的评论全部入索引（每个结果文件只入一次），返回是否新入索引"""
+        run_id = result_stem(json_path)
+        if self.has_run(run_id):
+            return False
+        texts = (c for post in iter_posts(json_path) for c in post.get("评论", []))
+        for chunk in iter_chunks(texts, chunk_size):
+            self.ingest(chunk)
+        self.finish_run(run_id)
+        return True
+
+    def lookup(self, texts):
+        """返回每条评论的 (簇编号, 簇大小)，未入索引的评论为 (None, 0)"""
+        keys = [text_key(normalize_comment(t)) if normalize_comment(t) else None for t in texts]
+        found = {}
+        wanted = list({k for k in keys if k is not None})
+        with self._lock:
+            for i in range(0, len(wanted), 500):
+                part = wanted[i:i + 500]
+                found.update((k, (c, n)) for k, c, n in self.conn.execute(
+                    "SELECT f.key, f.cluster, c.size FROM fingerprints f JOIN clusters c ON c.id = f.cluster "
+                    f"WHERE f.key IN ({','.join('?' * len(part))})", part))
+        return [found.get(k, (None, 0)) for k in keys]
+
+    def annotate(self, rows):
+        """给评论记录加上 重复簇/簇大小/疑似刷屏 标记"""
+        for row, (cluster, size) in zip(rows, self.lookup([r.text for r in rows])):
+            row.cluster, row.cluster_size, row.spam = cluster, size, size >= self.spam_size
+        return rows
+
+    def spam_clusters(self, limit=20):
+        with self._lock:
+            return self.conn.execute("SELECT id, size, sample FROM clusters WHERE size >= ? ORDER BY size DESC "
+                                     "LIMIT ?", (self.spam_size, limit)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def add_dup_columns(df, rows):
+    """把 annotate 过的评论记录中的重复标记写入 DataFrame"""
+    for col, field in zip(DUP_COLUMNS, ("cluster", "cluster_size", "spam")):
+        df[col] = [getattr(r, field) for r in rows]
+    return df
+
+
+# -------------------- 压缩归档（gzip / zstd，可选） --------------------
+ARCHIVE_FORMATS = {"不压缩": None, "gzip": ".gz", "zstd": ".zst"}
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+ARCHIVE_COPY_SIZE = 1 << 20  # 压缩/解压时每次复制的字节数
+ARCHIVE_CSV_SUFFIXES = ("_sentiment_rule.csv", "_sentiment_ai.csv", "_sentiment_local.csv")
+
+_archive_busy = set()  # 正在写出的文件，归档时跳过
+_archive_busy_lock = threading.Lock()
+_archive_lock = threading.Lock()  # 同一时间只运行一个归档任务
+
+
+def plain_path(path) -> Path:
+    """去掉压缩后缀：x.json.zst -> x.json"""
+    path = Path(path)
+    return path.with_suffix("") if path.suffix in COMPRESSED_SUFFIXES else path
+
+
+def result_stem(path) -> str:
+    """结果文件的批次名（不含 .json 和压缩后缀），侧车文件、导出文件和 run_id 都按它命名，压缩前后不变"""
+    return plain_path(path).stem
+
+
+def open_result_binary(path):
+    """以二进制只读流打开文件，.gz / .zst 在读取时流式解压"""
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".zst":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError(f"未安装 zstandard，无法读取 {path.name}，请先 pip install zstandard")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                 ARCHIVE_COPY_SIZE)
+    return open(path, "rb")
+
+
+def open_result_text(path, newline=""):
+    """以 UTF-8 文本流打开（可能压缩的）结果文件"""
+    return io.TextIOWrapper(open_result_binary(path), encoding="utf8", newline=newline)
+
+
+def compress_file(src, suffix):
+    """把 src 压缩为 src+suffix（先写临时文件再替换），返回压缩文件路径；不删除 src"""
+    src = Path(src)
+    dst = src.with_name(src.name + suffix)
+    tmp = dst.with_name(dst.name + ".tmp")
+    with open(src, "rb") as fin, open(tmp, "wb") as fout:
+        if suffix == ".zst":
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("未安装 zstandard，无法压缩为 .zst，请先 pip install zstandard")
+            zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).copy_stream(
+                fin, fout, size=src.stat().st_size, read_size=ARCHIVE_COPY_SIZE, write_size=ARCHIVE_COPY_SIZE)
+        elif suffix == ".gz":
+            with gzip.GzipFile(filename=src.name, mode="wb", compresslevel=GZIP_LEVEL, fileobj=fout) as gz:
+                shutil.copyfileobj(fin, gz, ARCHIVE_COPY_SIZE)
+        else:
+            raise ValueError(f"不支持的压缩格式: {suffix}")
+    shutil.copystat(src, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+
+@contextlib.contextmanager
+def archive_hold(*paths):
+    """写出期间登记文件，后台归档不会压缩写了一半的文件"""
+    paths = {Path(p).resolve() for p in paths}
+    with _archive_busy_lock:
+        _archive_busy.update(paths)
+    try:
+        yield
+    finally:
+        with _archive_busy_lock:
+            _archive_busy.difference_update(paths)
+
+
+def archive_busy(path):
+    with _archive_busy_lock:
+        return Path(path).resolve() in _archive_busy
+
+
+# -------------------- 流式情绪分析管线 --------------------
+STREAM_READ_SIZE = 1 << 16  # 结果文件每次读取的字符数
+SENTIMENT_CHUNK_SIZE = 2000  # 每个分块处理并写出的评论条数
+RUN_MEMO_MAX_ENTRIES = 200_000  # 单次分析内跨分块复用标签的文本数上限
+
+LOCAL_METHOD = "规则(高置信)"
+SPAM_METHOD = "规则(疑似刷屏)"
+METHOD_STATS = {AIEmotionAnalyzer.AI_METHOD: "ai", AIEmotionAnalyzer.CACHE_METHOD: "cached", LOCAL_METHOD: "local",
+                SPAM_METHOD: "spam"}
+ANALYSIS_MODES = {"全部AI": "ai", "混合(仅模糊评论走AI)": "hybrid", "本地模型(离线)": "local"}
+
+RULE_CSV_COLUMNS = ["标题", "作者", "点赞数", "收藏数", "评论内容", "clean", "score", "sentiment"]
+AI_CSV_COLUMNS = RULE_CSV_COLUMNS + ["分析方法"]
+
+
+def iter_posts(path, read_size=STREAM_READ_SIZE, with_spans=False):
+    """
+    逐条读取结果文件（JSON数组）中的笔记，不把整个文件读入内存
+    with_spans=True 时产出 (起始字节偏移, 字节长度, 笔记)，供建立偏移索引
+    .gz / .zst 压缩文件边读边解压，字节偏移对应解压后的内容
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, started = "", 0, False
+    mark, mark_byte = 0, 0  # buf[mark] 在文件中的字节偏移，只在需要时向后推进
+
+    def byte_at(i):
+        nonlocal mark, mark_byte
+        mark_byte += len(buf[mark:i].encode("utf8"))
+        mark = i
+        return mark_byte
+
+    with open_result_text(path) as f:
+        while True:
+            # 跳过空白和逗号，缓冲区读完时继续读文件
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf):
+                    break
+                more = f.read(read_size)
+                if not more:
+                    return
+                if with_spans:
+                    byte_at(pos)
+                    mark = 0
+                buf, pos = buf[pos:] + more, 0
+
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("结果文件不是 JSON 数组")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # 当前笔记还没读全，按缓冲区大小成倍补读
+                more = f.read(max(read_size, len(buf)))
+                if not more:
+                    raise
+                if with_spans:
+                    byte_at(pos)
+                    mark = 0
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if with_spans:
+                start = byte_at(pos)
+                yield start, byte_at(end) - start, obj
+            else:
+                yield obj
+            pos = end
+            if pos >= read_size:
+                if with_spans:
+                    byte_at(pos)
+                    mark = 0
+                buf, pos = buf[pos:], 0
+
+
+RESULT_TAIL_BYTES = 4096  # 追加笔记时从文件末尾读取的字节数
+
+
+def append_result(path, info):
+    """
+    把一条笔记追加到结果文件（JSON数组）末尾，格式与 json.dump(数组, indent=2) 相同
+    只改写结尾的 "]"，不读入已有内容，内存占用和写入量不随已采集的笔记数增长
+    """
+    item = json.dumps(info, ensure_ascii=False, indent=2).replace("\n", "\n  ").encode("utf8")
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        start = max(0, size - RESULT_TAIL_BYTES)
+        f.seek(start)
+        tail = f.read().rstrip()
+        if not tail.endswith(b"]"):
+            raise ValueError(f"{Path(path).name} 不是完整的 JSON 数组，无法追加")
+        body = tail[:-1].rstrip()
+        if not body and start:
+            raise ValueError(f"{Path(path).name} 结尾空白过多，无法追加")
+        f.seek(start + len(body))
+        f.write((b"\n  " if body.endswith(b"[") else b",\n  ") + item + b"\n]")
+        f.truncate()
+
+
+class NoteRecord:
+    """笔记的公共字段：同一笔记的所有评论记录共享一个实例，标题、作者等不随每条评论复制"""
+    __slots__ = ("index", "title", "author", "likes", "collects")
+
+    def __init__(self, index, post):
+        self.index = index
+        self.title = post.get("标题", "")
+        self.author = post.get("作者", "")
+        self.likes = post.get("点赞数", 0)
+        self.collects = post.get("收藏数", 0)
+
+
+class CommentRow:
+    """一条评论记录：所属笔记、笔记内评论序号、评论文本，以及 NearDuplicateIndex.annotate 写入的重复标记"""
+    __slots__ = ("note", "index", "text", "cluster", "cluster_size", "spam")
+
+    def __init__(self, note, index, text):
+        self.note = note
+        self.index = index
+        self.text = text
+        self.cluster = self.cluster_size = self.spam = None
+
+
+def iter_comment_rows(posts, skip_empty=False, on_skip=None):
+    """把笔记展开为逐条 CommentRow，同一笔记的评论共享一个 NoteRecord"""
+    for post_idx, post in enumerate(posts):
+        note = NoteRecord(post_idx, post)
+        for comment_idx, c in enumerate(post.get("评论", [])):
+            comment_text = c.strip()
+            if skip_empty and not comment_text:
+                if on_skip:
+                    on_skip(post_idx, comment_idx)
+                continue
+            yield CommentRow(note, comment_idx, comment_text)
+
+
+def comment_frame(rows):
+    """评论记录 -> RULE_CSV_COLUMNS 前 5 列（标题、作者、点赞数、收藏数、评论内容）的 DataFrame"""
+    return pd.DataFrame({"标题": [r.note.title for r in rows], "作者": [r.note.author for r in rows],
+                         "点赞数": [r.note.likes for r in rows], "收藏数": [r.note.collects for r in rows],
+                         "评论内容": [r.text for r in rows]}, columns=RULE_CSV_COLUMNS[:5])
+
+
+def iter_chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rule_score(text: str, lexicon: Lexicon = None) -> int:
+    """按句拆分后累加得分（规则情绪分析使用）"""
+    return sum(score_sent(s, lexicon) for s in re.split(r"[。！？;；\n]+", text))
+
+
+def rule_sentiment_frame(rows, lexicon=None):
+    """对一组评论记录做规则打分，返回 RULE_CSV_COLUMNS 列的 DataFrame"""
+    df = comment_frame(rows)
+    df["clean"] = df["评论内容"].apply(clean)
+    df["score"] = df["评论内容"].apply(lambda x: rule_score(x, lexicon))
+    df["sentiment"] = df["score"].apply(label_sent)
+    return df
+
+
+def ai_sentiment_frame(rows, analyzer, lexicon=None, memo=None, on_batch_done=None, stop_event=None,
+                       triage_threshold=None):
+    """
+    对一组评论记录做AI情绪分析，返回 AI_CSV_COLUMNS 列的 DataFrame
+    memo 为跨调用复用的 {归一化文本: (标签, 方法)}；其余参数含义同 write_ai_sentiment_csv
+    """
+    memo = {} if memo is None else memo
+    keys = [normalize_comment(r.text) for r in rows]
+    sentiments = [None] * len(rows)
+    methods = [None] * len(rows)
+    todo = []
+    for i, key in enumerate(keys):
+        if key in memo:
+            sentiments[i], methods[i] = memo[key]
+            continue
+        if rows[i].spam:
+            # 疑似刷屏（见 NearDuplicateIndex.annotate）不送AI，规则标注后在输出中标记
+            sentiments[i], methods[i] = label_sent(score_sent(rows[i].text, lexicon)), SPAM_METHOD
+            continue
+        if triage_threshold is not None:
+            label, confidence = rule_confidence(rows[i].text, lexicon)
+            if confidence >= triage_threshold:
+                sentiments[i], methods[i] = label, LOCAL_METHOD
+                continue
+        todo.append(i)
+    if len(todo) < len(rows) and on_batch_done:
+        on_batch_done(len(rows) - len(todo), False)
+
+    labels, todo_methods = analyzer.analyze_comments_concurrent(
+        [rows[i].text for i in todo], on_batch_done, stop_event)
+    for i, label, method in zip(todo, labels, todo_methods):
+        sentiments[i], methods[i] = label, method
+        if len(memo) < RUN_MEMO_MAX_ENTRIES and method != analyzer.FALLBACK_METHOD:
+            memo[keys[i]] = (label, method)
+
+    df = comment_frame(rows)
+    df["clean"] = df["评论内容"].apply(clean)
+    df["score"] = df["评论内容"].apply(lambda x: score_sent(x, lexicon))
+    df["sentiment"] = sentiments
+    df["分析方法"] = methods
+    return df
+
+
+def with_dup_columns(columns, dedup):
+    return columns + DUP_COLUMNS if dedup else columns
+
+
+def write_rule_sentiment_csv(json_path, csv_path, lexicon=None, chunk_size=SENTIMENT_CHUNK_SIZE, columnar=None,
+                             dedup=None, progress=None):
+    """
+    规则情绪分析：流式读取结果文件，分块打分并追加写入CSV，返回写入的评论数
+    columnar 为 "parquet"/"arrow" 时同时写出同名列式文件
+    dedup 为 NearDuplicateIndex 时先把结果文件入索引，输出中附带近重复/刷屏标记
+    progress(已写入条数) 在每块写完后回调
+    """
+    total = 0
+    columns = with_dup_columns(RULE_CSV_COLUMNS, dedup)
+    if dedup:
+        dedup.ingest_file(json_path)
+    writer = open_columnar(csv_path, columnar, columns, result_stem(json_path))
+    with archive_hold(csv_path), open(csv_path, "w", encoding="utf-8-sig", newline="") as f, \
+            (writer or contextlib.nullcontext()):
+        for rows in iter_chunks(iter_comment_rows(iter_posts(json_path)), chunk_size):
+            df = rule_sentiment_frame(rows, lexicon)
+            if dedup:
+                add_dup_columns(df, dedup.annotate(rows))
+            df.to_csv(f, index=False, header=(total == 0))
+            if writer:
+                writer.write(df)
+            total += len(df)
+            if progress:
+                progress(total)
+        if total == 0:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+    return total
+
+
+def write_ai_sentiment_csv(json_path, csv_path, analyzer, lexicon=None, chunk_size=SENTIMENT_CHUNK_SIZE,
+                           progress=None, stop_event=None, columnar=None, triage_threshold=None, dedup=None,
+                           store=None):
+    """
+    AI情绪分析：流式读取结果文件，每次取 chunk_size 条评论并发送AI，分析完即追加写入CSV
+    progress(已处理条数, 已完成批次数) 在每批完成后回调；stop_event 置位后剩余评论走规则匹配
+    columnar 为 "parquet"/"arrow" 时同时写出同名列式文件
+    triage_threshold 不为 None 时为混合模式：规则置信度达到阈值的评论本地标注，只有模糊评论送AI
+    dedup 为 NearDuplicateIndex 时附带近重复/刷屏标记，疑似刷屏的评论不送AI、按规则标注
+    store 为 ResultStore 时每块的AI标签同时写入结果库（该结果文件需已导入）
+    返回 {"total": 总条数, "ai": AI分析条数, "cached": 缓存命中条数, "local": 规则高置信条数,
+          "spam": 疑似刷屏按规则标注条数, "fallback": 后备条数}
+    """
+    stats = {"total": 0, "ai": 0, "cached": 0, "local": 0, "spam": 0, "fallback": 0}
+    done = {"comments": 0, "batches": 0}
+    memo = {}  # 本次运行已分析过的归一化文本 -> (标签, 方法)，跨分块复用
+
+    def on_batch_done(n, requested=True):
+        done["comments"] += n
+        done["batches"] += requested
+        if progress:
+            progress(done["comments"], done["batches"])
+
+    columns = with_dup_columns(AI_CSV_COLUMNS, dedup)
+    if dedup:
+        dedup.ingest_file(json_path)
+    writer = open_columnar(csv_path, columnar, columns, result_stem(json_path))
+    with archive_hold(csv_path), open(csv_path, "w", encoding="utf-8-sig", newline="") as f, \
+            (writer or contextlib.nullcontext()):
+        for rows in iter_chunks(iter_comment_rows(iter_posts(json_path), skip_empty=True), chunk_size):
+            if dedup:
+                dedup.annotate(rows)
+            df = ai_sentiment_frame(rows, analyzer, lexicon, memo, on_batch_done, stop_event, triage_threshold)
+            if dedup:
+                add_dup_columns(df, rows)
+            df.to_csv(f, index=False, header=(stats["total"] == 0))
+            if writer:
+                writer.write(df)
+            stats["total"] += len(df)
+            for m in df["分析方法"]:
+                stats[METHOD_STATS.get(m, "fallback")] += 1
+            if store:
+                store.add_run_ai_labels(result_stem(json_path), [
+                    (r.note.index, r.index, label, method)
+                    for r, label, method in zip(rows, df["sentiment"], df["分析方法"])])
+        if stats["total"] == 0:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+    if stop_event is not None and stop_event.is_set():
+        logging.info("AI分析被用户停止，未发出的批次已使用规则匹配")
+    return stats
+
+
+# -------------------- 采集同步分析（边采边分析） --------------------
+PIPELINE_MODES = {"不分析": (), "规则": ("rule",), "AI": ("ai",), "规则+AI": ("rule", "ai")}
+PIPELINE_QUEUE_SIZE = 64  # 待分析笔记队列上限，分析跟不上时采集端会等待
+_PIPELINE_DONE = object()
+
+
+class PipelineError(RuntimeError):
+    pass
+
+
+class SentimentPipeline:
+    """
+    采集时同步做情绪分析：采集线程每写完一条笔记就 submit，后台线程取出后
+    分析并追加写入 {结果文件名}_sentiment_rule.csv / _sentiment_ai.csv，
+    采集结束 close() 时只需处理最后几条笔记
+    传入 model（LocalSentimentModel）时 "ai" 环节改用本地模型离线标注，写入 _sentiment_local.csv
+    后台线程出错停止后（如输出文件无法创建），继续丢弃提交的笔记保证采集端不阻塞，submit/close 抛出 PipelineError
+    """
+
+    def __init__(self, json_path, modes, analyzer=None, lexicon=None, columnar=None, triage_threshold=None,
+                 chunk_size=SENTIMENT_CHUNK_SIZE, store=None, dedup=None, model=None):
+        json_path = Path(json_path)
+        self.modes = tuple(m for m in modes if m != "ai" or analyzer is not None or model is not None)
+        self.paths = {"rule": json_path.with_name(json_path.stem + "_sentiment_rule.csv"),
+                      "ai": json_path.with_name(json_path.stem + ("_sentiment_local.csv" if model is not None
+                                                                  else "_sentiment_ai.csv"))}
+        self.run_id = json_path.stem
+        self.analyzer = analyzer
+        self.model = model
+        self.lexicon = lexicon
+        self.columnar = columnar
+        self.triage_threshold = triage_threshold
+        self.chunk_size = chunk_size
+        self.store = store  # ResultStore，提交时带笔记 id 的AI标签同时写入结果库
+        self.dedup = dedup  # NearDuplicateIndex，每批先入索引再打近重复/刷屏标记
+        self.stats = {"notes": 0, "rule": 0, "ai": 0, "cached": 0, "local": 0, "spam": 0, "fallback": 0,
+                      "model": 0}
+        self.error = None  # 后台线程停止的原因
+        self._queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._memo = {}
+        self._got_done = False
+        self._thread = threading.Thread(target=self._worker, name="sentiment-pipeline", daemon=True)
+        self._thread.start()
+
+    def submit(self, info, note_id=None):
+        """提交一条笔记记录（与结果文件中的结构相同），note_id 为该笔记在结果库中的 id"""
+        if self.error is not None:
+            raise PipelineError(f"同步情绪分析已停止：{self.error}") from self.error
+        self._queue.put((info, note_id))
+
+    def close(self, timeout=None):
+        """通知后台线程收尾，等待剩余笔记分析完成并关闭文件，返回统计"""
+        self._queue.put(_PIPELINE_DONE)
+        self._thread.join(timeout)
+        if self.error is not None:
+            raise PipelineError(f"同步情绪分析已停止：{self.error}") from self.error
+        return self.stats
+
+    def _next_posts(self):
+        """阻塞取一条，再顺带取走已排队的笔记凑成一批，评论数达到 chunk_size 为止"""
+        posts = [self._queue.get()]
+        comments = len(posts[0][0].get("评论", [])) if posts[0] is not _PIPELINE_DONE else 0
+        while posts[-1] is not _PIPELINE_DONE and comments < self.chunk_size:
+            try:
+                posts.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if posts[-1] is not _PIPELINE_DONE:
+                comments += len(posts[-1][0].get("评论", []))
+        done = posts[-1] is _PIPELINE_DONE
+        self._got_done = done
+        return (posts[:-1] if done else posts), done
+
+    def _worker(self):
+        try:
+            self._run()
+        except Exception as e:
+            self.error = e
+            logging.error(f"同步情绪分析已停止：{e}")
+            # 丢弃之后提交的笔记直到 close，采集端不会因队列满而阻塞
+            while not self._got_done:
+                self._got_done = self._queue.get() is _PIPELINE_DONE
+
+    def _run(self):
+        columns = {"rule": with_dup_columns(RULE_CSV_COLUMNS, self.dedup),
+                   "ai": with_dup_columns(AI_CSV_COLUMNS, self.dedup)}
+        with contextlib.ExitStack() as stack:
+            files, writers = {}, {}
+            for mode in self.modes:
+                files[mode] = stack.enter_context(open(self.paths[mode], "w", encoding="utf-8-sig", newline=""))
+                pd.DataFrame(columns=columns[mode]).to_csv(files[mode], index=False)
+                writer = open_columnar(self.paths[mode], self.columnar, columns[mode], self.run_id)
+                if writer:
+                    writers[mode] = stack.enter_context(writer)
+
+            done = False
+            while not done:
+                posts, done = self._next_posts()
+                if not posts:
+                    continue
+                self.stats["notes"] += len(posts)
+                try:
+                    self._process(posts, files, writers)
+                except Exception as e:
+                    logging.error(f"同步情绪分析失败（{len(posts)} 条笔记已跳过）：{e}")
+        if self.dedup:
+            self.dedup.finish_run(self.run_id)
+        for mode in self.modes:
+            logging.info(f"✅ 同步情绪分析结果 → {self.paths[mode]}")
+
+    def _process(self, items, files, writers):
+        posts = [info for info, _ in items]
+        if self.dedup:
+            self.dedup.ingest(c for post in posts for c in post.get("评论", []))
+        if "rule" in self.modes:
+            rows = list(iter_comment_rows(posts))
+            if rows:
+                df = rule_sentiment_frame(rows, self.lexicon)
+                if self.dedup:
+                    add_dup_columns(df, self.dedup.annotate(rows))
+                df.to_csv(files["rule"], index=False, header=False)
+                files["rule"].flush()
+                if "rule" in writers:
+                    writers["rule"].write(df)
+                self.stats["rule"] += len(df)
+        if "ai" in self.modes:
+            rows = list(iter_comment_rows(posts, skip_empty=True))
+            if rows:
+                if self.dedup:
+                    self.dedup.annotate(rows)
+                if self.model is not None:
+                    df = local_sentiment_frame(rows, self.model, self.lexicon)
+                else:
+                    df = ai_sentiment_frame(rows, self.analyzer, self.lexicon, self._memo,
+                                            triage_threshold=self.triage_threshold)
+                if self.dedup:
+                    add_dup_columns(df, rows)
+                df.to_csv(files["ai"], index=False, header=False)
+                files["ai"].flush()
+                if "ai" in writers:
+                    writers["ai"].write(df)
+                if self.model is not None:
+                    self.stats["model"] += len(df)
+                else:
+                    for m in df["分析方法"]:
+                        self.stats[METHOD_STATS.get(m, "fallback")] += 1
+                if self.store:
+                    self.store.add_ai_labels(
+                        (items[r.note.index][1], r.index, label, method)
+                        for r, label, method in zip(rows, df["sentiment"], df["分析方法"])
+                        if items[r.note.index][1] is not None)
+
+
+# -------------------- 本地情绪分类器（从AI标签蒸馏） --------------------
+LOCAL_MODEL_FILE = "local_sentiment_model.json"
+LOCAL_MODEL_METHOD = "本地模型"
+LOCAL_MODEL_TEST_RATIO = 0.1  # 留出集比例（按文本哈希固定划分）
+
+
+class LocalSentimentModel:
+    """
+    字符 1-3 gram 多项式朴素贝叶斯（对数空间下是线性模型），纯 CPU、无额外依赖
+    每个 n-gram 存三类对数概率，预测时一次字典查找累加，单线程每分钟可处理数十万条
+    """
+    LABELS = ("正向", "负向", "中性")
+    NGRAM = (1, 3)
+
+    def __init__(self, log_prior, weights, unseen, meta=None):
+        self.log_prior = list(log_prior)
+        self.weights = weights  # n-gram -> [三类对数概率]
+        self.unseen = list(unseen)  # 未登录 n-gram 的三类对数概率
+        self.meta = meta or {}
+
+    @classmethod
+    def features(cls, text):
+        text = normalize_comment(text)
+        lo, hi = cls.NGRAM
+        return [text[i:i + n] for n in range(lo, hi + 1) for i in range(len(text) - n + 1)]
+
+    @classmethod
+    def train(cls, samples, alpha=1.0, min_count=2):
+        """samples 为 [(文本, 标签)]，出现次数少于 min_count 的 n-gram 不入模型"""
+        doc_count = [0] * len(cls.LABELS)
+        counts = {}
+        for text, label in samples:
+            k = cls.LABELS.index(label)
+            doc_count[k] += 1
+            for g in cls.features(text):
+                row = counts.get(g)
+                if row is None:
+                    row = counts[g] = [0] * len(cls.LABELS)
+                row[k] += 1
+        counts = {g: row for g, row in counts.items() if sum(row) >= min_count}
+        totals = [sum(row[k] for row in counts.values()) for k in range(len(cls.LABELS))]
+        vocab = len(counts) + 1
+        denom = [math.log(totals[k] + alpha * vocab) for k in range(len(cls.LABELS))]
+        n_docs = sum(doc_count)
+        log_prior = [math.log((doc_count[k] + 1) / (n_docs + len(cls.LABELS))) for k in range(len(cls.LABELS))]
+        weights = {g: [math.log(row[k] + alpha) - denom[k] for k in range(len(cls.LABELS))]
+                   for g, row in counts.items()}
+        unseen = [math.log(alpha) - denom[k] for k in range(len(cls.LABELS))]
+        meta = {"samples": n_docs, "vocab": len(counts), "trained_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        return cls(log_prior, weights, unseen, meta)
+
+    def predict(self, text):
+        """返回 (标签, 概率)"""
+        scores = list(self.log_prior)
+        weights, unseen = self.weights, self.unseen
+        for g in self.features(text):
+            w = weights.get(g, unseen)
+            scores[0] += w[0]
+            scores[1] += w[1]
+            scores[2] += w[2]
+        top = max(scores)
+        exp = [math.exp(s - top) for s in scores]
+        k = exp.index(1.0)
+        return self.LABELS[k], 1.0 / sum(exp)
+
+    def save(self, path):
+        data = {"labels": self.LABELS, "log_prior": self.log_prior, "unseen": self.unseen,
+                "weights": self.weights, "meta": self.meta}
+        tmp = Path(path).with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = json.loads(Path(path).read_text(encoding="utf8"))
+        if tuple(data["labels"]) != cls.LABELS:
+            raise ValueError("模型标签与当前版本不一致，请重新训练")
+        return cls(data["log_prior"], data["weights"], data["unseen"], data.get("meta"))
+
+
+def split_holdout(samples, ratio=LOCAL_MODEL_TEST_RATIO):
+    """按文本哈希划分训练集/留出集，同一文本总落在同一侧"""
+    train, test = [], []
+    bound = int(ratio * 1000)
+    for text, label in samples:
+        bucket = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16) % 1000
+        (test if bucket < bound else train).append((text, label))
+    return train, test
+
+
+def evaluate_local_model(model, samples):
+    """在留出集上评估，返回报告文本"""
+    labels = LocalSentimentModel.LABELS
+    confusion = {t: {p: 0 for p in labels} for t in labels}
+    start = time.perf_counter()
+    for text, label in samples:
+        confusion[label][model.predict(text)[0]] += 1
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    total = len(samples)
+    correct = sum(confusion[t][t] for t in labels)
+    lines = [f"留出集: {total} 条 (训练集 {model.meta.get('samples', 0)} 条，特征 {model.meta.get('vocab', 0)} 个)",
+             f"准确率: {correct / total:.2%}" if total else "准确率: -",
+             f"预测速度: {total / elapsed * 60:,.0f} 条/分钟", "",
+             "标签    精确率   召回率   F1      样本数"]
+    for t in labels:
+        tp = confusion[t][t]
+        predicted = sum(confusion[x][t] for x in labels)
+        actual = sum(confusion[t].values())
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / actual if actual else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        lines.append(f"{t}    {precision:.2%}   {recall:.2%}   {f1:.2%}   {actual}")
+    lines += ["", "混淆矩阵（行=AI标签，列=模型预测）:", "        " + "  ".join(labels)]
+    for t in labels:
+        lines.append(f"{t}    " + "  ".join(f"{confusion[t][p]:>4}" for p in labels))
+    return "\n".join(lines)
+
+
+def train_local_model(cache_path, model_path):
+    """从AI标签缓存训练本地模型并保存，评估报告写到模型旁边，返回报告文本"""
+    conn = sqlite3.connect(str(cache_path))
+    try:
+        samples = [(t, l) for t, l in conn.execute("SELECT text, label FROM label_cache")
+                   if t and l in LocalSentimentModel.LABELS]
+    finally:
+        conn.close()
+    if len(samples) < 50:
+        raise ValueError(f"AI标签样本过少（{len(samples)} 条），请先用AI情绪分析积累标签")
+    train, test = split_holdout(samples)
+    model = LocalSentimentModel.train(train)
+    model.save(model_path)
+    report = evaluate_local_model(model, test)
+    Path(model_path).with_name(Path(model_path).stem + "_report.txt").write_text(report, encoding="utf8")
+    return report
+
+
+def local_sentiment_frame(rows, model, lexicon=None):
+    """对一块 CommentRow 用本地模型标注，返回与AI情绪CSV同列的 DataFrame"""
+    df = comment_frame(rows)
+    df["clean"] = df["评论内容"].apply(clean)
+    df["score"] = df["评论内容"].apply(lambda x: score_sent(x, lexicon))
+    df["sentiment"] = df["评论内容"].apply(lambda x: model.predict(x)[0])
+    df["分析方法"] = LOCAL_MODEL_METHOD
+    return df
+
+
+def write_local_sentiment_csv(json_path, csv_path, model, lexicon=None, chunk_size=SENTIMENT_CHUNK_SIZE,
+                              columnar=None, dedup=None, progress=None):
+    """本地模型情绪分析：流式读取、分块预测并追加写入CSV，返回写入的评论数，progress(已写入条数) 在每块写完后回调"""
+    total = 0
+    columns = with_dup_columns(AI_CSV_COLUMNS, dedup)
+    if dedup:
+        dedup.ingest_file(json_path)
+    writer = open_columnar(csv_path, columnar, columns, result_stem(json_path))
+    with archive_hold(csv_path), open(csv_path, "w", encoding="utf-8-sig", newline="") as f, \
+            (writer or contextlib.nullcontext()):
+        for rows in iter_chunks(iter_comment_rows(iter_posts(json_path), skip_empty=True), chunk_size):
+            df = local_sentiment_frame(rows, model, lexicon)
+            if dedup:
+                add_dup_columns(df, dedup.annotate(rows))
+            df.to_csv(f, index=False, header=(total == 0))
+            if writer:
+                writer.write(df)
+            total += len(df)
+            if progress:
+                progress(total)
+        if total == 0:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+    return total
+
+
+# -------------------- 列式导出（Parquet / Arrow IPC，可选） --------------------
+EXPORT_FORMATS = {"仅CSV": None, "CSV+Parquet": "parquet", "CSV+Arrow": "arrow"}
+PYARROW_MISSING = "导出 Parquet/Arrow 需要 pyarrow，当前环境未安装：请执行 pip install pyarrow 后重启程序"
+COLUMNAR_SUFFIX = {"parquet": ".parquet", "arrow": ".arrows"}
+
+
+def _columnar_schema(columns):
+    """标题、作者、run_id 等重复度高的列使用字典编码"""
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    types = {
+        "run_id": dict_str, "标题": dict_str, "作者": dict_str, "sentiment": dict_str, "分析方法": dict_str,
+        "点赞数": pa.int64(), "收藏数": pa.int64(), "评论数": pa.int64(), "score": pa.int64(),
+        "帖子索引": pa.int32(), "评论索引": pa.int32(), "重复簇": pa.int64(), "簇大小": pa.int64(),
+        "疑似刷屏": pa.bool_(),
+    }
+    return pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+
+class ColumnarWriter:
+    """
+    分块写出列式文件：每个分块写成一个 Parquet 行组 / Arrow 记录批
+    每个文件对应一次采集，run_id 列为结果文件名，便于看板把多次采集当作一个数据集查询
+    Arrow 使用 IPC 流格式（.arrows），允许各记录批使用各自的字典
+    """
+
+    def __init__(self, path, fmt, columns, run_id):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError(PYARROW_MISSING)
+        self.path = Path(path)
+        self.run_id = run_id
+        self.columns = ["run_id"] + list(columns)
+        self.schema = _columnar_schema(self.columns)
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(str(self.path), self.schema, compression="zstd")
+        elif fmt == "arrow":
+            self._writer = pa.ipc.new_stream(str(self.path), self.schema)
+        else:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+
+    def write(self, df):
+        df = df.assign(run_id=self.run_id)[self.columns]
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_columnar(base_path, fmt, columns, run_id):
+    """按格式打开列式写出器，fmt 为 None 时返回 None"""
+    if not fmt:
+        return None
+    return ColumnarWriter(Path(base_path).with_suffix(COLUMNAR_SUFFIX[fmt]), fmt, columns, run_id)
+
+
+RAW_COLUMNS = ["帖子索引", "标题", "作者", "点赞数", "收藏数", "评论数", "url", "采集时间", "评论索引", "评论内容"]
+
+
+def export_raw_columnar(json_path, fmt, chunk_size=SENTIMENT_CHUNK_SIZE):
+    """把原始结果文件按评论展开导出为 Parquet/Arrow，返回 (导出路径, 评论条数)"""
+    json_path = Path(json_path)
+
+    def rows():
+        for post_idx, post in enumerate(iter_posts(json_path)):
+            for comment_idx, c in enumerate(post.get("评论", [])):
+                yield (post_idx, post.get("标题", ""), post.get("作者", ""), post.get("点赞数", 0),
+                       post.get("收藏数", 0), post.get("评论数", 0), post.get("url", ""),
+                       post.get("采集时间", ""), comment_idx, c)
+
+    total = 0
+    writer = open_columnar(plain_path(json_path), fmt, RAW_COLUMNS, result_stem(json_path))
+    with writer:
+        for chunk in iter_chunks(rows(), chunk_size):
+            writer.write(pd.DataFrame(chunk, columns=RAW_COLUMNS))
+            total += len(chunk)
+    return writer.path, total
+
+
+# -------------------- 运行统计（采集时增量维护） --------------------
+RUN_STATS_SUFFIX = ".stats.json"
+BLOOM_BITS = 1 << 24  # 重复评论检测的布隆过滤器位数（2MB），百万条评论误判率约 0.1%
+BLOOM_HASHES = 5
+RUN_STATS_SAVE_EVERY = 20  # 采集时每 N 条笔记保存一次统计文件，采集结束时再保存一次
+
+
+class BloomFilter:
+    """定长布隆过滤器，内存占用与评论数无关"""
+
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(bits // 8)
+
+    def add(self, text):
+        """加入 text，返回加入前是否（可能）已存在"""
+        digest = hashlib.blake2b(text.encode("utf8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        present = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.array[byte] & mask:
+                present = False
+                self.array[byte] |= mask
+        return present
+
+
+class RunStats:
+    """
+    单次采集的统计，每写入一条笔记更新一次，定期和采集结束时保存到 {结果文件名}.stats.json
+    重复评论按全文哈希在布隆过滤器中判断（近似值），统计本身只占固定内存；
+    过滤器在第一次加入评论时才分配，只读取统计文件（load、批次目录扫描）时不占这 2MB
+    """
+    FIELDS = ("notes", "comments", "empty_comments", "duplicate_comments", "likes", "collects",
+              "reported_comments", "max_note_comments")
+
+    def __init__(self, json_path):
+        self.json_path = Path(json_path)
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.updated_at = self.started_at
+        self._seen = None
+
+    @staticmethod
+    def stats_path(json_path):
+        return plain_path(json_path).with_name(result_stem(json_path) + RUN_STATS_SUFFIX)
+
+    def add_note(self, info):
+        c = self.counts
+        comments = info.get("评论", [])
+        c["notes"] += 1
+        c["comments"] += len(comments)
+        c["likes"] += info.get("点赞数", 0) or 0
+        c["collects"] += info.get("收藏数", 0) or 0
+        c["reported_comments"] += info.get("评论数", 0) or 0
+        c["max_note_comments"] = max(c["max_note_comments"], len(comments))
+        for text in comments:
+            if not text.strip():
+                c["empty_comments"] += 1
+                continue
+            if self._seen is None:
+                self._seen = BloomFilter()
+            if self._seen.add(text):
+                c["duplicate_comments"] += 1
+        self.updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def save(self):
+        data = {"file": self.json_path.name, "started_at": self.started_at, "updated_at": self.updated_at,
+                **self.counts}
+        path = self.stats_path(self.json_path)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, json_path):
+        """读取统计文件，不存在或损坏时返回 None"""
+        try:
+            data = json.loads(cls.stats_path(json_path).read_text(encoding="utf8"))
+        except (OSError, ValueError):
+            return None
+        stats = cls(json_path)
+        stats.counts.update({k: data.get(k, 0) for k in cls.FIELDS})
+        stats.started_at = data.get("started_at", "")
+        stats.updated_at = data.get("updated_at", "")
+        return stats
+
+    @classmethod
+    def rebuild(cls, json_path):
+        """从结果文件流式重建统计（用于没有统计文件的旧结果）"""
+        stats = cls(json_path)
+        for post in iter_posts(json_path):
+            stats.add_note(post)
+        stats.save()
+        return stats
+
+    def report(self):
+        c = self.counts
+        notes = c["notes"] or 1
+        lines = [
+            f"JSON文件: {self.json_path.name}",
+            f"采集时间: {self.started_at} ~ {self.updated_at}",
+            f"帖子总数: {c['notes']}",
+            f"总评论数: {c['comments']}（平均每帖 {c['comments'] / notes:.1f}，最多 {c['max_note_comments']}）",
+            f"空评论数: {c['empty_comments']}",
+            f"重复评论数: {c['duplicate_comments']}（约值）",
+            f"去重后评论数: {c['comments'] - c['empty_comments'] - c['duplicate_comments']}（约值）",
+            f"页面显示评论数合计: {c['reported_comments']}",
+            f"点赞合计: {c['likes']}，收藏合计: {c['collects']}",
+        ]
+        if c["reported_comments"]:
+            lines.append(f"评论采集覆盖率: {c['comments'] / c['reported_comments']:.1%}")
+        return "\n".join(lines)
+
+
+# -------------------- 采集批次目录 --------------------
+RUNS_CATALOG_FILE = "runs_catalog.json"
+LATEST_RUN_CHOICE = "最新一次采集"
+RESULT_FILE_GLOB = "*_comments_*.json*"  # 含压缩归档后的 .json.gz / .json.zst
+RUN_STALE_HOURS = 24  # 无法确认进程状态的“采集中”条目（旧条目或其他电脑的采集），开始超过该时长视为异常退出
+
+
+def pid_alive(pid):
+    """进程是否仍在运行；Windows 上 os.kill 会直接结束进程，改为查询进程退出码"""
+    if sys.platform == "win32":
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class RunCatalog:
+    """
+    保存路径下的批次目录 runs_catalog.json：每次采集的关键词、起止时间、状态、结果文件名和统计汇总
+    由 XHSScraper 在采集开始和结束时各更新一次（采集中的实时统计见 .stats.json），工具按目录选择输入，不需要扫描目录或解析结果文件
+    采集开始时记录进程号和主机名；程序崩溃后遗留的“采集中”条目在读取时标记为 failed，统计取自最后一次保存的 .stats.json
+    """
+    _lock = threading.Lock()
+    _active = set()  # 本进程中正在采集的批次
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / RUNS_CATALOG_FILE
+
+    def _read(self):
+        try:
+            return json.loads(self.path.read_text(encoding="utf8")).get("runs", [])
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, runs):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": 1, "runs": runs}, ensure_ascii=False, indent=2), encoding="utf8")
+        os.replace(tmp, self.path)
+
+    def update(self, run_id, **fields):
+        """新增或更新一个批次的条目"""
+        if "status" in fields:
+            (self._active.add if fields["status"] == "running" else self._active.discard)(run_id)
+        with self._lock:
+            runs = self._read()
+            if runs is None:
+                runs = self._scan()
+            for entry in runs:
+                if entry["run_id"] == run_id:
+                    entry.update(fields)
+                    break
+            else:
+                runs.append({"run_id": run_id, **fields})
+            self._write(runs)
+
+    def _scan(self):
+        """目录文件不存在时（旧版本的采集结果）扫描一次结果文件，统计取自 .stats.json，不解析结果文件"""
+        runs = []
+        for path in self.folder.glob(RESULT_FILE_GLOB):
+            if plain_path(path).suffix != ".json" or path.name.endswith(RUN_STATS_SUFFIX):
+                continue
+            stats = RunStats.load(path)
+            mtime = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                started = datetime.strptime(result_stem(path).rsplit("_comments_", 1)[1], "%Y%m%d_%H%M%S")
+                started = started.strftime("%Y-%m-%d %H:%M:%S")
+            except (IndexError, ValueError):
+                started = stats.started_at if stats else mtime
+            runs.append({"run_id": result_stem(path), "keyword": keyword_from_result(path), "file": path.name,
+                         "started_at": started,
+                         "finished_at": stats.updated_at if stats else mtime, "status": "complete",
+                         "totals": stats.counts if stats else None})
+        return runs
+
+    def _is_stale(self, entry, now):
+        """“采集中”的条目对应的采集是否已经不在运行"""
+        if entry.get("status") != "running" or entry["run_id"] in self._active:
+            return False
+        pid = entry.get("pid")
+        if pid is not None and entry.get("host") == platform.node():
+            return pid == os.getpid() or not pid_alive(pid)
+        try:
+            started = datetime.strptime(entry.get("started_at", ""), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return True
+        return now - started > timedelta(hours=RUN_STALE_HOURS)
+
+    def _mark_failed(self, runs):
+        """把已不在运行的“采集中”条目标记为 failed，返回是否有改动"""
+        now = datetime.now()
+        stale = [entry for entry in runs if self._is_stale(entry, now)]
+        for entry in stale:
+            entry["status"] = "failed"
+            stats = RunStats.load(self.folder / entry["file"]) if entry.get("file") else None
+            if stats:
+                entry["finished_at"] = stats.updated_at
+                entry["totals"] = stats.counts
+            logging.warning(f"批次 {entry['run_id']} 未正常结束（采集进程已退出），已标记为异常退出")
+        return bool(stale)
+
+    def runs(self):
+        """
+        按开始时间从新到旧返回结果文件仍存在的批次；首次使用时扫描目录生成目录文件
+        异常退出后遗留的“采集中”条目在这里标记为 failed 并写回
+        """
+        with self._lock:
+            runs = self._read()
+            if runs is None:
+                runs = self._scan()
+                if runs:
+                    self._write(runs)
+            elif self._mark_failed(runs):
+                self._write(runs)
+        runs = [r for r in runs if r.get("file") and (self.folder / r["file"]).exists()]
+        return sorted(runs, key=lambda r: r.get("started_at", ""), reverse=True)
+
+    def archive(self, suffix, log=None):
+        """
+        压缩已结束批次的结果文件和情绪CSV，返回压缩的文件数（由后台线程调用）
+        采集中的批次和正在写出的文件跳过；原文件删除失败（如 Windows 上正被打开）时保留原文件，下次再压缩
+        """
+        done = 0
+        with _archive_lock:
+            for entry in self.runs():
+                if entry.get("status") == "running":
+                    continue
+                path = self.folder / entry["file"]
+                stem = result_stem(path)
+                for src in [path] + [self.folder / (stem + s) for s in ARCHIVE_CSV_SUFFIXES]:
+                    if src.suffix in COMPRESSED_SUFFIXES or not src.exists() or archive_busy(src):
+                        continue
+                    src_stat = src.stat()
+                    dst = compress_file(src, suffix)
+                    # 先删原文件再改索引：删除失败时索引仍指向原文件，不会被改成已删除的压缩文件
+                    try:
+                        src.unlink()
+                    except OSError:
+                        dst.unlink()
+                        continue
+                    if src == path:
+                        ResultIndex.carry_over(src, dst, src_stat)
+                    for other in COMPRESSED_SUFFIXES:
+                        if other != suffix:
+                            src.with_name(src.name + other).unlink(missing_ok=True)
+                    if src == path:
+                        self.update(entry["run_id"], file=dst.name)
+                    done += 1
+                    if log:
+                        log(f"已压缩 {src.name}: {src_stat.st_size / 1e6:.1f}MB -> {dst.stat().st_size / 1e6:.1f}MB")
+        return done
+
+    def latest(self, keyword=None):
+        for entry in self.runs():
+            if keyword is None or entry.get("keyword") == keyword:
+                return entry
+        return None
+
+    @staticmethod
+    def describe(entry):
+        totals = entry.get("totals") or {}
+        summary = f"{totals.get('notes', '?')}笔记/{totals.get('comments', '?')}评论"
+        status = {"running": " [采集中]", "interrupted": " [已中断]", "failed": " [异常退出]"}.get(entry.get("status"), "")
+        return f"{entry.get('keyword', '')} | {entry.get('started_at', '')[:16]} | {summary}{status}"
+
+
+# -------------------- SQLite 结果库与全文检索 --------------------
+RESULT_DB_FILE = "xhs_results.sqlite3"
+RESULT_SEARCH_LIMIT = 500
+FTS_MIN_QUERY_CHARS = 3  # trigram 分词要求每个检索词至少 3 个字，更短的检索词走二元组索引
+_BIGRAM_RUN_RE = re.compile(r"[^\W_]+")  # 二元组只在连续的文字/数字内切分，与 unicode61 分词的词边界一致
+
+
+def comment_bigrams(text: str) -> str:
+    """
+    二元组索引的文档：每段连续文字的相邻两字各成一词，每段末字单独成词，空格分隔
+    2 字检索词按词精确匹配，1 字检索词按前缀匹配（每个字要么是某个二元组的首字，要么是段末字）
+    """
+    grams = []
+    for run in _BIGRAM_RUN_RE.findall(text):
+        grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+        grams.append(run[-1])
+    return " ".join(grams)
+
+
+def _fts_phrase(term, prefix=False):
+    return '"' + term.replace('"', '""') + '"' + ("*" if prefix else "")
+
+
+class ResultStore:
+    """
+    所有采集结果汇总到一个 SQLite 库（WAL 模式）：runs / notes / comments / sentiments 四张表，
+    评论文本建 FTS5 trigram 索引，中文子串检索不需要分词；trigram 不支持 1~2 字的检索词，
+    另建一个只存二元组的无内容 FTS5 表（见 comment_bigrams）覆盖短检索词；SQLite 不支持 FTS5 时退化为 LIKE
+    每条笔记的评论与规则情绪在一个事务中批量写入，跟得上采集速度
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY, keyword TEXT, started_at TEXT, complete INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY, run_id TEXT REFERENCES runs(run_id), seq INTEGER, keyword TEXT,
+                title TEXT, author TEXT, likes INTEGER, collects INTEGER, reported_comments INTEGER,
+                url TEXT, scraped_at TEXT, UNIQUE(run_id, seq));
+            CREATE INDEX IF NOT EXISTS idx_notes_keyword ON notes(keyword, scraped_at);
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY, note_id INTEGER REFERENCES notes(id), seq INTEGER, text TEXT,
+                UNIQUE(note_id, seq));
+            CREATE TABLE IF NOT EXISTS sentiments (
+                comment_id INTEGER REFERENCES comments(id), source TEXT, label TEXT, method TEXT,
+                PRIMARY KEY(comment_id, source));
+        """)
+        try:
+            had_bigrams = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name='comments_bigram'").fetchone() is not None
+            self.conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+                    text, content='comments', content_rowid='id', tokenize='trigram');
+                CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+                    INSERT INTO comments_fts(rowid, text) VALUES (new.id, new.text);
+                END;
+                CREATE VIRTUAL TABLE IF NOT EXISTS comments_bigram USING fts5(
+                    grams, content='', tokenize='unicode61');
+            """)
+            self.fts = True
+            if not had_bigrams:
+                # 旧版本建的库：为已有评论补建二元组索引
+                self._index_bigrams(self.conn.execute("SELECT id, text FROM comments"))
+        except sqlite3.OperationalError:
+            logging.warning("当前 SQLite 不支持 FTS5 trigram，全文检索将使用 LIKE（较慢）")
+            self.fts = False
+        self.conn.commit()
+
+    def _index_bigrams(self, rows):
+        """rows 为 [(评论id, 文本)]，调用方负责事务"""
+        self.conn.executemany("INSERT INTO comments_bigram(rowid, grams) VALUES (?, ?)",
+                              ((cid, comment_bigrams(text)) for cid, text in rows))
+
+    def begin_run(self, run_id, keyword):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO runs(run_id, keyword, started_at) VALUES (?, ?, ?)",
+                              (run_id, keyword, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def finish_run(self, run_id):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE runs SET complete=1 WHERE run_id=?", (run_id,))
+
+    def has_run(self, run_id):
+        with self._lock:
+            row = self.conn.execute("SELECT complete FROM runs WHERE run_id=?", (run_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _note_id(self, run_id, seq):
+        row = self.conn.execute("SELECT id FROM notes WHERE run_id=? AND seq=?", (run_id, seq)).fetchone()
+        return row[0] if row else None
+
+    def add_note(self, run_id, keyword, seq, info, lexicon=None):
+        """写入一条笔记及其评论、规则情绪，返回笔记 id；同一 run 的同一序号重复写入时忽略（不再打分）"""
+        with self._lock:
+            note_id = self._note_id(run_id, seq)
+        if note_id is not None:
+            return note_id
+        comments = info.get("评论", [])
+        rule_labels = [label_sent(rule_score(c, lexicon)) for c in comments]
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO notes(run_id, seq, keyword, title, author, likes, collects, "
+                "reported_comments, url, scraped_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, seq, keyword, info.get("标题", ""), info.get("作者", ""), info.get("点赞数", 0),
+                 info.get("收藏数", 0), info.get("评论数", 0), info.get("url", ""), info.get("采集时间", "")))
+            if not cur.rowcount:
+                return self._note_id(run_id, seq)
+            note_id = cur.lastrowid
+            self.conn.executemany("INSERT INTO comments(note_id, seq, text) VALUES (?, ?, ?)",
+                                  [(note_id, i, c) for i, c in enumerate(comments)])
+            ids = dict(self.conn.execute("SELECT seq, id FROM comments WHERE note_id=?", (note_id,)))
+            if self.fts:
+                self._index_bigrams((ids[i], c) for i, c in enumerate(comments))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sentiments(comment_id, source, label, method) VALUES (?, 'rule', ?, '规则匹配')",
+                [(ids[i], label) for i, label in enumerate(rule_labels)])
+        return note_id
+
+    def add_ai_labels(self, labels):
+        """labels 为 [(笔记id, 评论序号, 标签, 分析方法)]"""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sentiments(comment_id, source, label, method) "
+                "SELECT id, 'ai', ?, ? FROM comments WHERE note_id=? AND seq=?",
+                [(label, method, note_id, seq) for note_id, seq, label, method in labels])
+
+    def add_run_ai_labels(self, run_id, labels):
+        """按结果文件中的位置写入AI标签，labels 为 [(笔记序号, 评论序号, 标签, 分析方法)]；未导入的笔记忽略"""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sentiments(comment_id, source, label, method) "
+                "SELECT c.id, 'ai', ?, ? FROM comments c JOIN notes n ON n.id = c.note_id "
+                "WHERE n.run_id=? AND n.seq=? AND c.seq=?",
+                [(label, method, run_id, note_seq, seq) for note_seq, seq, label, method in labels])
+
+    def import_result_file(self, json_path, lexicon=None, stop_event=None):
+        """
+        把一个已有结果文件导入结果库，已完整导入过的跳过，返回导入的笔记数
+        stop_event 置位后中止，该批次不标记为完整，下次导入时已写入的笔记会被忽略
+        """
+        json_path = Path(json_path)
+        run_id = result_stem(json_path)
+        if self.has_run(run_id):
+            return 0
+        keyword = keyword_from_result(json_path)
+        self.begin_run(run_id, keyword)
+        with self._lock:
+            done = self.conn.execute("SELECT COUNT(*) FROM notes WHERE run_id=?", (run_id,)).fetchone()[0]
+        # 笔记按序号依次写入，已写入的前缀（上次中止或采集时已写入）直接跳过
+        n = done
+        for n, post in enumerate(itertools.islice(iter_posts(json_path), done, None), done + 1):
+            if stop_event is not None and stop_event.is_set():
+                return n - 1 - done
+            self.add_note(run_id, keyword, n - 1, post, lexicon)
+        self.finish_run(run_id)
+        return n - done
+
+    def search(self, query="", sentiment=None, keyword=None, since=None, limit=RESULT_SEARCH_LIMIT):
+        """
+        检索评论，query 中空格分隔的词全部命中才返回；sentiment 优先按AI标签、没有时按规则标签过滤
+        返回 [(关键词, 采集时间, 标题, 作者, 评论, 情绪, 分析方法)]
+        """
+        sql = ["SELECT n.keyword, n.scraped_at, n.title, n.author, c.text,",
+               "       COALESCE(ai.label, rule.label), COALESCE(ai.method, rule.method)",
+               "FROM comments c JOIN notes n ON n.id = c.note_id",
+               "LEFT JOIN sentiments ai ON ai.comment_id = c.id AND ai.source = 'ai'",
+               "LEFT JOIN sentiments rule ON rule.comment_id = c.id AND rule.source = 'rule'"]
+        where, params = [], []
+        terms = query.split()
+        fts_terms = [t for t in terms if self.fts and len(t) >= FTS_MIN_QUERY_CHARS]
+        bigram_terms = [t for t in terms if self.fts and len(t) < FTS_MIN_QUERY_CHARS
+                        and _BIGRAM_RUN_RE.fullmatch(t)]
+        if fts_terms:
+            where.append("c.id IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)")
+            params.append(" ".join(_fts_phrase(t) for t in fts_terms))
+        if bigram_terms:
+            where.append("c.id IN (SELECT rowid FROM comments_bigram WHERE comments_bigram MATCH ?)")
+            params.append(" ".join(_fts_phrase(t, prefix=len(t) == 1) for t in bigram_terms))
+        for t in terms:
+            if t not in fts_terms and t not in bigram_terms:
+                where.append("c.text LIKE ? ESCAPE '\\'")
+                params.append("%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if sentiment:
+            where.append("COALESCE(ai.label, rule.label) = ?")
+            params.append(sentiment)
+        if keyword:
+            where.append("n.keyword = ?")
+            params.append(keyword)
+        if since:
+            where.append("n.scraped_at >= ?")
+            params.append(since)
+        if where:
+            sql.append("WHERE " + " AND ".join(where))
+        sql.append("ORDER BY n.scraped_at DESC, c.id LIMIT ?")
+        params.append(limit)
+        with self._lock:
+            return self.conn.execute("\n".join(sql), params).fetchall()
+
+    def keywords(self):
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT keyword FROM runs ORDER BY keyword")]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# -------------------- 热词与共现聚合（jieba 分词，进程池） --------------------
+TERM_DB_FILE = "term_stats.sqlite3"
+TERM_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))  # 分词进程数，留一个核给界面和采集
+TERM_MAX_PENDING = TERM_WORKERS * 8  # 进程池中排队的任务数上限
+TERM_IMPORT_NOTES = 50  # 导入历史结果时每个分词任务包含的笔记数
+TERM_PAIR_MAX_TERMS = 8  # 每条评论只取前 N 个词统计共现，避免长评论产生过多词对
+TERM_TOP_LIMIT = 200
+TERM_DAY_RANGES = {"最近7天": 7, "最近30天": 30, "全部": None}
+TERM_PATTERN = re.compile(r"[一-龥A-Za-z][一-龥A-Za-z0-9]+")
+TERM_STOPWORDS = frozenset(
+    "我们 你们 他们 她们 自己 什么 怎么 这个 那个 这样 那样 就是 还是 但是 因为 所以 如果 可以 没有 不是 一个 一下 "
+    "一点 有点 真的 感觉 觉得 知道 现在 已经 还有 然后 而且 或者 时候 这么 那么 哈哈 哈哈哈 啊啊 姐妹 博主 楼主 回复 "
+    "请问 谢谢 求问 链接 评论".split())
+
+
+def _init_term_worker():
+    jieba.setLogLevel(logging.WARNING)
+    jieba.initialize()
+
+
+def tokenize_comments(texts):
+    """进程池任务：逐条评论分词，返回每条评论去重后的词列表（保持出现顺序）"""
+    result = []
+    for text in texts:
+        words = (w for w in jieba.lcut(clean(text)) if w not in TERM_STOPWORDS and TERM_PATTERN.fullmatch(w))
+        result.append(list(dict.fromkeys(words)))
+    return result
+
+
+class TermStats:
+    """
+    按关键词、按天累计的词频表和共现表（SQLite），采集时每条笔记增量更新，查询只做聚合不需要重新分词
+    词频按评论计数：一条评论里重复出现的词只计一次，并按该评论的规则情绪分开累计，便于找吐槽词/夸奖词
+    分词在进程池中进行；结果按提交顺序合并，term_runs.notes 记录每个批次已计入的笔记数，导入历史结果时从断点继续
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = collections.deque()  # (future, run_id, keyword, 笔记数, 每条评论的日期, 每条评论的情绪)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS term_runs (run_id TEXT PRIMARY KEY, keyword TEXT, notes INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS term_docs (
+                keyword TEXT, day TEXT, sentiment TEXT, comments INTEGER,
+                PRIMARY KEY(keyword, day, sentiment));
+            CREATE TABLE IF NOT EXISTS term_freq (
+                keyword TEXT, day TEXT, term TEXT, sentiment TEXT, count INTEGER,
+                PRIMARY KEY(keyword, day, term, sentiment)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS term_pairs (
+                keyword TEXT, day TEXT, a TEXT, b TEXT, count INTEGER,
+                PRIMARY KEY(keyword, day, a, b)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_term_freq_term ON term_freq(keyword, term, day);
+            CREATE INDEX IF NOT EXISTS idx_term_pairs_b ON term_pairs(keyword, b, day);
+        """)
+        self.conn.commit()
+
+    # ---- 写入 ----
+    def begin_run(self, run_id, keyword):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO term_runs(run_id, keyword) VALUES (?, ?)", (run_id, keyword))
+
+    def counted_notes(self, run_id):
+        with self._lock:
+            row = self.conn.execute("SELECT notes FROM term_runs WHERE run_id=?", (run_id,)).fetchone()
+        return row[0] if row else 0
+
+    def add_note(self, run_id, keyword, info, lexicon=None):
+        """提交一条笔记分词，不等待结果"""
+        self.add_notes(run_id, keyword, [info], lexicon)
+
+    def add_notes(self, run_id, keyword, infos, lexicon=None):
+        """
+        把一组笔记作为一个分词任务提交，不等待结果；已完成的任务按提交顺序写入，
+        排队过多时等待最早的任务
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(TERM_WORKERS, initializer=_init_term_worker)
+        comments, days = [], []
+        for info in infos:
+            day = (info.get("采集时间") or datetime.now().strftime("%Y-%m-%d"))[:10]
+            for c in info.get("评论", []):
+                if c and str(c).strip():
+                    comments.append(c)
+                    days.append(day)
+        labels = [label_sent(rule_score(c, lexicon)) for c in comments]
+        future = self._pool.submit(tokenize_comments, comments)
+        self._pending.append((future, run_id, keyword, len(infos), days, labels))
+        self._drain(block=len(self._pending) > TERM_MAX_PENDING)
+
+    def _drain(self, block=False):
+        while self._pending and (block or self._pending[0][0].done()):
+            future, *task = self._pending.popleft()
+            self._merge(*task, future.result())
+            block = block and len(self._pending) > TERM_MAX_PENDING
+
+    def _merge(self, run_id, keyword, notes, days, labels, term_lists):
+        freq, pairs, docs = collections.Counter(), collections.Counter(), collections.Counter(zip(days, labels))
+        for day, label, terms in zip(days, labels, term_lists):
+            terms = [t for t in terms if t != keyword]
+            for t in terms:
+                freq[day, t, label] += 1
+            for a, b in itertools.combinations(sorted(terms[:TERM_PAIR_MAX_TERMS]), 2):
+                pairs[day, a, b] += 1
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO term_docs VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(keyword, day, sentiment) DO UPDATE SET comments = comments + excluded.comments",
+                [(keyword, *k, n) for k, n in docs.items()])
+            self.conn.executemany(
+                "INSERT INTO term_freq VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(keyword, day, term, sentiment) DO UPDATE SET count = count + excluded.count",
+                [(keyword, *k, n) for k, n in freq.items()])
+            self.conn.executemany(
+                "INSERT INTO term_pairs VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(keyword, day, a, b) DO UPDATE SET count = count + excluded.count",
+                [(keyword, *k, n) for k, n in pairs.items()])
+            self.conn.execute("INSERT INTO term_runs(run_id, keyword, notes) VALUES (?, ?, ?) "
+                              "ON CONFLICT(run_id) DO UPDATE SET notes = notes + excluded.notes",
+                              (run_id, keyword, notes))
+
+    def flush(self):
+        """等待所有已提交的笔记写入"""
+        while self._pending:
+            self._drain(block=True)
+
+    def import_result_file(self, json_path, lexicon=None, stop_event=None):
+        """
+        把已有结果文件计入统计，跳过该批次已计入的笔记，返回新计入的笔记数
+        stop_event 置位后不再提交新的分词任务，已提交的照常写入，下次导入从中断处继续
+        """
+        run_id = result_stem(json_path)
+        keyword = keyword_from_result(json_path)
+        n = 0
+        posts = itertools.islice(iter_posts(json_path), self.counted_notes(run_id), None)
+        for chunk in iter_chunks(posts, TERM_IMPORT_NOTES):
+            if stop_event is not None and stop_event.is_set():
+                break
+            self.add_notes(run_id, keyword, chunk, lexicon)
+            n += len(chunk)
+        self.flush()
+        return n
+
+    # ---- 查询 ----
+    @staticmethod
+    def _since(days):
+        return (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d") if days else ""
+
+    def keywords(self):
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT keyword FROM term_docs ORDER BY keyword")]
+
+    def comment_counts(self, keyword, days=None):
+        """{情绪: 评论数}"""
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT sentiment, SUM(comments) FROM term_docs WHERE keyword=? AND day>=? GROUP BY sentiment",
+                (keyword, self._since(days))))
+
+    def top_terms(self, keyword, sentiment=None, days=None, limit=TERM_TOP_LIMIT):
+        """返回 [(词, 评论数, 正向, 负向, 中性)]，按 sentiment 对应的列（为空时按评论数）降序"""
+        order = {"正向": 3, "负向": 4, "中性": 5}.get(sentiment, 2)
+        with self._lock:
+            return self.conn.execute(
+                "SELECT term, SUM(count), SUM(CASE sentiment WHEN '正向' THEN count ELSE 0 END), "
+                "SUM(CASE sentiment WHEN '负向' THEN count ELSE 0 END), "
+                "SUM(CASE sentiment WHEN '中性' THEN count ELSE 0 END) "
+                f"FROM term_freq WHERE keyword=? AND day>=? GROUP BY term ORDER BY {order} DESC, 2 DESC LIMIT ?",
+                (keyword, self._since(days), limit)).fetchall()
+
+    def trend(self, keyword, term, days=None):
+        """返回 [(日期, 含该词的评论数)]"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT day, SUM(count) FROM term_freq WHERE keyword=? AND term=? AND day>=? GROUP BY day ORDER BY day",
+                (keyword, term, self._since(days))).fetchall()
+
+    def cooccurring(self, keyword, term, days=None, limit=30):
+        """返回 [(共现词, 同时出现的评论数)]"""
+        since = self._since(days)
+        with self._lock:
+            return self.conn.execute(
+                "SELECT other, SUM(count) FROM ("
+                "  SELECT b AS other, count FROM term_pairs WHERE keyword=? AND a=? AND day>=?"
+                "  UNION ALL SELECT a, count FROM term_pairs WHERE keyword=? AND b=? AND day>=?) "
+                "GROUP BY other ORDER BY 2 DESC LIMIT ?",
+                (keyword, term, since, keyword, term, since, limit)).fetchall()
+
+    def close(self):
+        try:
+            if self._pool is not None:
+                self.flush()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+            self.conn.close()
+
+
+# -------------------- 结果浏览（偏移索引） --------------------
+RESULT_INDEX_SUFFIX = ".idx"  # 索引文件与结果文件同名，追加此后缀
+RESULT_INDEX_VERSION = 1
+SENTIMENT_CODES = ("中性", "正向", "负向")  # 索引中每条评论用一个字节记录规则情绪
+RESULT_POST_CACHE_SIZE = 256  # 浏览时缓存最近解析过的笔记数
+RESULT_SORTS = ("文件顺序", "点赞数↓", "点赞数↑", "收藏数↓", "评论数↓", "负向评论数↓", "作者")
+
+
+class ResultIndex:
+    """
+    结果文件的偏移索引：记录每条笔记的字节位置/长度、点赞、收藏、作者编号，以及每条评论的规则情绪编码
+    索引建一次后存为 {结果文件}.idx，文件或词典变化时自动重建；
+    浏览时通过 mmap 只解析当前页用到的笔记，百万级评论也不需要整体读入内存
+    """
+    _ARRAYS = ("offsets", "lengths", "likes", "collects", "author_ids", "comment_start", "pos", "neg", "neu")
+
+    def __init__(self, json_path, data):
+        self.json_path = Path(json_path)
+        self.key = data["key"]
+        for name in self._ARRAYS:
+            arr = array.array("q")
+            arr.frombytes(data[name])
+            setattr(self, name, arr)
+        self.authors = data["authors"]
+        self.codes = data["codes"]
+        self._file = None
+        self._mm = None
+        self._posts = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def comment_count(self):
+        return len(self.codes)
+
+    @staticmethod
+    def index_path(json_path):
+        json_path = plain_path(json_path)
+        return json_path.with_name(json_path.name + RESULT_INDEX_SUFFIX)
+
+    @staticmethod
+    def _key(json_path, lexicon, st=None):
+        st = st or Path(json_path).stat()
+        return [RESULT_INDEX_VERSION, st.st_size, st.st_mtime_ns, (lexicon or BUILTIN_LEXICON).digest]
+
+    @classmethod
+    def open(cls, json_path, lexicon=None, progress=None):
+        """读取现有索引；不存在或已过期时重建并保存。progress(已索引笔记数) 在重建时回调"""
+        key = cls._key(json_path, lexicon)
+        idx_path = cls.index_path(json_path)
+        try:
+            data = marshal.loads(idx_path.read_bytes())
+            if data.get("key") == key:
+                return cls(json_path, data)
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+        index = cls.build(json_path, lexicon, progress)
+        index.save()
+        return index
+
+    @classmethod
+    def build(cls, json_path, lexicon=None, progress=None):
+        key = cls._key(json_path, lexicon)
+        arrays = {name: array.array("q") for name in cls._ARRAYS}
+        arrays["comment_start"].append(0)
+        authors, author_ids = [], {}
+        codes = bytearray()
+        for n, (offset, length, post) in enumerate(iter_posts(json_path, with_spans=True), 1):
+            author = post.get("作者", "") or ""
+            if author not in author_ids:
+                author_ids[author] = len(authors)
+                authors.append(author)
+            counts = [0, 0, 0]
+            for c in post.get("评论", []):
+                code = SENTIMENT_CODES.index(label_sent(rule_score(c, lexicon)))
+                codes.append(code)
+                counts[code] += 1
+            for name, value in (("offsets", offset), ("lengths", length), ("likes", post.get("点赞数", 0) or 0),
+                                ("collects", post.get("收藏数", 0) or 0), ("author_ids", author_ids[author]),
+                                ("comment_start", len(codes)), ("neu", counts[0]), ("pos", counts[1]),
+                                ("neg", counts[2])):
+                arrays[name].append(value)
+            if progress and n % 100 == 0:
+                progress(n)
+        data = {name: arr.tobytes() for name, arr in arrays.items()}
+        data.update(key=key, authors=authors, codes=bytes(codes))
+        return cls(json_path, data)
+
+    def save(self):
+        data = {name: getattr(self, name).tobytes() for name in self._ARRAYS}
+        data.update(key=self.key, authors=self.authors, codes=self.codes)
+        self._write(self.json_path, data)
+
+    @classmethod
+    def _write(cls, json_path, data):
+        idx_path = cls.index_path(json_path)
+        tmp = idx_path.with_suffix(idx_path.suffix + ".tmp")
+        tmp.write_bytes(marshal.dumps(data))
+        os.replace(tmp, idx_path)
+
+    @classmethod
+    def carry_over(cls, src, dst, src_stat=None):
+        """
+        结果文件压缩后沿用原索引：解压后的字节偏移不变，只更新文件校验信息，避免重建
+        原文件已删除时 src_stat 传入删除前的 os.stat 结果
+        """
+        try:
+            data = marshal.loads(cls.index_path(src).read_bytes())
+            if data["key"][:3] != cls._key(src, None, src_stat)[:3]:
+                return
+        except (OSError, ValueError, EOFError, TypeError, KeyError):
+            return
+        data["key"] = cls._key(dst, None)[:3] + data["key"][3:]
+        cls._write(dst, data)
+
+    # ---- 按需读取 ----
+    def post(self, i):
+        """解析第 i 条笔记（只读取该笔记的字节范围）"""
+        post = self._posts.get(i)
+        if post is not None:
+            self._posts.move_to_end(i)
+            return post
+        if self._mm is None:
+            if plain_path(self.json_path) != self.json_path:
+                # 压缩文件不能按偏移随机读取：解压到临时文件再映射，关闭时自动删除
+                self._file = tempfile.TemporaryFile()
+                with open_result_binary(self.json_path) as src:
+                    shutil.copyfileobj(src, self._file, ARCHIVE_COPY_SIZE)
+                self._file.flush()
+            else:
+                self._file = open(self.json_path, "rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self.offsets[i]
+        post = json.loads(self._mm[start:start + self.lengths[i]].decode("utf8"))
+        self._posts[i] = post
+        if len(self._posts) > RESULT_POST_CACHE_SIZE:
+            self._posts.popitem(last=False)
+        return post
+
+    def locate(self, g):
+        """全局评论序号 -> (笔记序号, 笔记内评论序号)"""
+        p = bisect.bisect_right(self.comment_start, g) - 1
+        return p, g - self.comment_start[p]
+
+    def author(self, i):
+        return self.authors[self.author_ids[i]]
+
+    def sentiment(self, g):
+        return SENTIMENT_CODES[self.codes[g]]
+
+    # ---- 筛选与排序（只用索引，不读结果文件） ----
+    def select_posts(self, sentiment=None, min_likes=0, author="", sort="文件顺序"):
+        """返回满足条件的笔记序号列表；sentiment 不为空时只保留含该情绪评论的笔记"""
+        counts = {"正向": self.pos, "负向": self.neg, "中性": self.neu}.get(sentiment)
+        matched_authors = None
+        if author:
+            matched_authors = {k for k, name in enumerate(self.authors) if author in name}
+        ids = [i for i in range(len(self))
+               if self.likes[i] >= min_likes
+               and (matched_authors is None or self.author_ids[i] in matched_authors)
+               and (counts is None or counts[i] > 0)]
+        keys = {
+            "点赞数↓": (self.likes.__getitem__, True),
+            "点赞数↑": (self.likes.__getitem__, False),
+            "收藏数↓": (self.collects.__getitem__, True),
+            "评论数↓": (lambda i: self.comment_start[i + 1] - self.comment_start[i], True),
+            "负向评论数↓": (self.neg.__getitem__, True),
+            "作者": (self.author, False),
+        }
+        if sort in keys:
+            key, reverse = keys[sort]
+            ids.sort(key=key, reverse=reverse)
+        return ids
+
+    def select_comments(self, post_ids, sentiment=None):
+        """按笔记顺序展开评论，返回全局评论序号数组"""
+        out = array.array("q")
+        code = SENTIMENT_CODES.index(sentiment) if sentiment else None
+        codes, starts = self.codes, self.comment_start
+        for p in post_ids:
+            a, b = starts[p], starts[p + 1]
+            if code is None:
+                out.extend(range(a, b))
+            else:
+                out.extend(g for g in range(a, b) if codes[g] == code)
+        return out
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = self._file = None
+        self._posts.clear()
+
+
+# -------------------- 运行诊断（事件循环卡顿检测 + 采样分析） --------------------
+DIAG_DIR_NAME = "diagnostics"  # 保存路径下的诊断输出目录
+SLOW_CALLBACK_S = 0.2  # 单次回调/协程步骤超过该时长记为卡顿（asyncio 调试模式）
+STALL_WATCHDOG_S = 2.0  # 事件循环超过该时长无响应时抓取其当前调用栈
+STALL_STACK_DEPTH = 12
+PROFILE_INTERVAL_S = 0.01  # 采样间隔
+PROFILE_MAX_DEPTH = 64
+
+
+class LoopStallMonitor(logging.Handler):
+    """
+    诊断模式：打开事件循环的调试模式和慢回调检测，记录哪个协程阻塞了多久
+    asyncio 在回调结束后报告耗时；另有看门狗线程在循环卡住期间抓取循环线程的调用栈，定位阻塞在哪一行
+    记录逐行写入 {诊断目录}/{批次}_stalls.jsonl
+    """
+
+    def __init__(self, loop, path, threshold=SLOW_CALLBACK_S, watchdog=STALL_WATCHDOG_S):
+        super().__init__(logging.WARNING)
+        self.loop = loop
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.watchdog = watchdog
+        self.thread_id = threading.get_ident()  # 在事件循环线程中创建
+        self.slow = []  # (耗时秒, 协程及所在行)
+        self.stalls = 0
+        self._file_lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._reported = False
+        self._stop = threading.Event()
+        loop.set_debug(True)
+        loop.slow_callback_duration = threshold
+        logging.getLogger("asyncio").addHandler(self)
+        self._tick_handle = loop.call_soon(self._tick)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def _write(self, record):
+        record["time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        with self._file_lock, self.path.open("a", encoding="utf8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def emit(self, record):
+        # asyncio 调试模式的慢回调日志："Executing <Task ... coro=<...> running at 文件:行> took 0.523 seconds"
+        if not str(record.msg).startswith("Executing ") or len(record.args or ()) != 2:
+            return
+        callback, seconds = str(record.args[0]), record.args[1]
+        m = re.search(r"coro=<(.+?) running at (\S+?:\d+)>", callback)
+        self.slow.append((seconds, f"{m.group(1)} @ {m.group(2)}" if m else callback[:160]))
+        self._write({"type": "slow_callback", "seconds": round(seconds, 3), "callback": callback})
+
+    def _tick(self):
+        if self._reported:
+            lag = time.monotonic() - self._beat
+            self._write({"type": "stall_end", "seconds": round(lag, 3)})
+            logging.warning(f"事件循环恢复响应，共卡住 {lag:.1f} 秒")
+        self._beat = time.monotonic()
+        self._reported = False
+        self._tick_handle = self.loop.call_later(self.watchdog / 4, self._tick)
+
+    def _watch(self):
+        while not self._stop.wait(self.watchdog / 4):
+            lag = time.monotonic() - self._beat
+            if lag < self.watchdog or self._reported:
+                continue
+            self._reported = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self.thread_id)
+            stack = traceback.format_stack(frame, limit=STALL_STACK_DEPTH) if frame else []
+            self._write({"type": "stall", "seconds": round(lag, 3), "stack": stack})
+            where = stack[-1].strip().splitlines()[0] if stack else "未知位置"
+            logging.warning(f"事件循环已 {lag:.1f} 秒无响应，当前执行: {where}")
+
+    def close(self):
+        """停止监控并返回摘要"""
+        self._stop.set()
+        self._tick_handle.cancel()
+        logging.getLogger("asyncio").removeHandler(self)
+        self.loop.set_debug(False)
+        super().close()
+        worst = sorted(self.slow, reverse=True)[:5]
+        lines = [f"卡顿诊断: 慢回调 {len(self.slow)} 次（>{self.loop.slow_callback_duration}s），"
+                 f"长时间无响应 {self.stalls} 次，明细见 {self.path}"]
+        lines += [f"  {seconds:.2f}s  {where}" for seconds, where in worst]
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按固定间隔读取各线程的调用栈并计数，不需要重启采集任务
+    stop() 写出折叠栈格式（每行 "线程;函数;函数 次数"），可直接用 flamegraph.pl / speedscope 生成火焰图
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_S):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.count = 0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread.start()
+        return self
+
+    @staticmethod
+    def _label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.samples[";".join(reversed(stack))] += 1
+            self.count += 1
+
+    def stop(self, path):
+        """停止采样并写出折叠栈文件，返回 (路径, 采样次数, 采样秒数)"""
+        self._stop.set()
+        self._thread.join()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+        return path, self.count, time.monotonic() - self.started_at
+
+
 # -------------------- GUI 部分 --------------------
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
@@ -304,6 +3113,229 @@ except ImportError:
     PLAYWRIGHT_AVAILABLE = False
 
 
+# -------------------- 日志输出 --------------------
+LOG_FLUSH_INTERVAL_MS = 100  # 日志窗口刷新间隔
+LOG_MAX_LINES = 5000  # 日志窗口最多保留的行数，超出后删除最早的行
+LOG_FLUSH_MAX_RECORDS = 2000  # 单次刷新最多写入的记录数，积压更多时只保留最新的
+LOG_DIR = Path.home() / ".xhs_collector"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+class TextLogSink(logging.Handler):
+    """
+    日志窗口输出：emit 只把消息放进队列（任意线程可调用，不碰 Tk），
+    由主线程按固定间隔批量插入，并把窗口限制在 LOG_MAX_LINES 行以内
+    """
+
+    def __init__(self, widget, max_lines=LOG_MAX_LINES, interval_ms=LOG_FLUSH_INTERVAL_MS):
+        super().__init__()
+        self.widget = widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self._pending = collections.deque(maxlen=LOG_FLUSH_MAX_RECORDS)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self.widget.after(self.interval_ms, self._flush)
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(msg)
+
+    def _flush(self):
+        with self._lock:
+            lines, dropped = list(self._pending), self._dropped
+            self._pending.clear()
+            self._dropped = 0
+        try:
+            if lines:
+                if dropped:
+                    lines.insert(0, f"...（日志过多，省略 {dropped} 条，完整日志见 {LOG_DIR}）")
+                self.widget.insert(tk.END, "\n".join(lines) + "\n")
+                excess = int(self.widget.index("end-1c").split(".")[0]) - 1 - self.max_lines
+                if excess > 0:
+                    self.widget.delete("1.0", f"{excess + 1}.0")
+                self.widget.see(tk.END)
+        except tk.TclError:
+            return  # 窗口已关闭
+        self.widget.after(self.interval_ms, self._flush)
+
+
+def rotating_log_handler(log_dir=LOG_DIR):
+    """完整日志写入 log_dir/xhs_collector.log，按大小滚动；目录不可写时返回 None"""
+    try:
+        log_dir.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(log_dir / "xhs_collector.log", maxBytes=LOG_FILE_MAX_BYTES,
+                                      backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+    except OSError:
+        return None
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(threadName)s: %(message)s"))
+    return handler
+
+
+# -------------------- 界面事件总线 --------------------
+UI_POLL_INTERVAL_MS = 100  # 主线程处理界面事件的间隔
+
+
+class UIEventBus:
+    """
+    工作线程 -> Tk 主线程的事件通道，工作线程只入队、不碰任何控件
+    publish(key, ...) 为状态类事件（进度、统计），同一 key 在一个刷新周期内只保留最新一条
+    call(fn, ...) 为一次性操作（弹窗、关闭窗口），按提交顺序逐个执行
+    """
+
+    def __init__(self, root, interval_ms=UI_POLL_INTERVAL_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._latest = {}
+        self._calls = collections.deque()
+        self._lock = threading.Lock()
+        self.root.after(self.interval_ms, self._drain)
+
+    def publish(self, key, handler, *args):
+        with self._lock:
+            self._latest.pop(key, None)
+            self._latest[key] = (handler, args)
+
+    def call(self, fn, *args):
+        with self._lock:
+            self._calls.append((fn, args))
+
+    def _drain(self):
+        with self._lock:
+            events, self._latest = list(self._latest.values()), {}
+            calls = list(self._calls)
+            self._calls.clear()
+        # 先刷新状态再执行一次性操作，避免关闭窗口后还去更新它
+        for fn, args in events + calls:
+            try:
+                fn(*args)
+            except tk.TclError:
+                pass  # 目标窗口已关闭
+            except Exception as e:
+                logging.error(f"界面事件处理失败：{e}")
+        try:
+            self.root.after(self.interval_ms, self._drain)
+        except tk.TclError:
+            pass  # 主窗口已销毁
+
+
+# -------------------- 结果浏览窗口 --------------------
+RESULT_PAGE_SIZE = 200
+SENTIMENT_FILTERS = ("全部", "正向", "负向", "中性")
+
+
+class ResultBrowser:
+    """结果浏览窗口：笔记/评论两种视图，筛选排序只用索引，每次只解析和渲染当前页"""
+    VIEWS = {
+        "笔记": ("序号", "标题", "作者", "点赞数", "收藏数", "评论数", "正向", "负向", "中性"),
+        "评论": ("序号", "评论内容", "规则情绪", "标题", "作者", "点赞数"),
+    }
+    COLUMN_WIDTHS = {"标题": 240, "评论内容": 420, "作者": 120}
+
+    def __init__(self, root, index: ResultIndex):
+        self.index = index
+        self.rows = []
+        self.page = 0
+        self.view = "笔记"
+
+        self.win = tk.Toplevel(root)
+        self.win.title(f"结果浏览 - {index.json_path.name}")
+        self.win.geometry("1000x620")
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+
+        bar = ttk.Frame(self.win, padding=8)
+        bar.pack(fill=tk.X)
+        self.view_var = tk.StringVar(value="笔记")
+        self.sentiment_var = tk.StringVar(value="全部")
+        self.min_likes_var = tk.StringVar(value="0")
+        self.author_var = tk.StringVar()
+        self.sort_var = tk.StringVar(value=RESULT_SORTS[0])
+        for label, widget in (
+                ("视图:", ttk.Combobox(bar, textvariable=self.view_var, values=list(self.VIEWS),
+                                        state="readonly", width=6)),
+                ("情绪:", ttk.Combobox(bar, textvariable=self.sentiment_var, values=SENTIMENT_FILTERS,
+                                        state="readonly", width=6)),
+                ("最少点赞:", ttk.Entry(bar, textvariable=self.min_likes_var, width=8)),
+                ("作者包含:", ttk.Entry(bar, textvariable=self.author_var, width=12)),
+                ("排序:", ttk.Combobox(bar, textvariable=self.sort_var, values=RESULT_SORTS,
+                                        state="readonly", width=10))):
+            ttk.Label(bar, text=label).pack(side=tk.LEFT, padx=(8, 2))
+            widget.pack(side=tk.LEFT)
+        ttk.Button(bar, text="应用", command=self.apply, style='Secondary.TButton').pack(side=tk.LEFT, padx=8)
+
+        table = ttk.Frame(self.win)
+        table.pack(fill=tk.BOTH, expand=True, padx=8)
+        self.tree = ttk.Treeview(table, show="headings")
+        scroll = ttk.Scrollbar(table, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        nav = ttk.Frame(self.win, padding=8)
+        nav.pack(fill=tk.X)
+        ttk.Button(nav, text="上一页", command=lambda: self.turn(-1), style='Secondary.TButton').pack(side=tk.LEFT)
+        ttk.Button(nav, text="下一页", command=lambda: self.turn(1), style='Secondary.TButton').pack(side=tk.LEFT,
+                                                                                                    padx=8)
+        self.page_var = tk.StringVar()
+        ttk.Label(nav, textvariable=self.page_var).pack(side=tk.LEFT)
+        self.apply()
+
+    def apply(self):
+        sentiment = self.sentiment_var.get()
+        sentiment = None if sentiment == "全部" else sentiment
+        try:
+            min_likes = int(self.min_likes_var.get() or 0)
+        except ValueError:
+            min_likes = 0
+        posts = self.index.select_posts(sentiment, min_likes, self.author_var.get().strip(), self.sort_var.get())
+        self.view = self.view_var.get()
+        self.rows = posts if self.view == "笔记" else self.index.select_comments(posts, sentiment)
+        self.page = 0
+        columns = self.VIEWS[self.view]
+        self.tree.configure(columns=columns)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=self.COLUMN_WIDTHS.get(col, 70), stretch=col in self.COLUMN_WIDTHS)
+        self.render()
+
+    def turn(self, step):
+        pages = max(1, -(-len(self.rows) // RESULT_PAGE_SIZE))
+        self.page = min(pages - 1, max(0, self.page + step))
+        self.render()
+
+    def render(self):
+        self.tree.delete(*self.tree.get_children())
+        index = self.index
+        start = self.page * RESULT_PAGE_SIZE
+        for n, i in enumerate(self.rows[start:start + RESULT_PAGE_SIZE], start + 1):
+            if self.view == "笔记":
+                post = index.post(i)
+                values = (n, post.get("标题", ""), index.author(i), index.likes[i], index.collects[i],
+                          index.comment_start[i + 1] - index.comment_start[i], index.pos[i], index.neg[i],
+                          index.neu[i])
+            else:
+                p, c = index.locate(i)
+                post = index.post(p)
+                values = (n, post.get("评论", [])[c], index.sentiment(i), post.get("标题", ""), index.author(p),
+                          index.likes[p])
+            self.tree.insert("", tk.END, values=values)
+        pages = max(1, -(-len(self.rows) // RESULT_PAGE_SIZE))
+        self.page_var.set(f"第 {self.page + 1}/{pages} 页，共 {len(self.rows)} 条"
+                          f"（全部 {len(index)} 条笔记 / {index.comment_count} 条评论）")
+
+    def close(self):
+        self.index.close()
+        self.win.destroy()
+
+
 class XHSScraperGUI:
     def __init__(self, root):
         self.root = root
@@ -318,6 +3350,9 @@ class XHSScraperGUI:
         self.current_task = None
         self.scraper_instance = None
         self.ai_analyzer = AIEmotionAnalyzer()
+        self.dedup_index = None
+        self.profiler = None
+        self.ui = UIEventBus(self.root)
         self.setup_ui()
 
     def setup_styles(self):
@@ -444,6 +3479,25 @@ class XHSScraperGUI:
         ttk.Button(tools_sidebar, text="📊 规则情绪分析", command=self.generate_rule_csv,
                    style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
 
+        ttk.Button(tools_sidebar, text="🧠 训练本地模型", command=self.train_local_model,
+                   style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
+
+        ttk.Button(tools_sidebar, text="📦 导出列式数据", command=self.export_columnar,
+                   style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
+
+        ttk.Button(tools_sidebar, text="🗂️ 浏览结果", command=self.open_result_browser,
+                   style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
+
+        ttk.Button(tools_sidebar, text="🔍 全文检索", command=self.open_search_dialog,
+                   style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
+
+        ttk.Button(tools_sidebar, text="🔥 热词分析", command=self.open_hot_terms,
+                   style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
+
+        self.profile_button = ttk.Button(tools_sidebar, text="⏱️ 性能采样", command=self.toggle_profiler,
+                                         style='Secondary.TButton', width=15)
+        self.profile_button.pack(fill=tk.X, pady=5)
+
         ttk.Button(tools_sidebar, text="🐛 调试数据", command=self.debug_data_integrity,
                    style='Secondary.TButton', width=15).pack(fill=tk.X, pady=5)
 
@@ -485,6 +3539,61 @@ class XHSScraperGUI:
         ttk.Button(path_frame, text="浏览", command=self.browse_save_path, style='Secondary.TButton').grid(row=0,
                                                                                                            column=2)
 
+        # 分析对象（批次目录）
+        run_frame = ttk.Frame(config_card)
+        run_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(run_frame, text="分析批次:", font=('Segoe UI', 10)).grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        self.run_var = tk.StringVar(value=LATEST_RUN_CHOICE)
+        self.run_choices = {}
+        run_box = ttk.Combobox(run_frame, textvariable=self.run_var, state="readonly", width=58)
+        run_box.configure(postcommand=lambda: self.refresh_run_choices(run_box))
+        run_box.grid(row=0, column=1, sticky=tk.W)
+
+        # 分析结果导出格式
+        export_frame = ttk.Frame(config_card)
+        export_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(export_frame, text="导出格式:", font=('Segoe UI', 10)).grid(row=0, column=0, sticky=tk.W,
+                                                                              padx=(0, 10))
+        self.export_format_var = tk.StringVar(value="仅CSV")
+        # 未安装 pyarrow 时只提供 CSV，并在下方提示
+        ttk.Combobox(export_frame, textvariable=self.export_format_var,
+                     values=list(EXPORT_FORMATS) if PYARROW_AVAILABLE else ["仅CSV"],
+                     state="readonly", width=14).grid(row=0, column=1, sticky=tk.W)
+
+        ttk.Label(export_frame, text="采集时同步分析:", font=('Segoe UI', 10)).grid(row=0, column=2, sticky=tk.W,
+                                                                                   padx=(30, 10))
+        self.pipeline_mode_var = tk.StringVar(value="不分析")
+        ttk.Combobox(export_frame, textvariable=self.pipeline_mode_var, values=list(PIPELINE_MODES),
+                     state="readonly", width=10).grid(row=0, column=3, sticky=tk.W)
+
+        self.store_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_frame, text="同时写入结果库（跨批次全文检索）",
+                        variable=self.store_var).grid(row=1, column=0, columnspan=4, sticky=tk.W, pady=(8, 0))
+        self.dedup_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_frame, text="情绪分析前标记近重复/刷屏评论",
+                        variable=self.dedup_var).grid(row=2, column=0, columnspan=4, sticky=tk.W, pady=(4, 0))
+
+        ttk.Label(export_frame, text="归档压缩:", font=('Segoe UI', 10)).grid(row=3, column=0, sticky=tk.W,
+                                                                              padx=(0, 10), pady=(8, 0))
+        self.archive_var = tk.StringVar(value="不压缩")
+        ttk.Combobox(export_frame, textvariable=self.archive_var,
+                     values=[k for k, v in ARCHIVE_FORMATS.items() if v != ".zst" or ZSTD_AVAILABLE],
+                     state="readonly", width=14).grid(row=3, column=1, sticky=tk.W, pady=(8, 0))
+        self.terms_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_frame, text="采集时统计热词（按关键词/日期累计词频与共现）",
+                        variable=self.terms_var).grid(row=4, column=0, columnspan=4, sticky=tk.W, pady=(8, 0))
+        self.diagnostics_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_frame, text="诊断模式（记录事件循环卡顿的协程、耗时和调用栈）",
+                        variable=self.diagnostics_var).grid(row=5, column=0, columnspan=4, sticky=tk.W, pady=(4, 0))
+        missing = [] if PYARROW_AVAILABLE else ["pyarrow（Parquet/Arrow 导出）"]
+        if not ZSTD_AVAILABLE:
+            missing.append("zstandard（zstd 归档）")
+        if missing:
+            ttk.Label(export_frame, text=f"未安装可选组件: {'、'.join(missing)}，对应选项已隐藏",
+                      foreground="gray").grid(row=6, column=0, columnspan=4, sticky=tk.W, pady=(4, 0))
+
         # 控制按钮区域
         control_frame = ttk.Frame(config_area)
         control_frame.pack(fill=tk.X, pady=(0, 15))
@@ -552,6 +3661,74 @@ class XHSScraperGUI:
         model_entry = ttk.Entry(api_config_frame, textvariable=self.api_model_var, width=20, font=('Segoe UI', 10))
         model_entry.grid(row=0, column=3, padx=(0, 10))
 
+        # 并发与限速
+        rate_frame = ttk.Frame(api_card)
+        rate_frame.pack(fill=tk.X, pady=10)
+
+        ttk.Label(rate_frame, text="并发批次:", font=('Segoe UI', 10)).grid(row=0, column=0, sticky=tk.W,
+                                                                            padx=(0, 10))
+        self.api_concurrency_var = tk.StringVar(value=str(DEFAULT_API_CONFIG["max_concurrency"]))
+        ttk.Entry(rate_frame, textvariable=self.api_concurrency_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=0, column=1, padx=(0, 30))
+
+        ttk.Label(rate_frame, text="每分钟请求上限(0不限):", font=('Segoe UI', 10)).grid(row=0, column=2, sticky=tk.W,
+                                                                                      padx=(0, 10))
+        self.api_rpm_var = tk.StringVar(value=str(DEFAULT_API_CONFIG["rpm_limit"]))
+        ttk.Entry(rate_frame, textvariable=self.api_rpm_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=0, column=3)
+
+        ttk.Label(rate_frame, text="每批token预算(0自动):", font=('Segoe UI', 10)).grid(row=1, column=0, sticky=tk.W,
+                                                                                      padx=(0, 10), pady=(10, 0))
+        self.api_token_budget_var = tk.StringVar(value="0")
+        ttk.Entry(rate_frame, textvariable=self.api_token_budget_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=1, column=1, padx=(0, 30), pady=(10, 0))
+
+        ttk.Label(rate_frame, text="评论截断字数(0不截断):", font=('Segoe UI', 10)).grid(row=1, column=2, sticky=tk.W,
+                                                                                      padx=(0, 10), pady=(10, 0))
+        self.api_max_chars_var = tk.StringVar(value=str(MAX_COMMENT_CHARS))
+        ttk.Entry(rate_frame, textvariable=self.api_max_chars_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=1, column=3, pady=(10, 0))
+
+        ttk.Label(rate_frame, text="分析模式:", font=('Segoe UI', 10)).grid(row=3, column=0, sticky=tk.W,
+                                                                            padx=(0, 10), pady=(10, 0))
+        self.analysis_mode_var = tk.StringVar(value="全部AI")
+        ttk.Combobox(rate_frame, textvariable=self.analysis_mode_var, values=list(ANALYSIS_MODES),
+                     state="readonly", width=20).grid(row=3, column=1, sticky=tk.W, pady=(10, 0))
+
+        ttk.Label(rate_frame, text="规则置信度阈值(0-1):", font=('Segoe UI', 10)).grid(row=3, column=2, sticky=tk.W,
+                                                                                     padx=(0, 10), pady=(10, 0))
+        self.hybrid_threshold_var = tk.StringVar(value=str(HYBRID_CONFIDENCE))
+        ttk.Entry(rate_frame, textvariable=self.hybrid_threshold_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=3, column=3, pady=(10, 0))
+
+        ttk.Label(rate_frame, text="请求超时(秒):", font=('Segoe UI', 10)).grid(row=4, column=0, sticky=tk.W,
+                                                                              padx=(0, 10), pady=(10, 0))
+        self.api_timeout_var = tk.StringVar(value=str(DEFAULT_API_CONFIG["timeout"]))
+        ttk.Entry(rate_frame, textvariable=self.api_timeout_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=4, column=1, padx=(0, 30), pady=(10, 0))
+
+        ttk.Label(rate_frame, text="最大重试次数:", font=('Segoe UI', 10)).grid(row=4, column=2, sticky=tk.W,
+                                                                              padx=(0, 10), pady=(10, 0))
+        self.api_retries_var = tk.StringVar(value=str(DEFAULT_API_CONFIG["max_retries"]))
+        ttk.Entry(rate_frame, textvariable=self.api_retries_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=4, column=3, pady=(10, 0))
+
+        ttk.Label(rate_frame, text="连续失败熔断次数:", font=('Segoe UI', 10)).grid(row=5, column=0, sticky=tk.W,
+                                                                                padx=(0, 10), pady=(10, 0))
+        self.api_breaker_var = tk.StringVar(value=str(DEFAULT_API_CONFIG["breaker_threshold"]))
+        ttk.Entry(rate_frame, textvariable=self.api_breaker_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=5, column=1, padx=(0, 30), pady=(10, 0))
+
+        ttk.Label(rate_frame, text="熔断探测间隔(秒):", font=('Segoe UI', 10)).grid(row=5, column=2, sticky=tk.W,
+                                                                                padx=(0, 10), pady=(10, 0))
+        self.api_probe_interval_var = tk.StringVar(value=str(DEFAULT_API_CONFIG["breaker_probe_interval"]))
+        ttk.Entry(rate_frame, textvariable=self.api_probe_interval_var, width=8,
+                  font=('Segoe UI', 10)).grid(row=5, column=3, pady=(10, 0))
+
+        self.api_stream_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rate_frame, text="流式返回（标签逐条到达，进度更平滑）",
+                        variable=self.api_stream_var).grid(row=2, column=0, columnspan=4, sticky=tk.W, pady=(10, 0))
+
         # 测试连接按钮
         test_frame = ttk.Frame(api_card)
         test_frame.pack(fill=tk.X, pady=10)
@@ -604,21 +3781,13 @@ class XHSScraperGUI:
 
     # ---------------- 日志重定向 ----------------
     def setup_log_redirection(self):
-        class TextHandler(logging.Handler):
-            def __init__(self, widget):
-                super().__init__()
-                self.widget = widget
-
-            def emit(self, record):
-                msg = self.format(record)
-                self.widget.after(0, lambda: (self.widget.insert(tk.END, msg + '\n'),
-                                              self.widget.see(tk.END),
-                                              self.widget.update_idletasks()))
-
         logger = logging.getLogger()
         logger.setLevel(logging.INFO)
         for h in logger.handlers[:]: logger.removeHandler(h)
-        logger.addHandler(TextHandler(self.log_text))
+        logger.addHandler(TextLogSink(self.log_text))
+        file_handler = rotating_log_handler()
+        if file_handler:
+            logger.addHandler(file_handler)
 
     # ---------------- API相关功能 ----------------
     def toggle_api_key_visibility(self):
@@ -682,11 +3851,29 @@ class XHSScraperGUI:
         new_config = {
             "api_key": self.api_key_var.get(),
             "base_url": self.api_url_var.get(),
-            "model": self.api_model_var.get()
+            "model": self.api_model_var.get(),
+            "max_concurrency": self._int_setting(self.api_concurrency_var, DEFAULT_API_CONFIG["max_concurrency"], 1),
+            "rpm_limit": self._int_setting(self.api_rpm_var, DEFAULT_API_CONFIG["rpm_limit"], 0),
+            "batch_token_budget": self._int_setting(self.api_token_budget_var, 0, 0),
+            "max_comment_chars": self._int_setting(self.api_max_chars_var, MAX_COMMENT_CHARS, 0),
+            "timeout": self._int_setting(self.api_timeout_var, DEFAULT_API_CONFIG["timeout"], 1),
+            "max_retries": self._int_setting(self.api_retries_var, DEFAULT_API_CONFIG["max_retries"], 0),
+            "breaker_threshold": self._int_setting(self.api_breaker_var, DEFAULT_API_CONFIG["breaker_threshold"], 1),
+            "breaker_probe_interval": self._int_setting(self.api_probe_interval_var,
+                                                        DEFAULT_API_CONFIG["breaker_probe_interval"], 1),
+            "stream": self.api_stream_var.get(),
         }
         self.ai_analyzer.update_api_config(new_config)
         self.log("✅ AI分析器配置已更新")
 
+    @staticmethod
+    def _int_setting(var, default, minimum):
+        """读取整数设置项，非法值使用默认值"""
+        try:
+            return max(minimum, int(var.get()))
+        except ValueError:
+            return default
+
     # ---------------- 按钮功能 ----------------
     def browse_save_path(self):
         folder = filedialog.askdirectory(initialdir=self.save_path_var.get())
@@ -709,7 +3896,18 @@ class XHSScraperGUI:
                             "3. 点击'测试连接'验证配置\n"
                             "4. 点击'开始采集'\n"
                             "5. 每次都需扫码登录，后续自动复用 cookie\n"
-                            "6. 采集完成可点击AI或规则情绪分析\n\n"
+                            "6. 采集完成可点击AI或规则情绪分析\n"
+                            "7. 自定义词典：保存路径/lexicons/{关键词}.json 或 default.json，修改后自动生效\n"
+                            "8. AI分析积累标签后可“训练本地模型”，在AI配置中选择“本地模型(离线)”免费分析\n"
+                            "9. “采集时同步分析”可边采集边生成情绪CSV，采集结束即可查看\n"
+                            "10. 勾选“同时写入结果库”后可用“全文检索”跨批次搜索评论，历史结果可一键导入\n"
+                            "11. 勾选“标记近重复/刷屏评论”后，情绪CSV附带重复簇标记，疑似刷屏评论不消耗AI调用\n"
+                            "12. “归档压缩”选 gzip/zstd 后，每次采集结束在后台压缩已结束批次的结果文件和情绪CSV，"
+                            "各分析工具可直接读取压缩文件\n"
+                            "13. 勾选“采集时统计热词”后可用“热词分析”查看吐槽词/夸奖词、共现词和每日趋势，"
+                            "历史结果可一键补统计\n"
+                            "14. 采集卡住时可勾选“诊断模式”重新采集，或随时点“性能采样”再点一次停止，"
+                            "结果写入保存路径/diagnostics（折叠栈可用 flamegraph.pl / speedscope 查看）\n\n"
                             "GLM-4.5-flash配置：\n"
                             "- API地址: https://open.bigmodel.cn/api/paas/v4\n"
                             "- 模型: glm-4.5-flash\n"
@@ -721,189 +3919,615 @@ class XHSScraperGUI:
         logging.log(level, msg)
 
     def update_progress(self, msg):
-        self.progress_var.set(msg)
-        self.root.update_idletasks()
+        """可在任意线程调用，由主线程合并后刷新"""
+        self.ui.publish("progress", self.progress_var.set, msg)
 
     def update_stats(self):
+        """可在任意线程调用，主线程刷新时读取最新计数"""
+        self.ui.publish("stats", self._render_stats)
+
+    def _render_stats(self):
         self.stats_var.set(f"已采集: {self.collected_count} | 成功: {self.success_count} | 失败: {self.failed_count}")
         if self.max_cards_var.get().isdigit() and int(self.max_cards_var.get()) > 0:
             self.progress_bar['value'] = (self.collected_count / int(self.max_cards_var.get())) * 100
 
-    # ---------------- 数据调试功能 ----------------
-    def debug_data_integrity(self):
-        """调试数据完整性 - 找出丢失的评论"""
+    # ---------------- 批次选择 ----------------
+    def refresh_run_choices(self, combobox):
+        """下拉时从批次目录读取可选批次"""
+        runs = RunCatalog(self.save_path_var.get()).runs()
+        self.run_choices = {RunCatalog.describe(r): r["run_id"] for r in runs}
+        combobox.configure(values=[LATEST_RUN_CHOICE] + list(self.run_choices))
+
+    def select_result_file(self):
+        """返回“分析批次”选中的结果文件（默认最新一次采集）；没有结果时提示并返回 None"""
         folder = Path(self.save_path_var.get())
-        json_files = list(folder.glob("*_comments_*.json"))
+        catalog = RunCatalog(folder)
+        run_id = self.run_choices.get(self.run_var.get())
+        # 按 run_id 查找，批次在下拉后被后台归档压缩时文件名会变化
+        entry = next((r for r in catalog.runs() if r["run_id"] == run_id), None) if run_id else None
+        entry = entry or catalog.latest()
+        if entry:
+            return folder / entry["file"]
+        messagebox.showerror("错误", "未找到任何评论 JSON 文件，请先采集！")
+        return None
+
+    # ---------------- 压缩归档 ----------------
+    def get_archive_format(self):
+        """返回选中的归档压缩后缀（不压缩时为 None）；选了 zstd 但缺少 zstandard 时提示并返回 False"""
+        suffix = ARCHIVE_FORMATS.get(self.archive_var.get())
+        if suffix == ".zst" and not ZSTD_AVAILABLE:
+            messagebox.showerror("错误", "zstd 压缩需要安装 zstandard：pip install zstandard")
+            return False
+        return suffix
+
+    def start_archive(self, folder, suffix):
+        """在后台线程压缩保存路径下已结束的批次，可在任意线程调用"""
+
+        def job():
+            try:
+                n = RunCatalog(folder).archive(suffix, log=self.log)
+                if n:
+                    self.log(f"📦 归档压缩完成，共 {n} 个文件")
+            except Exception as e:
+                self.log(f"❌ 归档压缩失败: {e}", logging.ERROR)
+
+        threading.Thread(target=job, daemon=True).start()
 
-        if not json_files:
-            messagebox.showinfo("提示", "未找到JSON文件")
+    # ---------------- 性能采样 ----------------
+    def toggle_profiler(self):
+        """开始/停止对当前进程（包括正在运行的采集线程）的采样，停止时写出火焰图用的折叠栈文件"""
+        if self.profiler is None:
+            self.profiler = SamplingProfiler().start()
+            self.profile_button.config(text="⏹️ 停止采样")
+            self.log(f"⏱️ 性能采样已开始（每 {PROFILE_INTERVAL_S * 1000:.0f} 毫秒一次），再次点击停止")
             return
+        path = Path(self.save_path_var.get()) / DIAG_DIR_NAME / f"profile_{datetime.now():%Y%m%d_%H%M%S}.folded"
+        try:
+            path, count, seconds = self.profiler.stop(path)
+            self.log(f"✅ 性能采样结束：{seconds:.1f} 秒 {count} 次采样 → {path}")
+        except OSError as e:
+            messagebox.showerror("错误", f"写出采样结果失败：{e}")
+        finally:
+            self.profiler = None
+            self.profile_button.config(text="⏱️ 性能采样")
 
-        latest_json = max(json_files, key=lambda x: x.stat().st_mtime)
+    # ---------------- 数据调试功能 ----------------
+    def debug_data_integrity(self):
+        """数据完整性报告：读取采集时维护的统计文件，旧结果没有统计文件时流式重建一次"""
+        latest_json = self.select_result_file()
+        if not latest_json:
+            return
 
-        try:
-            posts = json.loads(latest_json.read_text(encoding='utf-8'))
+        def report_in_thread():
+            try:
+                stats = RunStats.load(latest_json)
+                if stats is None:
+                    self.log(f"未找到统计文件，正在从 {latest_json.name} 重建...")
+                    stats = RunStats.rebuild(latest_json)
+                report = stats.report()
+                self.log("🔍 数据完整性调试报告:")
+                self.log(report)
+                runs = RunCatalog(latest_json.parent).runs()
+                if len(runs) > 1:
+                    self.log(f"📋 最近 {min(len(runs), 10)} 次采集:")
+                    for entry in runs[:10]:
+                        self.log(f"  {RunCatalog.describe(entry)}")
+                self.ui.call(messagebox.showinfo, "数据调试报告", report)
+            except Exception as e:
+                self.ui.call(messagebox.showerror, "错误", f"调试数据时出错: {e}")
+
+        # 旧结果重建统计需要读完整个文件，放到后台线程，结果通过界面事件总线弹出
+        threading.Thread(target=report_in_thread, daemon=True).start()
+
+    # ---------------- 近重复检测 ----------------
+    def get_dedup_index(self):
+        """勾选了近重复检测时返回保存路径下的索引（跨批次共用），否则返回 None"""
+        if not self.dedup_var.get():
+            return None
+        path = Path(self.save_path_var.get()) / DEDUP_INDEX_FILE
+        if self.dedup_index is None or self.dedup_index.path != path:
+            if self.dedup_index:
+                self.dedup_index.close()
+            self.dedup_index = NearDuplicateIndex(path)
+        return self.dedup_index
+
+    def log_spam_clusters(self, dedup, limit=10):
+        if not dedup:
+            return
+        clusters = dedup.spam_clusters(limit)
+        if clusters:
+            self.log(f"🚩 疑似刷屏评论簇（跨批次累计，前 {len(clusters)} 个）:")
+            for _, size, sample in clusters:
+                self.log(f"  {size} 条 | {sample[:40]}")
+
+    # ---------------- 列式导出 ----------------
+    def get_columnar_format(self):
+        """返回选中的列式导出格式；选了列式格式但缺少 pyarrow 时提示并返回 False"""
+        fmt = EXPORT_FORMATS.get(self.export_format_var.get())
+        if fmt and not PYARROW_AVAILABLE:
+            messagebox.showerror("错误", PYARROW_MISSING)
+            return False
+        return fmt
+
+    def export_columnar(self):
+        """把选中批次的原始评论导出为 Parquet/Arrow（导出格式为“仅CSV”时默认 Parquet）"""
+        latest_json = self.select_result_file()
+        if not latest_json:
+            return
+        fmt = self.get_columnar_format()
+        if fmt is False:
+            return
+        if not PYARROW_AVAILABLE:
+            messagebox.showerror("错误", PYARROW_MISSING)
+            return
 
-            # 详细分析每个帖子
-            result_text = f"JSON文件: {latest_json.name}\n"
-            result_text += f"帖子总数: {len(posts)}\n\n"
+        def export_in_thread():
+            try:
+                out_path, total = export_raw_columnar(latest_json, fmt or "parquet")
+                self.log(f"✅ 列式数据已导出 → {out_path}（{total} 条评论）")
+                self.update_progress(f"列式数据已导出: {total} 条评论")
+                self.ui.call(messagebox.showinfo, "完成", f"列式数据已导出！\n{out_path}")
+            except Exception as e:
+                self.log(f"❌ 列式导出失败：{e}")
+                self.ui.call(messagebox.showerror, "错误", f"列式导出失败：{e}")
 
-            total_comments = 0
-            all_comments_list = []
+        self.update_progress(f"正在导出列式数据: {latest_json.name}")
+        threading.Thread(target=export_in_thread, daemon=True).start()
 
-            for i, post in enumerate(posts):
-                comments = post.get("评论", [])
-                title = post.get("标题", "无标题")[:50]
-                total_comments += len(comments)
+    # ---------------- 结果浏览 ----------------
+    def open_result_browser(self):
+        """打开选中批次结果文件的浏览窗口，首次打开时在后台建立偏移索引"""
+        folder = Path(self.save_path_var.get())
+        latest_json = self.select_result_file()
+        if not latest_json:
+            return
+        if self.is_running and self.scraper_instance and self.scraper_instance.SAVE_FILE == latest_json:
+            messagebox.showinfo("提示", "该结果文件正在采集写入中，请在采集结束后浏览")
+            return
+        LEXICONS.set_root(folder / LEXICON_DIR_NAME)
+        lexicon = LEXICONS.get(keyword_from_result(latest_json))
 
-                result_text += f"帖子{i + 1}: {title}\n"
-                result_text += f"  评论数: {len(comments)}\n"
-                result_text += f"  点赞数: {post.get('点赞数', 0)}\n"
-                result_text += f"  收藏数: {post.get('收藏数', 0)}\n"
+        def build_in_thread():
+            try:
+                index = ResultIndex.open(latest_json, lexicon,
+                                         progress=lambda n: self.update_progress(f"正在建立结果索引... 已索引 {n} 条笔记"))
+                self.update_progress(f"结果索引就绪: {len(index)} 条笔记 / {index.comment_count} 条评论")
+                self.ui.call(ResultBrowser, self.root, index)
+            except Exception as e:
+                self.log(f"❌ 建立结果索引失败：{e}")
+                self.ui.call(messagebox.showerror, "错误", f"建立结果索引失败：{e}")
 
-                # 记录前几条评论作为样本
-                sample_comments = comments[:3] if len(comments) > 3 else comments
-                for j, comment in enumerate(sample_comments):
-                    result_text += f"    评论{j + 1}: {comment[:30]}...\n"
+        threading.Thread(target=build_in_thread, daemon=True).start()
 
-                result_text += "\n"
+    # ---------------- 全文检索 ----------------
+    def open_search_dialog(self):
+        """跨所有批次检索评论（结果库），可先把文件夹中的历史结果导入结果库"""
+        folder = Path(self.save_path_var.get())
+        if not folder.exists():
+            messagebox.showerror("错误", "保存路径不存在")
+            return
+        store = ResultStore(folder / RESULT_DB_FILE)
+        LEXICONS.set_root(folder / LEXICON_DIR_NAME)
+
+        win = tk.Toplevel(self.root)
+        win.title("全文检索")
+        win.geometry("1000x600")
+
+        bar = ttk.Frame(win, padding=8)
+        bar.pack(fill=tk.X)
+        query_var = tk.StringVar()
+        sentiment_var = tk.StringVar(value="全部")
+        keyword_var = tk.StringVar(value="全部")
+        since_var = tk.StringVar(value=datetime.now().strftime("%Y-%m-01"))
+        ttk.Label(bar, text="检索词:").pack(side=tk.LEFT)
+        query_entry = ttk.Entry(bar, textvariable=query_var, width=24)
+        query_entry.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bar, text="情绪:").pack(side=tk.LEFT)
+        ttk.Combobox(bar, textvariable=sentiment_var, values=SENTIMENT_FILTERS, state="readonly",
+                     width=6).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bar, text="关键词:").pack(side=tk.LEFT)
+        keyword_box = ttk.Combobox(bar, textvariable=keyword_var, values=["全部"] + store.keywords(),
+                                   state="readonly", width=10)
+        keyword_box.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bar, text="起始日期:").pack(side=tk.LEFT)
+        ttk.Entry(bar, textvariable=since_var, width=11).pack(side=tk.LEFT, padx=(2, 8))
+
+        columns = ("关键词", "采集时间", "标题", "作者", "评论内容", "情绪", "分析方法")
+        tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width={"评论内容": 360, "标题": 180}.get(col, 90), stretch=col in ("评论内容", "标题"))
+        tree.pack(fill=tk.BOTH, expand=True, padx=8)
+        result_var = tk.StringVar(value=f"结果库: {store.path}")
+        ttk.Label(win, textvariable=result_var).pack(anchor=tk.W, padx=8, pady=6)
+
+        def do_search(*_):
+            start = time.perf_counter()
+            try:
+                rows = store.search(query_var.get().strip(),
+                                    None if sentiment_var.get() == "全部" else sentiment_var.get(),
+                                    None if keyword_var.get() == "全部" else keyword_var.get(),
+                                    since_var.get().strip() or None)
+            except sqlite3.Error as e:
+                messagebox.showerror("错误", f"检索失败：{e}", parent=win)
+                return
+            tree.delete(*tree.get_children())
+            for row in rows:
+                tree.insert("", tk.END, values=row)
+            more = f"（只显示前 {RESULT_SEARCH_LIMIT} 条）" if len(rows) >= RESULT_SEARCH_LIMIT else ""
+            result_var.set(f"找到 {len(rows)} 条{more}，用时 {(time.perf_counter() - start) * 1000:.0f} 毫秒")
+
+        # 关闭窗口时通知导入线程停止，等它收尾后再关闭结果库
+        stop_import = threading.Event()
+        import_threads = []
+
+        def import_history():
+            def import_in_thread():
+                total = 0
+                for path in sorted(folder / r["file"] for r in RunCatalog(folder).runs()):
+                    if stop_import.is_set():
+                        break
+                    try:
+                        n = store.import_result_file(path, LEXICONS.get(keyword_from_result(path)), stop_import)
+                    except Exception as e:
+                        self.log(f"❌ 导入 {path.name} 失败：{e}")
+                        continue
+                    if n:
+                        total += n
+                        self.log(f"已导入 {path.name}：{n} 条笔记")
+                if stop_import.is_set():
+                    self.log(f"⏹️ 检索窗口已关闭，历史结果导入中止，已新增 {total} 条笔记")
+                    return
+                self.log(f"✅ 历史结果导入完成，新增 {total} 条笔记")
+                keywords = ["全部"] + store.keywords()
+                # 回调在界面线程执行，窗口此时可能已关闭
+                self.ui.call(lambda: stop_import.is_set() or keyword_box.configure(values=keywords))
+                self.ui.call(lambda: stop_import.is_set() or result_var.set(f"历史结果导入完成，新增 {total} 条笔记"))
+
+            result_var.set("正在导入历史结果...")
+            thread = threading.Thread(target=import_in_thread, daemon=True)
+            import_threads.append(thread)
+            thread.start()
+
+        def close_window():
+            stop_import.set()
+            win.destroy()
+            running = [t for t in import_threads if t.is_alive()]
+            if not running:
+                store.close()
+                return
 
-                # 收集所有评论
-                all_comments_list.extend(comments)
+            def close_after_import():
+                for t in running:
+                    t.join()
+                store.close()
 
-            result_text += f"=== 统计汇总 ===\n"
-            result_text += f"总评论数: {total_comments}\n"
-            result_text += f"实际评论条数: {len(all_comments_list)}\n"
+            threading.Thread(target=close_after_import, daemon=True).start()
 
-            # 检查是否有重复计数问题
-            unique_comments = set(all_comments_list)
-            result_text += f"去重后评论数: {len(unique_comments)}\n"
+        ttk.Button(bar, text="检索", command=do_search, style='Secondary.TButton').pack(side=tk.LEFT)
+        ttk.Button(bar, text="导入历史结果", command=import_history,
+                   style='Secondary.TButton').pack(side=tk.LEFT, padx=8)
+        query_entry.bind("<Return>", do_search)
+        win.protocol("WM_DELETE_WINDOW", close_window)
 
-            if len(all_comments_list) != total_comments:
-                result_text += f"⚠️ 数据不一致: 列表长度 {len(all_comments_list)} != 统计总数 {total_comments}\n"
+    # ---------------- 热词分析 ----------------
+    def open_hot_terms(self):
+        """按关键词查看热词（可按情绪、时间范围筛选）、词的共现词和每日趋势，可导出词云数据"""
+        folder = Path(self.save_path_var.get())
+        if not folder.exists():
+            messagebox.showerror("错误", "保存路径不存在")
+            return
+        terms = TermStats(folder / TERM_DB_FILE)
+        LEXICONS.set_root(folder / LEXICON_DIR_NAME)
+
+        win = tk.Toplevel(self.root)
+        win.title("热词分析")
+        win.geometry("1000x600")
+
+        bar = ttk.Frame(win, padding=8)
+        bar.pack(fill=tk.X)
+        keywords = terms.keywords()
+        keyword_var = tk.StringVar(value=keywords[0] if keywords else "")
+        sentiment_var = tk.StringVar(value="全部")
+        range_var = tk.StringVar(value="最近30天")
+        ttk.Label(bar, text="关键词:").pack(side=tk.LEFT)
+        keyword_box = ttk.Combobox(bar, textvariable=keyword_var, values=keywords, state="readonly", width=12)
+        keyword_box.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bar, text="排序:").pack(side=tk.LEFT)
+        ttk.Combobox(bar, textvariable=sentiment_var, values=SENTIMENT_FILTERS, state="readonly",
+                     width=6).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bar, text="时间:").pack(side=tk.LEFT)
+        ttk.Combobox(bar, textvariable=range_var, values=list(TERM_DAY_RANGES), state="readonly",
+                     width=8).pack(side=tk.LEFT, padx=(2, 8))
+
+        body = ttk.Frame(win, padding=(8, 0))
+        body.pack(fill=tk.BOTH, expand=True)
+        columns = ("词", "评论数", "正向", "负向", "中性")
+        tree = ttk.Treeview(body, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=140 if col == "词" else 70, stretch=col == "词")
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        side = ttk.Frame(body)
+        side.pack(side=tk.LEFT, fill=tk.Y, padx=(8, 0))
+        pair_tree = ttk.Treeview(side, columns=("共现词", "评论数"), show="headings", height=12)
+        trend_tree = ttk.Treeview(side, columns=("日期", "评论数"), show="headings", height=10)
+        for t in (pair_tree, trend_tree):
+            for col in t["columns"]:
+                t.heading(col, text=col)
+                t.column(col, width=110)
+            t.pack(fill=tk.X, pady=(0, 8))
+        result_var = tk.StringVar(value=f"热词库: {terms.path}")
+        ttk.Label(win, textvariable=result_var).pack(anchor=tk.W, padx=8, pady=6)
+
+        def query(*_):
+            if not keyword_var.get():
+                return
+            days = TERM_DAY_RANGES[range_var.get()]
+            sentiment = None if sentiment_var.get() == "全部" else sentiment_var.get()
+            start = time.perf_counter()
+            rows = terms.top_terms(keyword_var.get(), sentiment, days)
+            counts = terms.comment_counts(keyword_var.get(), days)
+            tree.delete(*tree.get_children())
+            for row in rows:
+                tree.insert("", tk.END, values=row)
+            summary = "，".join(f"{k} {v}" for k, v in counts.items())
+            result_var.set(f"共 {sum(counts.values())} 条评论（{summary}），"
+                           f"用时 {(time.perf_counter() - start) * 1000:.0f} 毫秒")
+
+        def show_term(_):
+            selected = tree.selection()
+            if not selected:
+                return
+            term = tree.item(selected[0], "values")[0]
+            days = TERM_DAY_RANGES[range_var.get()]
+            pair_tree.delete(*pair_tree.get_children())
+            for row in terms.cooccurring(keyword_var.get(), term, days):
+                pair_tree.insert("", tk.END, values=row)
+            trend_tree.delete(*trend_tree.get_children())
+            for row in terms.trend(keyword_var.get(), term, days):
+                trend_tree.insert("", tk.END, values=row)
+
+        def export_cloud():
+            rows = [tree.item(i, "values") for i in tree.get_children()]
+            if not rows:
+                messagebox.showinfo("提示", "请先查询热词", parent=win)
+                return
+            weight = {"正向": 2, "负向": 3, "中性": 4}.get(sentiment_var.get(), 1)
+            path = folder / f"hot_terms_{keyword_var.get()}_{datetime.now():%Y%m%d_%H%M%S}.csv"
+            pd.DataFrame([(r[0], r[weight]) for r in rows], columns=["词", "权重"]).to_csv(
+                path, index=False, encoding="utf-8-sig")
+            self.log(f"✅ 词云数据已导出 → {path}")
+            result_var.set(f"词云数据已导出 → {path.name}")
+
+        # 关闭窗口时通知导入线程停止，等它收尾后再关闭热词库
+        stop_import = threading.Event()
+        import_threads = []
+
+        def import_history():
+            def import_in_thread():
+                total = 0
+                for entry in RunCatalog(folder).runs():
+                    if stop_import.is_set():
+                        break
+                    if entry.get("status") == "running":
+                        continue
+                    path = folder / entry["file"]
+                    try:
+                        n = terms.import_result_file(path, LEXICONS.get(keyword_from_result(path)), stop_import)
+                    except Exception as e:
+                        self.log(f"❌ 统计 {path.name} 失败：{e}")
+                        continue
+                    if n:
+                        total += n
+                        self.log(f"已统计 {path.name}：{n} 条笔记")
+                if stop_import.is_set():
+                    self.log(f"⏹️ 热词窗口已关闭，历史结果统计中止，已新增 {total} 条笔记")
+                    return
+                self.log(f"✅ 历史结果热词统计完成，新增 {total} 条笔记")
+                keywords = terms.keywords()
+                # 回调在界面线程执行，窗口此时可能已关闭
+                self.ui.call(lambda: stop_import.is_set() or keyword_box.configure(values=keywords))
+                self.ui.call(lambda: stop_import.is_set() or result_var.set(f"历史结果统计完成，新增 {total} 条笔记"))
+
+            result_var.set("正在分词统计历史结果...")
+            thread = threading.Thread(target=import_in_thread, daemon=True)
+            import_threads.append(thread)
+            thread.start()
+
+        def close_window():
+            stop_import.set()
+            win.destroy()
+            running = [t for t in import_threads if t.is_alive()]
+            if not running:
+                terms.close()
+                return
 
-            # 显示在日志中
-            self.log("🔍 数据完整性调试报告:")
-            self.log(result_text)
+            def close_after_import():
+                for t in running:
+                    t.join()
+                terms.close()
 
-            messagebox.showinfo("数据调试报告", f"详细报告已输出到日志窗口\n总评论数: {total_comments}")
+            threading.Thread(target=close_after_import, daemon=True).start()
 
-        except Exception as e:
-            messagebox.showerror("错误", f"调试数据时出错: {e}")
+        ttk.Button(bar, text="查询", command=query, style='Secondary.TButton').pack(side=tk.LEFT)
+        ttk.Button(bar, text="统计历史结果", command=import_history,
+                   style='Secondary.TButton').pack(side=tk.LEFT, padx=8)
+        ttk.Button(bar, text="导出词云数据", command=export_cloud, style='Secondary.TButton').pack(side=tk.LEFT)
+        tree.bind("<<TreeviewSelect>>", show_term)
+        win.protocol("WM_DELETE_WINDOW", close_window)
+        query()
 
     # ---------------- 情绪CSV生成 ----------------
     def generate_rule_csv(self):
-        """使用规则匹配生成情绪CSV"""
+        """使用规则匹配生成情绪CSV（流式分块写入）"""
         folder = Path(self.save_path_var.get())
-        json_files = list(folder.glob("*_comments_*.json"))
-        if not json_files:
-            messagebox.showerror("错误", "未找到任何评论 JSON 文件，请先采集！")
+        latest_json = self.select_result_file()
+        if not latest_json:
+            return
+        csv_file = latest_json.with_name(result_stem(latest_json) + "_sentiment_rule.csv")
+        LEXICONS.set_root(folder / LEXICON_DIR_NAME)
+        lexicon = LEXICONS.get(keyword_from_result(latest_json))
+
+        columnar = self.get_columnar_format()
+        if columnar is False:
             return
-        latest_json = max(json_files, key=lambda x: x.stat().st_mtime)
-        csv_file = latest_json.with_name(latest_json.stem + "_sentiment_rule.csv")
 
         try:
-            posts = json.loads(latest_json.read_text(encoding='utf-8'))
+            dedup = self.get_dedup_index()
         except Exception as e:
-            messagebox.showerror("错误", f"JSON 读取失败：{e}")
+            messagebox.showerror("错误", f"近重复索引打开失败：{e}")
             return
 
-        records = []
-        for post in posts:
-            title = post.get("标题", "")
-            author = post.get("作者", "")
-            likes = post.get("点赞数", 0)
-            collects = post.get("收藏数", 0)
-            for c in post.get("评论", []):
-                records.append({
-                    "标题": title,
-                    "作者": author,
-                    "点赞数": likes,
-                    "收藏数": collects,
-                    "评论内容": c.strip()
-                })
-
-        df = pd.DataFrame(records)
-        df["clean"] = df["评论内容"].apply(clean)
-        df["score"] = df["评论内容"].apply(lambda x: sum(score_sent(s) for s in re.split(r"[。！？;；\n]+", x)))
-        df["sentiment"] = df["score"].apply(label_sent)
+        def generate_in_thread():
+            try:
+                total = write_rule_sentiment_csv(
+                    latest_json, csv_file, lexicon, columnar=columnar, dedup=dedup,
+                    progress=lambda n: self.update_progress(f"正在生成规则情绪CSV... 已处理 {n} 条评论"))
+                self.log_spam_clusters(dedup)
+                self.log(f"✅ 规则情绪CSV已生成 → {csv_file}（{total} 条评论）")
+                self.update_progress(f"规则情绪CSV已生成: {total} 条评论")
+                self.ui.call(messagebox.showinfo, "完成", f"规则情绪CSV已生成！\n{csv_file}")
+                self.ui.call(os.startfile, csv_file)
+            except (json.JSONDecodeError, ValueError) as e:
+                self.log(f"❌ JSON 读取失败：{e}")
+                self.ui.call(messagebox.showerror, "错误", f"JSON 读取失败：{e}")
+            except Exception as e:
+                self.log(f"❌ CSV 写入失败：{e}")
+                self.ui.call(messagebox.showerror, "错误", f"CSV 写入失败：{e}")
+
+        self.update_progress(f"正在生成规则情绪CSV: {latest_json.name}")
+        threading.Thread(target=generate_in_thread, daemon=True).start()
+
+    def generate_local_csv(self):
+        """使用本地蒸馏模型生成情绪CSV（无需API）"""
+        folder = Path(self.save_path_var.get())
+        model_path = folder / LOCAL_MODEL_FILE
+        if not model_path.exists():
+            messagebox.showerror("错误", "未找到本地模型，请先点击“训练本地模型”")
+            return
+        latest_json = self.select_result_file()
+        if not latest_json:
+            return
+        csv_file = latest_json.with_name(result_stem(latest_json) + "_sentiment_local.csv")
+        LEXICONS.set_root(folder / LEXICON_DIR_NAME)
+        lexicon = LEXICONS.get(keyword_from_result(latest_json))
+        columnar = self.get_columnar_format()
+        if columnar is False:
+            return
 
         try:
-            df.to_csv(csv_file, index=False, encoding='utf-8-sig')
-            self.log(f"✅ 规则情绪CSV已生成 → {csv_file}")
-            messagebox.showinfo("完成", f"规则情绪CSV已生成！\n{csv_file}")
-            os.startfile(csv_file)
+            dedup = self.get_dedup_index()
         except Exception as e:
-            messagebox.showerror("错误", f"CSV 写入失败：{e}")
+            messagebox.showerror("错误", f"近重复索引打开失败：{e}")
+            return
+
+        def generate_in_thread():
+            try:
+                model = LocalSentimentModel.load(model_path)
+                start = time.perf_counter()
+                total = write_local_sentiment_csv(
+                    latest_json, csv_file, model, lexicon, columnar=columnar, dedup=dedup,
+                    progress=lambda n: self.update_progress(f"正在使用本地模型分析... 已处理 {n} 条评论"))
+                self.log_spam_clusters(dedup)
+                self.log(f"✅ 本地模型情绪CSV已生成 → {csv_file}（{total} 条评论，用时 {time.perf_counter() - start:.1f} 秒）")
+                self.update_progress(f"本地模型情绪CSV已生成: {total} 条评论")
+                self.ui.call(messagebox.showinfo, "完成", f"本地模型情绪CSV已生成！\n{csv_file}")
+                self.ui.call(os.startfile, csv_file)
+            except Exception as e:
+                self.log(f"❌ 本地模型分析失败：{e}")
+                self.ui.call(messagebox.showerror, "错误", f"本地模型分析失败：{e}")
+
+        self.update_progress(f"正在使用本地模型分析: {latest_json.name}")
+        threading.Thread(target=generate_in_thread, daemon=True).start()
+
+    def train_local_model(self):
+        """用AI标签缓存训练本地模型，后台线程执行"""
+        folder = Path(self.save_path_var.get())
+        cache_path = folder / LABEL_CACHE_FILE
+        if not cache_path.exists():
+            messagebox.showerror("错误", "未找到AI标签缓存，请先使用AI情绪分析积累标签")
+            return
+
+        def train_in_thread():
+            try:
+                self.log("开始训练本地情绪模型...")
+                report = train_local_model(cache_path, folder / LOCAL_MODEL_FILE)
+                self.log("✅ 本地模型训练完成，评估报告:")
+                self.log(report)
+                self.ui.call(messagebox.showinfo, "训练完成", report)
+            except Exception as e:
+                error_msg = f"本地模型训练失败：{e}"
+                self.log(f"❌ {error_msg}")
+                self.ui.call(messagebox.showerror, "错误", error_msg)
+
+        threading.Thread(target=train_in_thread, daemon=True).start()
 
     def generate_ai_csv(self):
-        """使用AI分析生成情绪CSV - 修复版"""
+        """使用AI分析生成情绪CSV - 流式分块版"""
+        if ANALYSIS_MODES.get(self.analysis_mode_var.get()) == "local":
+            self.generate_local_csv()
+            return
         if not self.api_key_var.get():
             messagebox.showerror("错误", "请先配置API密钥以使用AI情绪分析")
             return
 
         folder = Path(self.save_path_var.get())
-        json_files = list(folder.glob("*_comments_*.json"))
-        if not json_files:
-            messagebox.showerror("错误", "未找到任何评论 JSON 文件，请先采集！")
+        latest_json = self.select_result_file()
+        if not latest_json:
             return
+        csv_file = latest_json.with_name(result_stem(latest_json) + "_sentiment_ai.csv")
+        LEXICONS.set_root(folder / LEXICON_DIR_NAME)
+        lexicon = LEXICONS.get(keyword_from_result(latest_json))
+        columnar = self.get_columnar_format()
+        if columnar is False:
+            return
+        triage_threshold = None
+        if ANALYSIS_MODES.get(self.analysis_mode_var.get()) == "hybrid":
+            try:
+                triage_threshold = min(1.0, max(0.0, float(self.hybrid_threshold_var.get())))
+            except ValueError:
+                triage_threshold = HYBRID_CONFIDENCE
+            self.log(f"混合模式：规则置信度 ≥ {triage_threshold} 的评论本地标注，其余送AI")
 
-        latest_json = max(json_files, key=lambda x: x.stat().st_mtime)
-        csv_file = latest_json.with_name(latest_json.stem + "_sentiment_ai.csv")
-
+        # 第一遍流式扫描：统计各帖子评论数（不保留评论内容）
+        self.log("📊 开始统计各帖子评论数量:")
+        total_comments_count = 0
+        valid_comments_count = 0
         try:
-            posts = json.loads(latest_json.read_text(encoding='utf-8'))
+            for post_idx, post in enumerate(iter_posts(latest_json)):
+                comments = post.get("评论", [])
+                title = post.get("标题", "") or "无标题"
+                title = title[:30] + "..." if len(title) > 30 else title
+                self.log(f"  帖子{post_idx + 1}: '{title}' → {len(comments)} 条评论")
+                total_comments_count += len(comments)
+                for comment_idx, c in enumerate(comments):
+                    if c.strip():
+                        valid_comments_count += 1
+                    else:
+                        self.log(f"    ⚠️ 跳过空评论: 帖子{post_idx + 1} 第{comment_idx + 1}条")
         except Exception as e:
             messagebox.showerror("错误", f"JSON 读取失败：{e}")
             return
 
-        # 收集所有评论 - 修复：确保完整收集
-        all_comments = []
-        post_info = []  # 保存每条评论对应的帖子信息
-
-        # 详细统计每个帖子的评论数
-        self.log("📊 开始统计各帖子评论数量:")
-        total_comments_count = 0
-
-        for post_idx, post in enumerate(posts):
-            comments = post.get("评论", [])
-            title = post.get("标题", "无标题")[:30] + "..." if len(post.get("标题", "")) > 30 else post.get("标题",
-                                                                                                            "无标题")
-
-            self.log(f"  帖子{post_idx + 1}: '{title}' → {len(comments)} 条评论")
-            total_comments_count += len(comments)
-
-            # 详细记录每条评论
-            for comment_idx, c in enumerate(comments):
-                comment_text = c.strip()
-                if comment_text:  # 只处理非空评论
-                    all_comments.append(comment_text)
-                    post_info.append({
-                        "标题": post.get("标题", ""),
-                        "作者": post.get("作者", ""),
-                        "点赞数": post.get("点赞数", 0),
-                        "收藏数": post.get("收藏数", 0),
-                        "评论内容": comment_text,
-                        "帖子索引": post_idx,
-                        "评论索引": comment_idx
-                    })
-                else:
-                    self.log(f"    ⚠️ 跳过空评论: 帖子{post_idx + 1} 第{comment_idx + 1}条")
-
         self.log(f"📊 数据完整性报告:")
         self.log(f"  JSON文件总评论数: {total_comments_count} 条")
-        self.log(f"  非空评论数: {len(all_comments)} 条")
-        self.log(f"  空评论数: {total_comments_count - len(all_comments)} 条")
+        self.log(f"  非空评论数: {valid_comments_count} 条")
+        self.log(f"  空评论数: {total_comments_count - valid_comments_count} 条")
 
-        if total_comments_count != len(all_comments):
-            self.log(f"  ⚠️ 警告: 有 {total_comments_count - len(all_comments)} 条空评论被跳过")
+        if total_comments_count != valid_comments_count:
+            self.log(f"  ⚠️ 警告: 有 {total_comments_count - valid_comments_count} 条空评论被跳过")
 
-        if not all_comments:
+        if not valid_comments_count:
             messagebox.showinfo("提示", "没有找到可分析的评论")
             return
 
         # 更新AI分析器配置
         self.update_ai_analyzer_config()
+        self.ai_analyzer.lexicon = lexicon
+        self.ai_analyzer.set_cache(folder / LABEL_CACHE_FILE)
+        dedup = self.get_dedup_index()
+        use_store = self.store_var.get()
 
         # 显示进度对话框
         progress_window = tk.Toplevel(self.root)
@@ -917,7 +4541,7 @@ class XHSScraperGUI:
         progress_var = tk.DoubleVar()
         progress_bar = ttk.Progressbar(progress_window, variable=progress_var, maximum=100)
         progress_bar.pack(fill=tk.X, padx=20, pady=5)
-        status_label = ttk.Label(progress_window, text=f"准备开始... 共 {len(all_comments)} 条评论")
+        status_label = ttk.Label(progress_window, text=f"准备开始... 共 {valid_comments_count} 条评论")
         status_label.pack()
 
         # 添加详细统计标签
@@ -927,155 +4551,61 @@ class XHSScraperGUI:
         # 创建停止标志
         stop_analysis = threading.Event()
 
+        def update_progress_ui(batch_num, processed):
+            progress_var.set((processed / valid_comments_count) * 100)
+            status_label.config(text=f"处理中: 已完成 {batch_num} 批次")
+            stats_label.config(text=f"已处理: {processed}/{valid_comments_count} 条评论")
+
         def analyze_in_thread():
+            store = None
             try:
-                # 使用AI分析 - 修复：更稳健的分批处理
-                self.log(f"开始AI情绪分析，共 {len(all_comments)} 条评论")
-                sentiments = []
-                processed_count = 0
-                batch_size = 15  # 减小批次大小提高稳定性
-
-                total_batches = (len(all_comments) + batch_size - 1) // batch_size
-
-                def update_progress_ui(batch_num, processed, total_batches, total_comments):
-                    progress = (processed / total_comments) * 100
-                    progress_var.set(progress)
-                    status_label.config(text=f"处理中: {batch_num}/{total_batches} 批次")
-                    stats_label.config(text=f"已处理: {processed}/{total_comments} 条评论")
-                    progress_window.update()
-
-                # 分批处理并更新进度
-                for batch_idx in range(0, len(all_comments), batch_size):
-                    if stop_analysis.is_set():  # 检查是否停止
-                        self.log("AI分析被用户停止")
-                        break
-
-                    batch_end = min(batch_idx + batch_size, len(all_comments))
-                    batch = all_comments[batch_idx:batch_end]
-                    current_batch = (batch_idx // batch_size) + 1
-
-                    # 在UI线程中更新进度
-                    self.root.after(0, lambda: update_progress_ui(
-                        current_batch, processed_count, total_batches, len(all_comments)
-                    ))
-
-                    try:
-                        self.log(f"分析批次 {current_batch}/{total_batches}，包含 {len(batch)} 条评论")
-                        batch_results = self.ai_analyzer.analyze_comments_batch(batch)
-
-                        # 验证返回结果数量
-                        if len(batch_results) == len(batch):
-                            sentiments.extend(batch_results)
-                            processed_count += len(batch)
-                            self.log(f"✅ 批次 {current_batch}/{total_batches} 分析完成")
-                        else:
-                            self.log(f"⚠️ 批次 {current_batch} 返回结果数量不匹配，使用后备方案")
-                            # 使用后备方案处理这个批次
-                            fallback_results = [self.ai_analyzer._fallback_analyze(comment) for comment in batch]
-                            sentiments.extend(fallback_results)
-                            processed_count += len(batch)
-
-                    except Exception as e:
-                        self.log(f"❌ 批次 {current_batch} 分析失败: {str(e)}，使用后备方案")
-                        # 失败时使用规则匹配
-                        fallback_results = [self.ai_analyzer._fallback_analyze(comment) for comment in batch]
-                        sentiments.extend(fallback_results)
-                        processed_count += len(batch)
-
-                    # 短暂暂停，避免API限制
-                    if current_batch % 5 == 0:
-                        time.sleep(1)
-
-                # 最终验证
-                self.log(f"分析完成: 期望 {len(all_comments)} 条，实际 {len(sentiments)} 条")
-
-                # 如果数量不匹配，使用规则匹配补充
-                if len(sentiments) < len(all_comments):
-                    self.log(f"⚠️ 结果数量不足，使用规则匹配补充 {len(all_comments) - len(sentiments)} 条")
-                    for i in range(len(sentiments), len(all_comments)):
-                        sentiments.append(self.ai_analyzer._fallback_analyze(all_comments[i]))
-
-                # 创建结果DataFrame - 修复：确保数据完整
-                result_data = []
-                for i, info in enumerate(post_info):
-                    if i < len(sentiments):
-                        result_data.append({
-                            "标题": info["标题"],
-                            "作者": info["作者"],
-                            "点赞数": info["点赞数"],
-                            "收藏数": info["收藏数"],
-                            "评论内容": info["评论内容"],
-                            "clean": clean(info["评论内容"]),
-                            "score": score_sent(info["评论内容"]),
-                            "sentiment": sentiments[i],
-                            "分析方法": "AI分析(GLMs)"
-                        })
-                    else:
-                        # 如果超出sentiments范围，使用规则匹配
-                        fallback_sentiment = self.ai_analyzer._fallback_analyze(info["评论内容"])
-                        result_data.append({
-                            "标题": info["标题"],
-                            "作者": info["作者"],
-                            "点赞数": info["点赞数"],
-                            "收藏数": info["收藏数"],
-                            "评论内容": info["评论内容"],
-                            "clean": clean(info["评论内容"]),
-                            "score": score_sent(info["评论内容"]),
-                            "sentiment": fallback_sentiment,
-                            "分析方法": "规则匹配(后备)"
-                        })
-
-                df = pd.DataFrame(result_data)
-
-                # 验证最终数据完整性
-                if len(df) != len(post_info):
-                    self.log(f"❌ 严重错误: 最终DataFrame行数 {len(df)} 不等于原始评论数 {len(post_info)}")
-                    # 尝试重新构建确保完整性
-                    result_data = []
-                    for i, info in enumerate(post_info):
-                        sentiment = sentiments[i] if i < len(sentiments) else self.ai_analyzer._fallback_analyze(
-                            info["评论内容"])
-                        result_data.append({
-                            "标题": info["标题"],
-                            "作者": info["作者"],
-                            "点赞数": info["点赞数"],
-                            "收藏数": info["收藏数"],
-                            "评论内容": info["评论内容"],
-                            "clean": clean(info["评论内容"]),
-                            "score": score_sent(info["评论内容"]),
-                            "sentiment": sentiment,
-                            "分析方法": "AI分析(GLMs)" if i < len(sentiments) else "规则匹配(后备)"
-                        })
-                    df = pd.DataFrame(result_data)
-
-                # 保存CSV文件
-                df.to_csv(csv_file, index=False, encoding='utf-8-sig')
-
-                # 最终统计 - 修复统计逻辑
-                ai_processed_count = len([s for s in sentiments if s in ["正向", "负向", "中性"]])
-                fallback_count = len([d for d in result_data if d.get("分析方法") == "规则匹配(后备)"])
-
-                progress_window.destroy()
+                if use_store:
+                    # AI标签按笔记位置写入结果库，结果文件尚未导入时先导入
+                    store = ResultStore(folder / RESULT_DB_FILE)
+                    imported = store.import_result_file(latest_json, lexicon)
+                    if imported:
+                        self.log(f"已导入结果库：{latest_json.name}，{imported} 条笔记")
+                self.log(f"开始AI情绪分析，共 {valid_comments_count} 条评论")
+                stats = write_ai_sentiment_csv(
+                    latest_json, csv_file, self.ai_analyzer, lexicon,
+                    progress=lambda processed, batch_num: self.ui.publish(
+                        "ai_progress", update_progress_ui, batch_num, processed),
+                    stop_event=stop_analysis, columnar=columnar, triage_threshold=triage_threshold, dedup=dedup,
+                    store=store)
+                self.log_spam_clusters(dedup)
+                if store:
+                    self.log(f"AI标签已写入结果库: {store.path}")
+
+                self.log(f"分析完成: 期望 {valid_comments_count} 条，实际 {stats['total']} 条")
+                self.ui.call(progress_window.destroy)
                 self.log(f"✅ AI情绪CSV已生成 → {csv_file}")
-                self.log(f"📊 分析统计: 总共分析 {len(df)} 条评论")
-                self.log(f"  - AI分析: {ai_processed_count} 条")
-                self.log(f"  - 后备方案: {fallback_count} 条")
-
-                self.root.after(0, lambda: messagebox.showinfo("完成",
-                                                               f"AI情绪分析完成！\n"
-                                                               f"成功分析 {len(df)} 条评论\n"
-                                                               f"AI分析: {ai_processed_count} 条\n"
-                                                               f"后备方案: {fallback_count} 条\n"
-                                                               f"文件: {csv_file}"))
-                self.root.after(0, lambda: os.startfile(csv_file))
+                self.log(f"📊 分析统计: 总共分析 {stats['total']} 条评论")
+                self.log(f"  - AI分析: {stats['ai']} 条")
+                self.log(f"  - 缓存命中: {stats['cached']} 条")
+                self.log(f"  - 规则高置信: {stats['local']} 条")
+                self.log(f"  - 疑似刷屏: {stats['spam']} 条")
+                self.log(f"  - 后备方案: {stats['fallback']} 条")
+
+                self.ui.call(messagebox.showinfo, "完成",
+                             f"AI情绪分析完成！\n"
+                             f"成功分析 {stats['total']} 条评论\n"
+                             f"AI分析: {stats['ai']} 条\n"
+                             f"缓存命中: {stats['cached']} 条\n"
+                             f"规则高置信: {stats['local']} 条\n"
+                             f"疑似刷屏: {stats['spam']} 条\n"
+                             f"后备方案: {stats['fallback']} 条\n"
+                             f"文件: {csv_file}")
+                self.ui.call(os.startfile, csv_file)
 
             except Exception as e:
-                progress_window.destroy()
+                self.ui.call(progress_window.destroy)
                 error_msg = f"AI分析失败：{str(e)}"
-                self.root.after(0, lambda: messagebox.showerror("错误", error_msg))
+                self.ui.call(messagebox.showerror, "错误", error_msg)
                 self.log(f"❌ AI分析失败: {str(e)}")
-                import traceback
                 self.log(f"详细错误: {traceback.format_exc()}")
+            finally:
+                if store:
+                    store.close()
 
         # 添加停止按钮
         stop_button = ttk.Button(progress_window, text="停止分析",
@@ -1107,6 +4637,18 @@ class XHSScraperGUI:
             messagebox.showerror("错误", "浏览器引擎未就绪");
             return
 
+        self.pipeline_options = self.get_pipeline_options(kw, save_path)
+        if self.pipeline_options is False:
+            return
+        self.store_enabled = self.store_var.get()
+        self.archive_suffix = self.get_archive_format()
+        if self.archive_suffix is False:
+            return
+        self.terms_enabled = self.terms_var.get()
+        self.diagnostics_enabled = self.diagnostics_var.get()
+        if self.store_enabled or self.terms_enabled:
+            LEXICONS.set_root(save_path / LEXICON_DIR_NAME)
+
         self.collected_count = self.success_count = self.failed_count = 0
         self.update_stats()
         self.is_running = True
@@ -1121,6 +4663,43 @@ class XHSScraperGUI:
         self.current_task = threading.Thread(target=self.run_scraper, args=(kw, max_cards, save_path), daemon=True)
         self.current_task.start()
 
+    def get_pipeline_options(self, keyword, save_path):
+        """读取“采集时同步分析”设置，返回 SentimentPipeline 参数；不分析时返回 None，配置有误返回 False"""
+        modes = PIPELINE_MODES.get(self.pipeline_mode_var.get(), ())
+        if not modes:
+            return None
+        columnar = self.get_columnar_format()
+        if columnar is False:
+            return False
+        LEXICONS.set_root(save_path / LEXICON_DIR_NAME)
+        options = {"modes": modes, "lexicon": LEXICONS.get(keyword), "columnar": columnar,
+                   "dedup": self.get_dedup_index()}
+        if "ai" in modes and ANALYSIS_MODES.get(self.analysis_mode_var.get()) == "local":
+            # 本地模型模式：同步分析的AI环节改用本地模型，不需要API密钥
+            model_path = save_path / LOCAL_MODEL_FILE
+            if not model_path.exists():
+                messagebox.showerror("错误", "未找到本地模型，请先点击“训练本地模型”或切换分析模式")
+                return False
+            try:
+                options["model"] = LocalSentimentModel.load(model_path)
+            except (OSError, ValueError, KeyError) as e:
+                messagebox.showerror("错误", f"本地模型加载失败：{e}")
+                return False
+        elif "ai" in modes:
+            if not self.api_key_var.get():
+                messagebox.showerror("错误", "同步AI分析需要先配置API密钥")
+                return False
+            self.update_ai_analyzer_config()
+            self.ai_analyzer.lexicon = options["lexicon"]
+            self.ai_analyzer.set_cache(save_path / LABEL_CACHE_FILE)
+            options["analyzer"] = self.ai_analyzer
+            if ANALYSIS_MODES.get(self.analysis_mode_var.get()) == "hybrid":
+                try:
+                    options["triage_threshold"] = min(1.0, max(0.0, float(self.hybrid_threshold_var.get())))
+                except ValueError:
+                    options["triage_threshold"] = HYBRID_CONFIDENCE
+        return options
+
     def stop_scraping(self):
         if self.is_running:
             self.is_running = False
@@ -1128,15 +4707,22 @@ class XHSScraperGUI:
             self.status_var.set("🟠 正在停止...")
 
     def run_scraper(self, keyword, max_cards, save_path):
+        monitor = None
         try:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
+            if self.diagnostics_enabled:
+                path = save_path / DIAG_DIR_NAME / f"{keyword}_{datetime.now():%Y%m%d_%H%M%S}_stalls.jsonl"
+                monitor = LoopStallMonitor(loop, path)
+                self.log(f"🩺 诊断模式已开启：慢回调阈值 {SLOW_CALLBACK_S}s，记录写入 {path}")
             loop.run_until_complete(self.async_main(keyword, max_cards, save_path))
         except Exception as e:
             self.log(f"采集过程中发生错误: {e}", logging.ERROR)
-            self.root.after(0, lambda: messagebox.showerror("错误", str(e)))
+            self.ui.call(messagebox.showerror, "错误", str(e))
         finally:
-            self.root.after(0, self.on_scraping_finished)
+            if monitor:
+                self.log(monitor.close())
+            self.ui.call(self.on_scraping_finished)
 
     async def async_main(self, keyword, max_cards, save_path):
         self.scraper_instance = XHSScraper(keyword, max_cards, save_path, self)
@@ -1170,7 +4756,20 @@ class XHSScraper:
         if self.SAVE_FILE.read_text(encoding='utf8').strip() == '':
             self.SAVE_FILE.write_text('[]', encoding='utf8')
 
-        self.TEMP_RESULTS = []
+        self.pipeline = None  # 采集时同步情绪分析，run() 中按界面设置创建
+        self.run_stats = RunStats(self.SAVE_FILE)
+        self.catalog = RunCatalog(self.SAVE_DIR)
+        self.catalog.update(self.SAVE_FILE.stem, keyword=keyword, file=self.SAVE_FILE.name,
+                            started_at=self.run_stats.started_at, finished_at=self.run_stats.updated_at,
+                            status="running", totals=self.run_stats.counts, pid=os.getpid(), host=platform.node())
+        self.store = None
+        if getattr(gui, "store_enabled", False):
+            self.store = ResultStore(self.SAVE_DIR / RESULT_DB_FILE)
+            self.store.begin_run(self.SAVE_FILE.stem, keyword)
+        self.terms = None
+        if getattr(gui, "terms_enabled", False):
+            self.terms = TermStats(self.SAVE_DIR / TERM_DB_FILE)
+            self.terms.begin_run(self.SAVE_FILE.stem, keyword)
         self.SEEN = set()
         self.load_seen()
 
@@ -1486,18 +5085,32 @@ class XHSScraper:
 
                     info = await self.get_comments(page)
 
-                    # ======== 实时写入 ========
-                    try:
-                        with self.SAVE_FILE.open('r', encoding='utf8') as f:
-                            arr = json.load(f)
-                    except (json.JSONDecodeError, ValueError):
-                        arr = []
-                    arr.append(info)
-                    with self.SAVE_FILE.open('w', encoding='utf8') as f:
-                        json.dump(arr, f, ensure_ascii=False, indent=2)
+                    # ======== 实时写入（追加到数组末尾） ========
+                    append_result(self.SAVE_FILE, info)
                     # ======== 写入完成 ========
-
-                    self.TEMP_RESULTS.append(info)  # 原统计用
+                    self.run_stats.add_note(info)
+                    if self.run_stats.counts["notes"] % RUN_STATS_SAVE_EVERY == 0:
+                        await asyncio.to_thread(self.run_stats.save)
+                    store_note_id = None
+                    if self.store:
+                        try:
+                            store_note_id = await asyncio.to_thread(
+                                self.store.add_note, self.SAVE_FILE.stem, self.KEYWORD,
+                                self.run_stats.counts["notes"] - 1, info, LEXICONS.get(self.KEYWORD))
+                        except sqlite3.Error as e:
+                            self.log(f">>> 写入结果库失败: {e}")
+
+                    if self.terms:
+                        try:
+                            await asyncio.to_thread(self.terms.add_note, self.SAVE_FILE.stem, self.KEYWORD, info,
+                                                    LEXICONS.get(self.KEYWORD))
+                        except sqlite3.Error as e:
+                            self.log(f">>> 更新热词统计失败: {e}")
+                    if self.pipeline and self.pipeline.error is None:
+                        try:
+                            await asyncio.to_thread(self.pipeline.submit, info, store_note_id)
+                        except PipelineError as e:
+                            self.log(f"❌ {e}，继续采集，之后的笔记不再同步分析")
                     success += 1
                     self.gui.success_count = success
                     self.log(f"[{success}/{max_cards}] ✅ 成功采集笔记: {note_id}，评论数: {len(info['评论'])}")
@@ -1568,23 +5181,56 @@ class XHSScraper:
                 Object.defineProperty(navigator, 'webdriver', {{ get: () => undefined }});
             """)
             page = await context.new_page()
+            status = "interrupted"
             try:
                 await self.ensure_login(page)
                 await self.do_search(page)
                 self.log(f">>> 开始采集，目标数量: {self.MAX_CARDS}")
+                options = getattr(self.gui, "pipeline_options", None)
+                if options:
+                    self.pipeline = SentimentPipeline(self.SAVE_FILE, store=self.store, **options)
+                    self.log(f">>> 已开启采集时同步情绪分析: {'+'.join(self.pipeline.modes)}")
                 success, failed = await self.get_note_cards(page, max_cards=self.MAX_CARDS)
                 self.log(">>> 采集完成，正在保存数据...")
                 self.log(f">>> 统计: 成功 {success} 条, 失败 {failed} 条")
                 self.log(f">>> 实时保存路径: {self.SAVE_FILE}")
+                status = "complete"
             except Exception as e:
                 self.log(f"❌ 采集过程中发生错误: {str(e)}", logging.ERROR)
             finally:
                 self.log(">>> 关闭浏览器...")
                 await browser.close()
+                if self.pipeline:
+                    self.log(">>> 等待同步情绪分析处理剩余笔记...")
+                    try:
+                        stats = await asyncio.to_thread(self.pipeline.close)
+                        self.log(f">>> 同步情绪分析完成: {stats['notes']} 条笔记，规则 {stats['rule']} 条，"
+                                 f"AI {stats['ai']} 条，缓存 {stats['cached']} 条，规则高置信 {stats['local']} 条，"
+                                 f"疑似刷屏 {stats['spam']} 条，本地模型 {stats['model']} 条，后备 {stats['fallback']} 条")
+                    except PipelineError as e:
+                        self.log(f"❌ {e}")
+                await asyncio.to_thread(self.run_stats.save)
+                await asyncio.to_thread(self.catalog.update, self.SAVE_FILE.stem, status=status,
+                                        finished_at=self.run_stats.updated_at, totals=self.run_stats.counts)
+                if self.store:
+                    await asyncio.to_thread(self.store.finish_run, self.SAVE_FILE.stem)
+                    self.store.close()
+                    self.log(f">>> 已写入结果库: {self.store.path}")
+                if self.terms:
+                    try:
+                        await asyncio.to_thread(self.terms.close)
+                        self.log(f">>> 热词统计已更新: {self.terms.path}")
+                    except Exception as e:
+                        self.log(f">>> 热词统计收尾失败: {e}")
+                suffix = getattr(self.gui, "archive_suffix", None)
+                if suffix:
+                    self.log(">>> 后台压缩已结束的批次...")
+                    self.gui.start_archive(self.SAVE_DIR, suffix)
 
 
 # -------------------- 入口 --------------------
 def main():
+    multiprocessing.freeze_support()  # 热词分词使用进程池，打包为 exe 后子进程需要
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
     root = tk.Tk()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批次目录查看工具：读取保存路径下的 runs_catalog.json，列出历次采集的状态、起止时间和统计
+程序崩溃后遗留的“采集中”批次在读取时会被标记为 failed（异常退出）
+
+用法：
+    python xhs_runs.py D:/xhs_data                      # 列出全部批次（从新到旧）
+    python xhs_runs.py D:/xhs_data --keyword 手机        # 只看某个关键词
+    python xhs_runs.py D:/xhs_data --status failed      # 只看异常退出的批次
+    python xhs_runs.py D:/xhs_data --json               # 输出 JSON，便于脚本处理
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import xhs_gui_final as xhs
+
+STATUS_NAMES = {"running": "采集中", "complete": "已完成", "interrupted": "已中断", "failed": "异常退出"}
+
+
+def display_width(text):
+    """终端显示宽度，中日韩字符占两格"""
+    return sum(2 if ord(ch) > 0x2e80 else 1 for ch in text)
+
+
+def format_table(runs):
+    header = ["批次", "关键词", "状态", "开始时间", "结束时间", "笔记", "评论", "结果文件"]
+    rows = [header]
+    for r in runs:
+        totals = r.get("totals") or {}
+        rows.append([r.get("run_id", ""), r.get("keyword", ""), STATUS_NAMES.get(r.get("status"), r.get("status", "")),
+                     r.get("started_at", ""), r.get("finished_at", ""), str(totals.get("notes", "?")),
+                     str(totals.get("comments", "?")), r.get("file", "")])
+    width = [max(display_width(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell + " " * (w - display_width(cell)) for cell, w in zip(row, width)).rstrip()
+                     for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看采集批次目录")
+    parser.add_argument("folder", type=Path, help="采集结果保存路径（runs_catalog.json 所在目录）")
+    parser.add_argument("--keyword", help="只列出该关键词的批次")
+    parser.add_argument("--status", choices=sorted(STATUS_NAMES), help="只列出该状态的批次")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args(argv)
+
+    if not args.folder.is_dir():
+        print(f"目录不存在: {args.folder}", file=sys.stderr)
+        return 2
+    runs = xhs.RunCatalog(args.folder).runs()
+    runs = [r for r in runs if (args.keyword is None or r.get("keyword") == args.keyword)
+            and (args.status is None or r.get("status") == args.status)]
+    if args.json:
+        print(json.dumps(runs, ensure_ascii=False, indent=2))
+    elif runs:
+        print(format_table(runs))
+    else:
+        print("没有符合条件的批次")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())